@@ -0,0 +1,278 @@
+"""Process-local cache of fixed size blocks of binaries, for paging through ranges of a binary."""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import AsyncIterable, AsyncIterator
+
+import cachetools
+from azul_bedrock import dispatcher as b_dispatcher
+from azul_bedrock import exceptions_bedrock
+from azul_bedrock.exception_enums import ExceptionCodeEnum
+from prometheus_client import Counter
+from starlette.status import HTTP_416_RANGE_NOT_SATISFIABLE
+
+from azul_metastore import settings
+from azul_metastore.common import memcache
+
+logger = logging.getLogger(__name__)
+
+prom_block_cache = Counter("azul_binary_block_cache", "Reads of binary blocks from the block cache", ["result"])
+
+# reads spanning more blocks than this skip the cache, so a single large read doesn't flush it
+MAX_CACHED_READ_BLOCKS = 16
+
+# cached data for a block and the total size of the binary, if known
+Block = tuple[bytes, int | None]
+
+# errors dispatcher raises for reads that start past the end of a binary
+OUT_OF_RANGE_ERRORS = {ExceptionCodeEnum.DPGetBinaryOffsetTooLarge, ExceptionCodeEnum.DPGetBinaryAsyncOffsetTooLarge}
+
+
+def _out_of_range(e: exceptions_bedrock.DispatcherApiException) -> bool:
+    """Return true if dispatcher failed a read because it started past the end of the binary."""
+    return e.detail["internal"] in OUT_OF_RANGE_ERRORS or e.status_code == HTTP_416_RANGE_NOT_SATISFIABLE
+
+
+class BlockCache:
+    """Serve range reads of binaries from cached blocks, fetching missing blocks from dispatcher.
+
+    Binaries are immutable, so blocks are keyed by (sha256, block index) and never need to be invalidated.
+    Access to the binary must be checked before reading from the cache.
+
+    After each read the block following the range is fetched in the background, as most reads are from
+    users paging forward through a binary.
+    """
+
+    def __init__(self, blocks: cachetools.LRUCache, block_size: int):
+        self._blocks = blocks
+        self._block_size = block_size
+        # blocks being prefetched
+        self._inflight: dict[tuple[str, int], concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._prefetcher = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="block-prefetch")
+        self.stats = {"hit": 0, "miss": 0, "prefetch": 0}
+
+    def _record(self, result: str):
+        """Record the result of a block lookup."""
+        self.stats[result] += 1
+        prom_block_cache.labels(result=result).inc()
+
+    def _store(self, key: tuple[str, int], value: Block):
+        """Cache a block and mark it as no longer being fetched."""
+        with self._lock:
+            self._blocks[key] = value
+            self._inflight.pop(key, None)
+
+    def _end_of_binary(self, sha256: str, index: int) -> int:
+        """Cache an empty block for a block that starts at the end of the binary, returning the binary size.
+
+        Blocks read by async_read don't have the size of the binary, so when a binary is an exact multiple of
+        the block size its end is only found by reading the following block.
+        """
+        total = index * self._block_size
+        self._store((sha256.lower(), index), (b"", total))
+        return total
+
+    def cacheable(self, start: int, end: int | None) -> bool:
+        """Return true if the range should be read through the cache."""
+        if end is None or end < start:
+            return False
+        return end // self._block_size - start // self._block_size < MAX_CACHED_READ_BLOCKS
+
+    def _lookup(self, sha256: str, index: int) -> tuple[Block | None, concurrent.futures.Future | None]:
+        """Return the cached block or the future of the block being prefetched."""
+        key = (sha256.lower(), index)
+        with self._lock:
+            return self._blocks.get(key), self._inflight.get(key)
+
+    def _fetch_block(
+        self, dispatcher: b_dispatcher.DispatcherAPI, source: str, label: str, sha256: str, index: int
+    ) -> Block:
+        """Read a block from dispatcher."""
+        start = index * self._block_size
+        rsp = dispatcher.get_binary(
+            source=source, label=label, sha256=sha256, start_pos=start, end_pos=start + self._block_size - 1
+        )
+        return rsp.content, int(rsp.headers["Content-Range"].split("/")[-1], 10)
+
+    @staticmethod
+    def _prefetched_value(future: concurrent.futures.Future) -> Block | None:
+        """Wait for a block being prefetched, returning None if it failed so it can be read again."""
+        try:
+            return future.result()
+        except Exception:
+            # logged by _prefetched
+            return None
+
+    def _get_block(
+        self, dispatcher: b_dispatcher.DispatcherAPI, source: str, label: str, sha256: str, index: int
+    ) -> Block:
+        """Return a block from the cache, or read it from dispatcher."""
+        value, future = self._lookup(sha256, index)
+        if value is not None:
+            self._record("hit")
+            return value
+        if future is not None and (value := self._prefetched_value(future)) is not None:
+            self._record("hit")
+            return value
+        self._record("miss")
+        value = self._fetch_block(dispatcher, source, label, sha256, index)
+        self._store((sha256.lower(), index), value)
+        return value
+
+    async def _async_get_block(
+        self, dispatcher: b_dispatcher.DispatcherAPI, source: str, label: str, sha256: str, index: int
+    ) -> Block:
+        """Return a block from the cache, or read it from dispatcher without blocking the event loop."""
+        value, future = self._lookup(sha256, index)
+        if value is not None:
+            self._record("hit")
+            return value
+        if future is not None:
+            await asyncio.wait([asyncio.wrap_future(future)])
+            if (value := self._prefetched_value(future)) is not None:
+                self._record("hit")
+                return value
+        self._record("miss")
+        start = index * self._block_size
+        content = await dispatcher.async_get_binary(source, label, sha256, start, start + self._block_size - 1)
+        block = b"".join([chunk async for chunk in content])
+        # total size is only known once the end of the binary has been read
+        value = (block, start + len(block) if len(block) < self._block_size else None)
+        self._store((sha256.lower(), index), value)
+        return value
+
+    def _prefetch(
+        self,
+        dispatcher: b_dispatcher.DispatcherAPI,
+        source: str,
+        label: str,
+        sha256: str,
+        index: int,
+        total: int | None,
+    ):
+        """Start reading a block in the background, if it is in the binary and not already cached."""
+        if total is not None and index * self._block_size >= total:
+            return
+        key = (sha256.lower(), index)
+        with self._lock:
+            if key in self._blocks or key in self._inflight:
+                return
+            future = self._prefetcher.submit(self._fetch_block, dispatcher, source, label, sha256, index)
+            self._inflight[key] = future
+        future.add_done_callback(lambda f: self._prefetched(key, f))
+
+    def _prefetched(self, key: tuple[str, int], future: concurrent.futures.Future):
+        """Cache a prefetched block."""
+        try:
+            value = future.result()
+        except Exception as e:
+            logger.debug(f"failed to prefetch block {key[1]} of {key[0]}: {e}")
+            with self._lock:
+                self._inflight.pop(key, None)
+            return
+        self._record("prefetch")
+        self._store(key, value)
+
+    def read(
+        self, dispatcher: b_dispatcher.DispatcherAPI, source: str, label: str, sha256: str, start: int, end: int
+    ) -> tuple[bytes, int]:
+        """Return bytes start to end (inclusive) of a binary and the total size of the binary.
+
+        Ranges that start past the end of the binary are passed to dispatcher, so it raises the same errors.
+        """
+        first = start // self._block_size
+        blocks = []
+        total = None
+        for index in range(first, end // self._block_size + 1):
+            if total is not None and index * self._block_size >= total:
+                break
+            try:
+                block, block_total = self._get_block(dispatcher, source, label, sha256, index)
+            except exceptions_bedrock.DispatcherApiException as e:
+                if index == first or not _out_of_range(e):
+                    raise
+                total = self._end_of_binary(sha256, index)
+                break
+            total = block_total if block_total is not None else total
+            blocks.append(block)
+            if len(block) < self._block_size:
+                break
+        if start - first * self._block_size >= len(blocks[0]):
+            rsp = dispatcher.get_binary(source=source, label=label, sha256=sha256, start_pos=start, end_pos=end)
+            return rsp.content, int(rsp.headers["Content-Range"].split("/")[-1], 10)
+        if total is None:
+            # blocks read by async_read don't have the size of the binary
+            self._record("miss")
+            block, total = self._fetch_block(dispatcher, source, label, sha256, index)
+            self._store((sha256.lower(), index), (block, total))
+
+        self._prefetch(dispatcher, source, label, sha256, end // self._block_size + 1, total)
+        offset = first * self._block_size
+        return b"".join(blocks)[start - offset : end - offset + 1], total
+
+    async def async_read(
+        self, dispatcher: b_dispatcher.DispatcherAPI, source: str, label: str, sha256: str, start: int, end: int
+    ) -> AsyncIterator[bytes]:
+        """Yield bytes start to end (inclusive) of a binary.
+
+        Ranges that start past the end of the binary are passed to dispatcher, so it raises the same errors.
+        """
+        first = start // self._block_size
+        total = None
+        for index in range(first, end // self._block_size + 1):
+            offset = index * self._block_size
+            if total is not None and offset >= total:
+                return
+            try:
+                block, block_total = await self._async_get_block(dispatcher, source, label, sha256, index)
+            except exceptions_bedrock.DispatcherApiException as e:
+                if index == first or not _out_of_range(e):
+                    raise
+                self._end_of_binary(sha256, index)
+                return
+            total = block_total if block_total is not None else total
+            if index == first and start - offset >= len(block):
+                async for chunk in await dispatcher.async_get_binary(source, label, sha256, start, end):
+                    yield chunk
+                return
+            yield block[max(start - offset, 0) : end - offset + 1]
+            if len(block) < self._block_size:
+                return
+
+        self._prefetch(dispatcher, source, label, sha256, end // self._block_size + 1, total)
+
+
+_block_cache: BlockCache | None = None
+_block_cache_lock = threading.Lock()
+
+
+def get() -> BlockCache | None:
+    """Return the block cache for this process, or None if it is disabled."""
+    global _block_cache
+    s = settings.get()
+    if s.binary_block_cache_count <= 0:
+        return None
+    with _block_cache_lock:
+        if _block_cache is None:
+            _block_cache = BlockCache(
+                memcache.get_lru_cache("binary_blocks", maxsize=s.binary_block_cache_count), s.binary_block_size
+            )
+    return _block_cache
+
+
+async def async_get_binary(
+    dispatcher: b_dispatcher.DispatcherAPI,
+    source: str,
+    label: str,
+    sha256: str,
+    start: int = 0,
+    end: int | None = None,
+) -> AsyncIterable[bytes]:
+    """Return a range of a binary like dispatcher.async_get_binary, reading through the block cache if possible."""
+    cache = get()
+    if cache is None or not cache.cacheable(start, end):
+        return await dispatcher.async_get_binary(source, label, sha256, start, end)
+    return cache.async_read(dispatcher, source, label, sha256, start, end)
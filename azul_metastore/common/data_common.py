@@ -1,8 +1,8 @@
 """Common functions for datastream manipulation."""
 
-from typing import AsyncIterable
+from typing import AsyncIterable, AsyncIterator
 
-DEFAULT_STRING_BUFFER_SIZE = 500 * 1024 * 1024  # 500Kb
+DEFAULT_STRING_BUFFER_SIZE = 500 * 1024  # 500Kb
 
 
 async def read_from_async_iterable(data_stream: AsyncIterable[bytes], bytes_to_read: int) -> tuple[bytes, bool]:
@@ -20,6 +20,21 @@ async def read_from_async_iterable(data_stream: AsyncIterable[bytes], bytes_to_r
     return read_bytes, is_end_of_file
 
 
+async def read_fixed_chunks(data_stream: AsyncIterable[bytes], chunk_size: int) -> AsyncIterator[tuple[bytes, bool]]:
+    """Yield chunks of exactly chunk_size bytes, whatever size the stream yields, and if it is the last chunk.
+
+    At most one chunk and one item of the stream are buffered. The last chunk may be shorter, or empty if the stream is.
+    """
+    buffer = bytearray()
+    async for data in data_stream:
+        buffer += data
+        # only yield full chunks once more data is known to follow them
+        while len(buffer) > chunk_size:
+            yield bytes(buffer[:chunk_size]), False
+            del buffer[:chunk_size]
+    yield bytes(buffer), True
+
+
 def basename(filepath: str) -> str:
     """Return base filename catering for mulitple platforms.
 
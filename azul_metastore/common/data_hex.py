@@ -1,7 +1,8 @@
 """Datastram manipulation involving hex."""
 
+import bisect
 import logging
-from typing import AsyncIterable, ByteString
+from typing import AsyncIterable, ByteString, Iterable
 
 from azul_bedrock.exception_enums import ExceptionCodeEnum
 from azul_bedrock.exceptions_bedrock import BaseAzulException
@@ -38,7 +39,6 @@ async def get_hex_hits(
     end_of_file = False
     last_chunk_fragment = b""
     length_of_file = 0
-    last_chunk_offset = offset
     # Times by 2 to avoid finding a half result
     last_chunk_length = len(pattern) * 2
 
@@ -46,6 +46,7 @@ async def get_hex_hits(
         cur_chunk, end_of_file = await data_common.read_from_async_iterable(data_stream, buffer_size)
         length_of_file += len(cur_chunk)
         window = last_chunk_fragment + cur_chunk
+        last_chunk_offset = offset + length_of_file - len(window)
 
         starting_index = 0
         while True:
@@ -78,11 +79,82 @@ async def get_hex_hits(
         # Take as little of the last chunk as possible to avoid missing something between the chunks
         # Multiple last
         last_chunk_fragment = cur_chunk[-last_chunk_length * 2 :]
-        last_chunk_offset += len(cur_chunk) - len(last_chunk_fragment)
 
     return hits, length_of_file, not end_of_file
 
 
+async def get_multi_hex_hits(
+    data_stream: AsyncIterable[bytes],
+    offset: int,
+    max_results: int,
+    patterns: Iterable[ByteString],
+    buffer_size: int = data_common.DEFAULT_STRING_BUFFER_SIZE,
+) -> tuple[dict[bytes, list[int]], int, bool]:
+    """Return the offsets of hits for each of the patterns, reading the data stream once.
+
+    Each chunk is searched for every pattern before the next chunk is read. The end of the previous chunk is kept,
+    one byte shorter than the longest pattern, so hits spanning chunks are found and hits inside it are not repeated.
+
+    Stops once max_results hits are found across all patterns, keeping the hits with the lowest offsets.
+    Hits at the same offset are not split, so more than max_results are returned if they all start at one offset.
+    Hits starting in the kept end of a chunk are held back until the next chunk is read, as a longer pattern
+    starting before them may end in it.
+    also returns the bytes of the file covered by the hits, so a search continuing from offset plus that length
+    finds the hits that were not returned, and a boolean that is true if there is more file content to search.
+    """
+    if max_results <= 0:
+        raise BaseAzulException(
+            internal=ExceptionCodeEnum.MetastoreInvalidGetHexQuantity,
+        )
+    hits: dict[bytes, list[int]] = {bytes(pattern): [] for pattern in patterns if pattern}
+    if not hits:
+        return hits, 0, True
+    tail_length = max(len(pattern) for pattern in hits) - 1
+
+    total_hits = 0
+    end_of_file = False
+    length_of_file = 0
+    tail = b""
+    # hits found but not yet returned, as (offset, pattern)
+    pending: list[tuple[int, bytes]] = []
+    while not end_of_file:
+        cur_chunk, end_of_file = await data_common.read_from_async_iterable(data_stream, buffer_size)
+        length_of_file += len(cur_chunk)
+        window = tail + cur_chunk
+        # offset of the start of the window in the file
+        window_offset = offset + length_of_file - len(window)
+
+        for pattern in hits:
+            # only hits ending in the new chunk, as the rest were found in the previous window
+            index = window.find(pattern, max(len(tail) - len(pattern) + 1, 0))
+            while index != -1:
+                pending.append((window_offset + index, pattern))
+                index = window.find(pattern, index + 1)
+
+        # every hit starting before the kept end of the chunk has been found
+        covered = offset + length_of_file - (0 if end_of_file else tail_length)
+        pending.sort()
+        ready = bisect.bisect_left(pending, (covered,))
+        take = min(ready, max_results - total_hits)
+        full = total_hits + take >= max_results
+        if full and 0 < take < ready and pending[take][0] == pending[take - 1][0]:
+            # hits at the same offset are returned together, so the next search can start at the first one left
+            held = bisect.bisect_left(pending, (pending[take][0],))
+            take = held if held or total_hits else bisect.bisect_left(pending, (pending[take][0] + 1,))
+        for hit_offset, pattern in pending[:take]:
+            hits[pattern].append(hit_offset)
+        total_hits += take
+        pending = pending[take:]
+        if full:
+            if pending:
+                covered = min(pending[0][0], covered)
+            return hits, covered - offset, not end_of_file or covered < offset + length_of_file
+
+        tail = window[-tail_length:] if tail_length else b""
+
+    return hits, length_of_file, False
+
+
 # Ascii range of printable chars
 _PRINTABLES_BEGIN = 33
 _PRINTABLES_END = 126
@@ -105,3 +177,53 @@ def ascii_group_formatter(iterable, strip=True) -> str:
             characters.append("\\x%02x" % x)
 
     return "".join(characters)
+
+
+# maps non-printable bytes to '.' for the ascii column of the hex view
+_ASCII_TABLE = bytes(x if _PRINTABLES_BEGIN <= x <= _PRINTABLES_END else ord(".") for x in range(256))
+
+HEX_ROW_SIZE = 16
+# each row of a shortform hex view is 8 groups of 4 hex chars, separated by spaces
+_SHORTFORM_ROW_LENGTH = HEX_ROW_SIZE // 2 * 5
+
+
+def hex_view_header(shortform: bool) -> str | list[str]:
+    """Return the hex column of the header row for a hex view."""
+    columns = bytes(range(HEX_ROW_SIZE))
+    if shortform:
+        return columns.hex(" ", -2)
+    return columns.hex(" ").upper().split(" ")
+
+
+def hex_view_rows(data: bytes, offset: int, shortform: bool) -> list[bedr_bdata.BinaryHexView.BinaryHexValue]:
+    """Render data as rows of 16 bytes for the hex view.
+
+    The hex and ascii text for the whole buffer is built with a few bulk operations and then sliced into rows,
+    rather than formatting each byte separately.
+
+    Longform rows are a list of 16 uppercase hex bytes, padded with empty strings.
+    Shortform rows are a string of lowercase hex, grouped in 2 bytes separated by spaces.
+    """
+    if not data:
+        return []
+    ascii_text = data.translate(_ASCII_TABLE).decode("ascii")
+    if shortform:
+        # groups counted from the start of the buffer line up with the rows as the row size is even
+        hex_text = data.hex(" ", -2)
+        hex_rows = (
+            hex_text[i : i + _SHORTFORM_ROW_LENGTH - 1] for i in range(0, len(hex_text), _SHORTFORM_ROW_LENGTH)
+        )
+    else:
+        hex_bytes = data.hex(" ").upper().split(" ")
+        hex_bytes += [""] * (-len(hex_bytes) % HEX_ROW_SIZE)
+        hex_rows = (hex_bytes[i : i + HEX_ROW_SIZE] for i in range(0, len(hex_bytes), HEX_ROW_SIZE))
+
+    # values are already in the correct form, so skip validating each row
+    return [
+        bedr_bdata.BinaryHexView.BinaryHexValue.model_construct(
+            address=offset + i * HEX_ROW_SIZE,
+            hex=hex,
+            ascii=ascii_text[i * HEX_ROW_SIZE : (i + 1) * HEX_ROW_SIZE],
+        )
+        for i, hex in enumerate(hex_rows)
+    ]
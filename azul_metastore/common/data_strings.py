@@ -1,8 +1,10 @@
 """Datastram manipulation involving strings."""
 
+import asyncio
+import contextlib
 import logging
 import re
-from typing import AsyncIterable
+from typing import AsyncIterable, AsyncIterator, NamedTuple
 
 from azul_bedrock.exception_enums import ExceptionCodeEnum
 from azul_bedrock.exceptions_bedrock import BaseAzulException
@@ -13,6 +15,93 @@ from azul_metastore.common import data_common
 logger = logging.getLogger(__name__)
 
 
+# regex taken from https://github.com/mandiant/flare-floss/blob/master/floss/strings.py (Apache License 2.0)
+ASCII_BYTE = rb" !\"#\$%&\'\(\)\*\+,-\./0123456789:;<=>\?@ABCDEFGHIJKLMNOPQRSTUVWXYZ\[\]\^_`abcdefghijklmnopqrstuvwxyz\{\|\}\\\~\t"  # noqa: E501
+
+# bytes of each chunk carried over to the next per character of max_length, as utf16 uses 2 bytes per character
+_FRAGMENT_BYTES_PER_CHAR = 4
+
+
+class StringMatch(NamedTuple):
+    """A string found in a data stream, before it is filtered and turned into a search result."""
+
+    offset: int
+    length: int
+    encoding: bedr_bdata.SearchResultType
+    string: str
+
+
+async def iter_strings(
+    data_stream: AsyncIterable[bytes],
+    min_length: int,
+    max_length: int,
+    offset: int,
+    buffer_size: int = data_common.DEFAULT_STRING_BUFFER_SIZE,
+) -> AsyncIterator[tuple[list[StringMatch], int, bool]]:
+    """Yield ascii and utf16 strings found in each chunk of the data stream.
+
+    Only one chunk and the carried over end of the previous chunk are held at a time, so memory use is bounded by
+    the buffer size and not the size of the stream.
+
+    yields the strings found in the chunk, total amount of content read and True if the end of the stream was reached.
+    Each string is yielded once, with the chunk it ends in.
+    """
+    ascii_re = re.compile(rb"([%s]{%d,})" % (ASCII_BYTE, min_length))
+    utf16_re = re.compile(rb"((?:[%s]\x00){%d,})" % (ASCII_BYTE, min_length))
+
+    read_content_length = 0
+    last_chunk_fragment = b""
+    """Read through the file in chunks joining the chunks as required.
+    This is done with an A, B chunk system and filtering out duplicate strings.
+    This means no strings are missed if they are on the boundary between chunks as per this example (8 byte chunk size)
+    e.g b"abcdeffindmeghij"
+    Searching for the string 'findme' and 'ab'
+    iteration 1
+    chunk_A = b"abcdeffi" # Chunk A has no string 'findme' but has 'ab'
+    iteration 2
+    chunk_A + chunk_B = b"ndmeghij" # Chunk A + B has a string 'findme' and 'ab' but we need to filter out ab because
+    # it was found in iteration 1.
+    """
+    max_chunk_size = max(max_length, buffer_size)
+
+    async for cur_chunk, reached_end_of_file in data_common.read_fixed_chunks(data_stream, max_chunk_size):
+        # offset of the start of the window in the file
+        last_chunk_offset = offset + read_content_length - len(last_chunk_fragment)
+        read_content_length += len(cur_chunk)
+
+        current_window = last_chunk_fragment + cur_chunk
+        del cur_chunk
+        found: list[StringMatch] = []
+        for regex, encoding, codec, char_width in (
+            (ascii_re, bedr_bdata.SearchResultType.ASCII, "ascii", 1),
+            (utf16_re, bedr_bdata.SearchResultType.UTF16, "utf-16", 2),
+        ):
+            for match in regex.finditer(current_window):
+                # Strings ending in the fragment were found in the previous window, and may be cut short here.
+                if match.end() <= len(last_chunk_fragment) - char_width:
+                    continue
+                # Skip for now, as this match may be longer.
+                # Because we are up to the boundary of the chunk and we haven't hit the end of the file yet
+                if match.end() > len(current_window) - char_width and not reached_end_of_file:
+                    continue
+                try:
+                    string = match.group().decode(codec)
+                except UnicodeDecodeError:
+                    continue
+                # Drop excessively long strings
+                if len(string) > max_length:
+                    continue
+                found.append(
+                    StringMatch(last_chunk_offset + match.start(), match.end() - match.start(), encoding, string)
+                )
+        # Take as little of the window as possible and still not miss any strings (x2 to avoid splitting a result
+        # in half) if on the boundary between ascii characters.
+        last_chunk_fragment = current_window[-max_length * _FRAGMENT_BYTES_PER_CHAR :] if max_length else b""
+        # release the window before reading the next chunk
+        del current_window
+        yield found, read_content_length, reached_end_of_file
+
+
 async def get_strings(
     data_stream: AsyncIterable[bytes],
     min_length: int,
@@ -25,19 +114,17 @@ async def get_strings(
 ) -> tuple[list[bedr_bdata.SearchResult], int, bool]:
     """Return ascii and utf16 strings from data blobs, filtering them with the provided filters.
 
+    Search results are only created for strings that pass the filters.
     return matching strings, total amount of content read, and True if there are more strings available.
     """
     if strings_to_read_before_stopping <= 0:
         raise BaseAzulException(
             internal=ExceptionCodeEnum.MetastoreInvalidGetStringsQuantity,
         )
-    # regex taken from https://github.com/mandiant/flare-floss/blob/master/floss/strings.py (Apache License 2.0)
-    ASCII_BYTE = rb" !\"#\$%&\'\(\)\*\+,-\./0123456789:;<=>\?@ABCDEFGHIJKLMNOPQRSTUVWXYZ\[\]\^_`abcdefghijklmnopqrstuvwxyz\{\|\}\\\~\t"  # noqa: E501
-    ASCII_RE = re.compile(rb"([%s]{%d,})" % (ASCII_BYTE, min_length))
-    UTF16_RE = re.compile(rb"((?:[%s]\x00){%d,})" % (ASCII_BYTE, min_length))
 
     if find_string:
         find_string = find_string.lower()
+    # offsets of strings already returned, only kept while they can still be found again
     seen_offsets: set[int] = set()
 
     def function_filter_string(in_str: str, offset: int) -> bool:
@@ -48,8 +135,7 @@ async def get_strings(
         elif find_regex is not None and find_regex.search(in_str) is None:
             return True
 
-        # Filter out the string if it's been seen before, this occurs because the file is processed in chunks
-        # And the chunks need to be overlapped to catch strings between the chunks.
+        # Filter out the string if a string in another encoding was already found at this offset.
         if offset in seen_offsets:
             return True
         seen_offsets.add(offset)
@@ -58,85 +144,70 @@ async def get_strings(
 
     read_content_length = 0
     reached_end_of_file = False
-    cur_chunk: bytes = b""
     strings = []
-    last_chunk_offset = offset
-    """Read through the file in chunks joining the chunks as required.
-    This is done with an A, B chunk system and filtering out duplicate strings.
-    This means no strings are missed if they are on the boundary between chunks as per this example (8 byte chunk size)
-    e.g b"abcdeffindmeghij"
-    Searching for the string 'findme' and 'ab'
-    iteration 1
-    chunk_A = b"abcdeffi" # Chunk A has no string 'findme' but has 'ab'
-    iteration 2
-    chunk_A + chunk_B = b"ndmeghij" # Chunk A + B has a string 'findme' and 'ab' but we need to filter out ab because
-    # it was found in iteration 1.
-    """
-    max_chunk_size = max(max_length, buffer_size)
-
-    while reached_end_of_file is False:
-        # Take as little as the last chunk as possible and still not miss any strings (x2 to avoid splitting a result
-        # in half) if on the boundary between ascii characters.
-        last_chunk_fragment: bytes = cur_chunk[-max_length * 2 :]
-        last_chunk_offset += len(cur_chunk) - len(last_chunk_fragment)
-        cur_chunk, reached_end_of_file = await data_common.read_from_async_iterable(data_stream, max_chunk_size)
-        read_content_length += len(cur_chunk)
-
-        current_window = last_chunk_fragment + cur_chunk
-
-        for match in ASCII_RE.finditer(current_window):
-            try:
-                string = match.group().decode("ascii")
-                # Skip for now, as this match may be longer.
-                # Because we are up to the boundary of the chunk and we haven't hit the end of the file yet
-                if match.end() == read_content_length and not reached_end_of_file:
-                    continue
-
-                string_offset = last_chunk_offset + match.start()
-                if function_filter_string(string, string_offset):
-                    continue
-            except UnicodeDecodeError:
-                pass
-            else:
-                # Drop excessively long strings
-                if len(string) > max_length:
+    chunks = iter_strings(data_stream, min_length, max_length, offset, buffer_size)
+    async with contextlib.aclosing(chunks):
+        async for result in chunks:
+            found, read_content_length, reached_end_of_file = result
+            for match in found:
+                if function_filter_string(match.string, match.offset):
                     continue
                 strings.append(
                     bedr_bdata.SearchResult(
-                        string=string,
-                        offset=string_offset,
-                        length=match.end() - match.start(),
-                        encoding=bedr_bdata.SearchResultType.ASCII,
+                        string=match.string,
+                        offset=match.offset,
+                        length=match.length,
+                        encoding=match.encoding,
                     )
                 )
 
-        for match in UTF16_RE.finditer(current_window):
-            try:
-                string = match.group().decode("utf-16")
-                # Skip for now, as this match may be longer.
-                # Because we are up to the boundary of the chunk and we haven't hit the end of the file yet
-                if match.end() == read_content_length and not reached_end_of_file:
-                    continue
+            # We've found the max number of strings return
+            if len(strings) >= strings_to_read_before_stopping:
+                break
+            # only offsets in the end of this chunk carried over to the next can be found again
+            next_window_start = offset + read_content_length - max_length * _FRAGMENT_BYTES_PER_CHAR
+            seen_offsets = {x for x in seen_offsets if x >= next_window_start}
+    return strings, read_content_length, not reached_end_of_file
 
-                string_offset = last_chunk_offset + match.start()
-                if function_filter_string(string, string_offset):
-                    continue
-            except UnicodeDecodeError:
-                pass
-            else:
-                # Drop excessively long strings
-                if len(string) > max_length:
-                    continue
-                strings.append(
-                    bedr_bdata.SearchResult(
-                        string=string,
-                        offset=string_offset,
-                        length=match.end() - match.start(),
-                        encoding=bedr_bdata.SearchResultType.UTF16,
-                    )
-                )
 
-        # We've found the max number of strings return
-        if len(strings) >= strings_to_read_before_stopping:
-            break
-    return strings, read_content_length, not reached_end_of_file
+async def get_common_strings(
+    data_streams: tuple[AsyncIterable[bytes], AsyncIterable[bytes]],
+    min_length: int,
+    max_length: int,
+    take_n_strings: int,
+) -> tuple[set[str], tuple[int, int], bool]:
+    """Return strings found in both data streams, stopping once at least take_n_strings are found.
+
+    Both streams are read concurrently, a batch of strings at a time. Only newly found strings are checked
+    against the strings of the other stream, so the common set is built incrementally.
+
+    return common strings, amount of content read from each stream, and True if both streams were fully read.
+    """
+    seen: tuple[set[str], set[str]] = (set(), set())
+    content_read = [0, 0]
+    has_more = [True, True]
+    common: set[str] = set()
+    chunks = [iter_strings(data_stream, min_length, max_length, 0) for data_stream in data_streams]
+
+    async def _read_batch(index: int) -> list[str]:
+        strings: list[str] = []
+        # doubled to reduce the number of batches needed to find common strings
+        while has_more[index] and len(strings) < take_n_strings * 2:
+            found, content_read[index], reached_end_of_file = await anext(chunks[index])
+            has_more[index] = not reached_end_of_file
+            strings.extend(x.string for x in found)
+        return strings
+
+    async with contextlib.aclosing(chunks[0]), contextlib.aclosing(chunks[1]):
+        while len(common) < take_n_strings and any(has_more):
+            batches = await asyncio.gather(_read_batch(0), _read_batch(1))
+            for index, strings in enumerate(batches):
+                other = seen[1 - index]
+                for string in strings:
+                    if string in seen[index]:
+                        continue
+                    seen[index].add(string)
+                    if string in other:
+                        common.add(string)
+
+    return common, (content_read[0], content_read[1]), not any(has_more)
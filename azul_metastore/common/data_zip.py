@@ -0,0 +1,150 @@
+"""Stream a ZIP archive of datastreams without holding whole files in memory."""
+
+import asyncio
+import io
+import logging
+import time
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable
+
+import pyzipper
+
+logger = logging.getLogger(__name__)
+
+# number of files fetched at the same time
+DEFAULT_CONCURRENCY = 4
+# number of chunks read ahead for each file being fetched
+DEFAULT_BUFFERED_CHUNKS = 16
+
+# marks the end of a file in the fetch queues
+_END = object()
+
+ZipEntry = tuple[str, Callable[[], Awaitable[AsyncIterable[bytes]]]]
+
+
+class _Sink(io.RawIOBase):
+    """Unseekable file that holds written bytes until they are taken."""
+
+    def __init__(self):
+        self._data = bytearray()
+
+    def writable(self) -> bool:
+        """Required."""
+        return True
+
+    def write(self, b) -> int:
+        """Hold the bytes until they are taken."""
+        self._data += b
+        return len(b)
+
+    def take(self) -> bytes:
+        """Return and clear the bytes written so far."""
+        ret = bytes(self._data)
+        self._data.clear()
+        return ret
+
+
+class ZipStream:
+    """Write a ZIP archive of async byte streams, yielding the archive as it is written.
+
+    Entries are fetched concurrently into bounded queues, but written to the archive in order.
+    Memory use is limited to the chunks buffered for the files currently being fetched.
+
+    Entries that fail before any data is read are left out of the archive.
+    """
+
+    def __init__(
+        self,
+        entries: list[ZipEntry],
+        *,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        buffered_chunks: int = DEFAULT_BUFFERED_CHUNKS,
+    ):
+        self._entries = entries
+        self._concurrency = max(concurrency, 1)
+        self._queues = [asyncio.Queue(maxsize=max(buffered_chunks, 1)) for _ in entries]
+        self._tasks: list[asyncio.Task] = []
+        # index of the entry being written and its first item, if already read
+        self._current = 0
+        self._head = None
+
+    async def _fetch(self, index: int):
+        """Read a file into its queue, ending with _END or the exception that stopped it."""
+        queue = self._queues[index]
+        try:
+            async for chunk in await self._entries[index][1]():
+                await queue.put(chunk)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(_END)
+
+    def _start_fetches(self):
+        """Start fetching every entry inside the concurrency window."""
+        while len(self._tasks) < min(self._current + self._concurrency, len(self._entries)):
+            self._tasks.append(asyncio.create_task(self._fetch(len(self._tasks))))
+
+    def _next_entry(self):
+        """Move on to the next entry."""
+        self._current += 1
+        self._head = None
+        self._start_fetches()
+
+    async def _read_head(self) -> bool:
+        """Read the first item of the current entry and return false if the entry could not be fetched."""
+        if self._head is None:
+            self._head = await self._queues[self._current].get()
+        if isinstance(self._head, Exception):
+            name = self._entries[self._current][0]
+            logger.warning(f"skipped {name} in zip as it could not be fetched: {self._head}")
+            return False
+        return True
+
+    async def first_entry(self) -> bool:
+        """Start fetching entries and wait until one can be read.
+
+        Returns false if no entries could be read, in which case the archive should not be streamed.
+        """
+        self._start_fetches()
+        while self._current < len(self._entries):
+            if await self._read_head():
+                return True
+            self._next_entry()
+        self.close()
+        return False
+
+    def close(self):
+        """Stop fetching entries."""
+        for task in self._tasks:
+            task.cancel()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Yield the bytes of the archive."""
+        self._start_fetches()
+        sink = _Sink()
+        try:
+            with pyzipper.ZipFile(sink, mode="w", compression=pyzipper.ZIP_DEFLATED) as zf:
+                while self._current < len(self._entries):
+                    if not await self._read_head():
+                        self._next_entry()
+                        continue
+                    # same file properties as ZipFile.writestr
+                    info = pyzipper.ZipInfo(self._entries[self._current][0], time.localtime(time.time())[:6])
+                    info.compress_type = pyzipper.ZIP_DEFLATED
+                    info.external_attr = 0o600 << 16
+                    queue = self._queues[self._current]
+                    # size is unknown until the file is read
+                    with zf.open(info, mode="w", force_zip64=True) as f:
+                        chunk = self._head
+                        while chunk is not _END:
+                            if isinstance(chunk, Exception):
+                                # the archive can't be fixed once the file has started
+                                raise chunk
+                            f.write(chunk)
+                            data = sink.take()
+                            if data:
+                                yield data
+                            chunk = await queue.get()
+                    self._next_entry()
+            yield sink.take()
+        finally:
+            self.close()
@@ -0,0 +1,200 @@
+"""Bounded pool of worker threads that decode and encode neutered files (CaRT and MalPZ).
+
+Decoding large files is CPU heavy, so it is kept off the event loop that serves requests.
+Streaming stages run on their own event loop in a worker, pulling input from the request's event loop
+and passing output back through a bounded queue, so files are never held in memory in full.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import threading
+import weakref
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, TypeVar
+
+from prometheus_client import Gauge
+
+from azul_metastore import settings
+
+prom_decode_queued = Gauge("azul_decode_queued", "Decode jobs waiting for a worker", ["pool"])
+prom_decode_active = Gauge("azul_decode_active", "Decode jobs running in a worker", ["pool"])
+
+# seconds between checks that the output of a stage is still wanted, while a worker waits on the event loop
+POLL_SECONDS = 1
+
+T = TypeVar("T")
+Stage = Callable[[AsyncIterable[bytes]], Awaitable[tuple[AsyncIterable[bytes], T]]]
+
+_END = object()
+
+
+class _Cancelled(Exception):
+    """Raised in a worker when the output of its stage is no longer wanted."""
+
+
+class _Failed:
+    """Error raised by a stage after it started producing output."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class DecodePool:
+    """Runs decode jobs in a fixed number of worker threads."""
+
+    def __init__(self, workers: int, queue_chunks: int, name: str = "decode"):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._queue_chunks = queue_chunks
+        self._prom_queued = prom_decode_queued.labels(pool=name)
+        self._prom_active = prom_decode_active.labels(pool=name)
+        self._lock = threading.Lock()
+        # jobs waiting for a worker
+        self.queued = 0
+        # jobs running in a worker
+        self.active = 0
+
+    def _submit(self, fn: Callable[..., T], *args) -> asyncio.Future[T]:
+        with self._lock:
+            self.queued += 1
+        self._prom_queued.inc()
+
+        def _run():
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            self._prom_queued.dec()
+            self._prom_active.inc()
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                self._prom_active.dec()
+
+        return asyncio.get_running_loop().run_in_executor(self._executor, _run)
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run a function in a worker and return its result."""
+        return await self._submit(fn, *args)
+
+    async def stream(self, stage: Stage[T], source: AsyncIterable[bytes]) -> tuple[AsyncIterator[bytes], T]:
+        """Run a streaming stage in a worker, returning its output and metadata.
+
+        The stage is called with an async iterable of the source, and returns an async iterable of its output
+        and metadata about the stream, e.g. cart.async_unpack_iterable.
+        Errors raised by the stage before it returns are raised here, later errors are raised by the output.
+        The source is closed once the stage has finished, including when the output is dropped.
+        """
+        loop = asyncio.get_running_loop()
+        source_iter = aiter(source)
+        # held while reading from the source, so it is not closed while being read
+        source_lock = asyncio.Lock()
+        output: asyncio.Queue = asyncio.Queue(maxsize=self._queue_chunks)
+        meta_future: asyncio.Future[T] = loop.create_future()
+        cancelled = threading.Event()
+
+        def _wait(coro):
+            """Run a coroutine on the request's event loop and wait for the result."""
+            future = asyncio.run_coroutine_threadsafe(coro, loop)
+            while True:
+                try:
+                    return future.result(timeout=POLL_SECONDS)
+                except concurrent.futures.TimeoutError:
+                    if cancelled.is_set():
+                        future.cancel()
+                        raise _Cancelled() from None
+
+        async def _next():
+            async with source_lock:
+                return await anext(source_iter, _END)
+
+        async def _close_source():
+            async with source_lock:
+                if (aclose := getattr(source_iter, "aclose", None)) is not None:
+                    await aclose()
+
+        async def _input():
+            while (chunk := _wait(_next())) is not _END:
+                yield chunk
+
+        def _resolve(meta=None, error: BaseException | None = None):
+            if meta_future.done():
+                return
+            if error is not None:
+                meta_future.set_exception(error)
+            else:
+                meta_future.set_result(meta)
+
+        async def _drive():
+            data, meta = await stage(_input())
+            loop.call_soon_threadsafe(_resolve, meta)
+            async for chunk in data:
+                _wait(output.put(chunk))
+
+        def _work():
+            try:
+                asyncio.run(_drive())
+                _wait(output.put(_END))
+            except _Cancelled:
+                pass
+            except BaseException as e:
+                if meta_future.done():
+                    try:
+                        _wait(output.put(_Failed(e)))
+                    except _Cancelled:
+                        pass
+                else:
+                    loop.call_soon_threadsafe(_resolve, None, e)
+            finally:
+                # e.g. release the connection to dispatcher of a download that was abandoned
+                with contextlib.suppress(RuntimeError):
+                    # the request's event loop has closed
+                    asyncio.run_coroutine_threadsafe(_close_source(), loop)
+
+        work = self._submit(_work)
+        try:
+            meta = await meta_future
+        except BaseException:
+            cancelled.set()
+            raise
+
+        async def _output():
+            try:
+                while (item := await output.get()) is not _END:
+                    if isinstance(item, _Failed):
+                        await work
+                        raise item.error
+                    yield item
+                # wait for the worker to be released, so the pool is free once the output is read
+                await work
+            finally:
+                cancelled.set()
+
+        ret = _output()
+        # stop the worker if the output is dropped without being read to the end
+        weakref.finalize(ret, cancelled.set)
+        return ret, meta
+
+
+_pools: dict[str, DecodePool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get(name: str, workers: int) -> DecodePool:
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = DecodePool(workers, settings.get().decode_queue_chunks, name)
+        return _pools[name]
+
+
+def get() -> DecodePool:
+    """Return the decode pool for this process."""
+    return _get("decode", settings.get().decode_workers)
+
+
+def get_download() -> DecodePool:
+    """Return the pool that carts downloads for this process.
+
+    Workers are held until the client has read the whole download, so downloads don't use the decode pool.
+    """
+    return _get("download", settings.get().download_encode_workers)
@@ -109,3 +109,10 @@ def convert_entropy_to_opensearch_entropy(entropy_values: list[float]) -> list[i
         return None
     result = _convert_float_0_8_to_binary(entropy_numpy_array)
     return result
+
+
+def hamming_distances(entropy_vector: list[int], candidates: list[list[int]]) -> np.ndarray:
+    """Return the exact number of bits that differ between an opensearch entropy vector and each candidate."""
+    query = np.asarray(entropy_vector, dtype=np.int8).view(np.uint8)
+    rows = np.asarray(candidates, dtype=np.int8).reshape(-1, len(query)).view(np.uint8)
+    return np.unpackbits(rows ^ query, axis=1).sum(axis=1, dtype=np.int64)
@@ -1,9 +1,14 @@
 """Handle decompress/extract/decode different file types."""
 
+import asyncio
+import gzip
+import hashlib
 import io
 import logging
+import tarfile
+import tempfile
 import zipfile
-from typing import AsyncIterable, Iterable, Optional, Tuple
+from typing import IO, AsyncIterable, Iterable, Iterator, NamedTuple, Optional, Tuple
 
 import malpz
 import pyzipper
@@ -16,6 +21,8 @@ from fastapi import UploadFile
 from pydantic import ByteSize
 from starlette.status import HTTP_422_UNPROCESSABLE_CONTENT
 
+from azul_metastore.common import decode_pool
+
 logger = logging.getLogger(__name__)
 
 # Max bytes before extraction of a bundled submission
@@ -26,6 +33,12 @@ MAX_BUNDLED_POST_EXTRACT_SIZE = MAX_BUNDLED_PRE_EXTRACT_SIZE * 2
 MAX_BUNDLED_FILES = 1000
 # Max characters in directories + filename for each file in bundled submission
 MAX_BUNDLED_FILENAME_LENGTH = 255
+# Max bytes of each extracted file held in memory before it is spooled to disk
+SPOOL_MAX_MEMORY = 1024 * 1024
+# Size of each read when copying uploaded and extracted files
+EXTRACT_CHUNK_SIZE = 1024 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
 
 
 async def unpack_content(
@@ -44,38 +57,54 @@ async def unpack_content(
     Where filenames are supported in extracted streams, these will be yielded
     with their content, otherwise as None.
     """
-    items = [(binary, None)]
+    if not extract:
+        async for item in _unpack_neutered(binary, None):
+            yield item
+        return
 
-    if extract:
-        # Check if the file metadata says it's too big.
-        too_big_fail = True
-        if binary.size and binary.size > MAX_BUNDLED_PRE_EXTRACT_SIZE:
-            too_big_fail = True
-        else:
-            # Metadata doesn't say the file is too big so buffer the file to confirm that's true.
-            too_big_fail = False
-            buffered_data = await binary.read(MAX_BUNDLED_PRE_EXTRACT_SIZE)
+    # Check if the file metadata says it's too big.
+    if binary.size and binary.size > MAX_BUNDLED_PRE_EXTRACT_SIZE:
+        _raise_too_big_to_extract()
+    # Metadata doesn't say the file is too big so spool the file to confirm that's true.
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+        size = 0
+        while chunk := await binary.read(EXTRACT_CHUNK_SIZE):
+            size += len(chunk)
+            if size >= MAX_BUNDLED_PRE_EXTRACT_SIZE:
+                _raise_too_big_to_extract()
+            await asyncio.to_thread(spooled.write, chunk)
 
-        if too_big_fail or len(buffered_data) == MAX_BUNDLED_PRE_EXTRACT_SIZE:
-            raise ApiException(
-                status_code=HTTP_422_UNPROCESSABLE_CONTENT,
-                ref=f"Can't extract file larger than {ByteSize(MAX_BUNDLED_PRE_EXTRACT_SIZE).human_readable()}",
-                internal=ExceptionCodeEnum.MetastoreFileFormatTooLargeForUnzip,
-                parameters={"max_bundled_pre_extract_size": ByteSize(MAX_BUNDLED_PRE_EXTRACT_SIZE).human_readable()},
-            )
         # if submitter trusts the file enough to be bundled submission, it shouldn't be cart'd so we don't uncart here
-        data_to_extract = io.BytesIO(buffered_data)
-        items = extract_archive(data_to_extract, password=password)
-
-    for raw_upload_file, fname in items:
-        fname2 = None
-        data, fname2 = await async_extract_neutered(raw_upload_file)
-        if data:
-            # Extracted from neutering so prefer extracted name
-            yield data, fname2 or fname
-        else:
-            # Not extracted from neutering
-            yield raw_upload_file, fname
+        members = iter_archive(spooled, password=password)
+        # decompression is slow, so each file is extracted in a thread
+        while (member := await asyncio.to_thread(next, members, None)) is not None:
+            async for item in _unpack_neutered(UploadFile(member.stream), member.name):
+                yield item
+    finally:
+        spooled.close()
+
+
+def _raise_too_big_to_extract():
+    raise ApiException(
+        status_code=HTTP_422_UNPROCESSABLE_CONTENT,
+        ref=f"Can't extract file larger than {ByteSize(MAX_BUNDLED_PRE_EXTRACT_SIZE).human_readable()}",
+        internal=ExceptionCodeEnum.MetastoreFileFormatTooLargeForUnzip,
+        parameters={"max_bundled_pre_extract_size": ByteSize(MAX_BUNDLED_PRE_EXTRACT_SIZE).human_readable()},
+    )
+
+
+async def _unpack_neutered(
+    raw_upload_file: UploadFile, fname: str | None
+) -> AsyncIterable[Tuple[AsyncIterable[bytes] | UploadFile, Optional[str]]]:
+    """Yield the content of a file with any neutering stripped."""
+    data, fname2 = await async_extract_neutered(raw_upload_file)
+    if data:
+        # Extracted from neutering so prefer extracted name
+        yield data, fname2 or fname
+    else:
+        # Not extracted from neutering
+        yield raw_upload_file, fname
 
 
 async def async_extract_neutered(
@@ -83,11 +112,14 @@ async def async_extract_neutered(
 ) -> tuple[AsyncIterable[bytes] | None, str | None]:
     """Handle extracting MalPZ/CaRT."""
     fname = None
+    # only files that look like a cart are queued for the decode pool
+    is_cart = await upload_file.read(len(cart.CART_MAGIC)) == cart.CART_MAGIC
+    await upload_file.seek(0)
     try:
-        async_iter = DispatcherAPI.async_convert_to_async_iterable(upload_file)
-        async_iter_data, meta = await cart.async_unpack_iterable(async_iter)
-        fname = meta.get("name")
-        return async_iter_data, fname
+        if is_cart:
+            async_iter_data, meta = await async_unpack_cart(DispatcherAPI.async_convert_to_async_iterable(upload_file))
+            fname = meta.get("name")
+            return async_iter_data, fname
     except cart.InvalidCARTException:
         pass
 
@@ -102,60 +134,196 @@ async def async_extract_neutered(
     return None, fname
 
 
-def extract_archive(istream: io.BytesIO, password: str | None = None) -> Iterable[Tuple[UploadFile, Optional[str]]]:
-    """Handle extracting data from zip archive file format."""
+async def async_unpack_cart(data: AsyncIterable[bytes]) -> tuple[AsyncIterable[bytes], dict]:
+    """Un-cart a stream in the decode pool, returning the original file and the cart's optional header.
+
+    Raises cart.InvalidCARTException if the stream is not a cart.
+    """
+    return await decode_pool.get().stream(cart.async_unpack_iterable, data)
+
+
+async def _pack_cart_stage(data: AsyncIterable[bytes]) -> tuple[AsyncIterable[bytes], None]:
+    # Disable digestors as we don't need them and they are super slow.
+    return cart.async_pack_iterable(data, auto_digests=()), None
+
+
+async def async_pack_cart(data: AsyncIterable[bytes]) -> AsyncIterable[bytes]:
+    """Cart a stream for download in the download pool."""
+    packed, _ = await decode_pool.get_download().stream(_pack_cart_stage, data)
+    return packed
+
+
+class ArchiveMember(NamedTuple):
+    """File extracted from an archive, spooled to disk if it is large."""
+
+    name: str | None
+    sha256: str
+    stream: IO[bytes]
+
+
+def _check_member_name(name: str):
+    """Raise an exception if the path of a file in an archive is not acceptable."""
+    if len(name) > MAX_BUNDLED_FILENAME_LENGTH:
+        path_len = len(name)
+        first_part_of_path = name[:MAX_BUNDLED_FILENAME_LENGTH]
+
+        raise exceptions_metastore.ExtractException(
+            ref=f"file path too long ({path_len}/{MAX_BUNDLED_FILENAME_LENGTH}): {first_part_of_path}...",
+            internal=ExceptionCodeEnum.MetastoreFileFormatFilePathTooLong,
+            parameters={
+                "path_len": path_len,
+                "max_bundled_filename_length": MAX_BUNDLED_FILENAME_LENGTH,
+                "first_part_of_path": first_part_of_path,
+            },
+        )
+    if "/../" in name:
+        raise exceptions_metastore.ExtractException(
+            ref=f"file name has bad character sequence (/../): {name}",
+            internal=ExceptionCodeEnum.MetastoreFileFormatBadPathElevation,
+            parameters={"file_path": name},
+        )
+
+
+def _check_members(count: int, total_bytes: int, names: Iterable[str]):
+    """Raise an exception if the files in an archive are not acceptable for a bundled submission."""
+    _check_count(count)
+    _check_total_bytes(total_bytes)
+    for name in names:
+        _check_member_name(name)
+
+
+def _check_count(count: int):
+    if count > MAX_BUNDLED_FILES:
+        raise exceptions_metastore.ExtractException(
+            ref=f"too many files to extract archive ({count}/{MAX_BUNDLED_FILES})",
+            internal=ExceptionCodeEnum.MetastoreFileFormatTooManyFilesToExtract,
+            parameters={"number_of_files": count, "max_number_of_files": MAX_BUNDLED_FILES},
+        )
+
+
+def _check_total_bytes(total_bytes: int):
+    if total_bytes > MAX_BUNDLED_POST_EXTRACT_SIZE:
+        raise exceptions_metastore.ExtractException(
+            ref=f"too many bytes in extracted submission ({total_bytes}/{MAX_BUNDLED_POST_EXTRACT_SIZE})",
+            internal=ExceptionCodeEnum.MetastoreFileFormatFileTooLargeToExtract,
+            parameters={"total_bytes": total_bytes, "max_extraction_size": MAX_BUNDLED_POST_EXTRACT_SIZE},
+        )
+
+
+def _zip_members(istream: IO[bytes], password: bytes | None) -> Iterator[tuple[str, IO[bytes]]]:
+    """Yield the name and a readable stream of each file in a zip."""
+    with pyzipper.AESZipFile(istream) as zpf:
+        zpf.setpassword(password)
+        infos = zpf.infolist()
+        files = [x for x in infos if not x.is_dir()]
+        _check_members(len(infos), sum(x.file_size for x in infos), (x.filename for x in files))
+        for info in files:
+            with zpf.open(info) as f:
+                yield info.filename, f
+
+
+def _tar_members(istream: IO[bytes]) -> Iterator[tuple[str, IO[bytes]]]:
+    """Yield the name and a readable stream of each file in a tar, which may be compressed."""
+    # streaming mode reads each file once in order, rather than seeking back through compressed data
+    # limits are checked as each header is read, so a tar bomb is rejected before it is all decompressed
+    count = 0
+    total_bytes = 0
+    with tarfile.open(fileobj=istream, mode="r|*") as tf:
+        for info in tf:
+            count += 1
+            _check_count(count)
+            if info.isfile():
+                total_bytes += info.size
+                _check_total_bytes(total_bytes)
+                _check_member_name(info.name)
+                yield info.name, tf.extractfile(info)
+
+
+def _gzip_name(istream: IO[bytes]) -> str | None:
+    """Return the original filename stored in a gzip header, if there is one."""
+    istream.seek(0)
+    header = istream.read(10)
+    flags = header[3]
+    if flags & 0x04:
+        # FEXTRA
+        extra_len = int.from_bytes(istream.read(2), "little")
+        istream.seek(extra_len, io.SEEK_CUR)
+    name = None
+    if flags & 0x08:
+        # FNAME, a null terminated latin-1 string
+        raw = bytearray()
+        while (c := istream.read(1)) not in (b"", b"\x00"):
+            raw += c
+        name = raw.decode("latin-1") or None
+    istream.seek(0)
+    return name
+
+
+def _gzip_members(istream: IO[bytes]) -> Iterator[tuple[str | None, IO[bytes]]]:
+    """Yield the single file in a gzip that does not hold a tar."""
+    name = _gzip_name(istream)
+    if name is not None:
+        _check_member_name(name)
+    with gzip.GzipFile(fileobj=istream, mode="rb") as f:
+        yield name, f
+
+
+def _spool(src: IO[bytes], extracted_bytes: int) -> tuple[IO[bytes], str, int]:
+    """Copy a stream to a spooled temporary file, returning the file, its sha256 and size.
+
+    Raises an exception if the file takes the total extracted bytes over the limit.
+    """
+    dst = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    sha256 = hashlib.sha256()
+    size = 0
+    while chunk := src.read(EXTRACT_CHUNK_SIZE):
+        size += len(chunk)
+        # sizes in archive headers can't be trusted
+        if extracted_bytes + size > MAX_BUNDLED_POST_EXTRACT_SIZE:
+            dst.close()
+            _check_total_bytes(extracted_bytes + size)
+        sha256.update(chunk)
+        dst.write(chunk)
+    dst.seek(0)
+    return dst, sha256.hexdigest(), size
+
+
+def iter_archive(istream: IO[bytes], password: str | None = None) -> Iterator[ArchiveMember]:
+    """Extract each file in a zip, tar or gzip archive, reading it once.
+
+    Files are yielded as they are extracted, and are held in memory unless they are large.
+    Empty files and directories are skipped.
+    """
     extracted = False
     encoded_password = password.encode("utf8") if password else None
     istream.seek(0)
     try:
-        with pyzipper.AESZipFile(istream) as zpf:
-            zpf.setpassword(encoded_password)
-            namelist = list(zpf.namelist())
-            if len(namelist) > MAX_BUNDLED_FILES:
-                raise exceptions_metastore.ExtractException(
-                    ref=f"too many files to extract archive ({len(namelist)}/{MAX_BUNDLED_FILES})",
-                    internal=ExceptionCodeEnum.MetastoreFileFormatTooManyFilesToExtract,
-                    parameters={"number_of_files": len(namelist), "max_number_of_files": MAX_BUNDLED_FILES},
-                )
-            # check total extracted size
-            total_bytes = 0
-            for n in namelist:
-                info: zipfile.ZipInfo = zpf.getinfo(n)
-                total_bytes += info.file_size
-            if total_bytes > MAX_BUNDLED_POST_EXTRACT_SIZE:
+        if zipfile.is_zipfile(istream):
+            members = _zip_members(istream, encoded_password)
+        else:
+            istream.seek(0)
+            is_tar = tarfile.is_tarfile(istream)
+            istream.seek(0)
+            if is_tar:
+                members = _tar_members(istream)
+            elif istream.read(2) == GZIP_MAGIC:
+                members = _gzip_members(istream)
+            else:
                 raise exceptions_metastore.ExtractException(
-                    ref=f"too many bytes in extracted submission ({total_bytes}/{MAX_BUNDLED_POST_EXTRACT_SIZE})",
-                    internal=ExceptionCodeEnum.MetastoreFileFormatFileTooLargeToExtract,
-                    parameters={"total_bytes": total_bytes, "max_extraction_size": MAX_BUNDLED_POST_EXTRACT_SIZE},
+                    ref="not a zip file, tar or gzip archive",
+                    internal=ExceptionCodeEnum.MetastoreFileFormatNotAZipFile,
                 )
-            # get bytes for each file in zip
-            for n in namelist:
-                info: zipfile.ZipInfo = zpf.getinfo(n)
-                if info.is_dir():
-                    continue
-                if len(n) > MAX_BUNDLED_FILENAME_LENGTH:
-                    path_len = len(n)
-                    first_part_of_path = n[:MAX_BUNDLED_FILENAME_LENGTH]
-
-                    raise exceptions_metastore.ExtractException(
-                        ref=f"file path too long ({path_len}/{MAX_BUNDLED_FILENAME_LENGTH}): {first_part_of_path}...",
-                        internal=ExceptionCodeEnum.MetastoreFileFormatFilePathTooLong,
-                        parameters={
-                            "path_len": path_len,
-                            "max_bundled_filename_length": MAX_BUNDLED_FILENAME_LENGTH,
-                            "first_part_of_path": first_part_of_path,
-                        },
-                    )
-                if "/../" in n:
-                    raise exceptions_metastore.ExtractException(
-                        ref=f"file name has bad character sequence (/../): {n}",
-                        internal=ExceptionCodeEnum.MetastoreFileFormatBadPathElevation,
-                        parameters={"file_path": n},
-                    )
-                if len(zpf.read(n)) == 0:
-                    continue
-                extracted = True
-                yield UploadFile(io.BytesIO(zpf.read(n))), n
+        istream.seek(0)
+
+        extracted_bytes = 0
+        for name, src in members:
+            stream, sha256, size = _spool(src, extracted_bytes)
+            extracted_bytes += size
+            if size == 0:
+                stream.close()
+                continue
+            extracted = True
+            yield ArchiveMember(name, sha256, stream)
     except pyzipper.BadZipFile as e:
         if "File is not a zip file" in str(e):
             raise exceptions_metastore.ExtractException(
@@ -186,13 +354,26 @@ def extract_archive(istream: io.BytesIO, password: str | None = None) -> Iterabl
                 internal=ExceptionCodeEnum.MetastoreFileFormatUnknownException,
                 parameters={"error_type": str(type(e)), "error_text": str(e)},
             ) from None
+    except (tarfile.TarError, EOFError, OSError) as e:
+        # corrupt tar or gzip
+        raise exceptions_metastore.ExtractException(
+            ref=str(type(e)) + " " + str(e),
+            internal=ExceptionCodeEnum.MetastoreFileFormatUnknownException,
+            parameters={"error_type": str(type(e)), "error_text": str(e)},
+        ) from None
     if not extracted:
         raise exceptions_metastore.ExtractException(
-            ref="no files were extracted from zip",
+            ref="no files were extracted from archive",
             internal=ExceptionCodeEnum.MetastoreFileFormatNoFilesExtractedFromZip,
         )
 
 
+def extract_archive(istream: IO[bytes], password: str | None = None) -> Iterable[Tuple[UploadFile, Optional[str]]]:
+    """Handle extracting data from zip, tar and gzip archive file formats."""
+    for member in iter_archive(istream, password):
+        yield UploadFile(member.stream), member.name
+
+
 async def async_handle_malpz(async_stream: UploadFile) -> Tuple[bytes, dict]:
     """Unwrap MalPZ file.
 
@@ -214,7 +395,7 @@ async def async_handle_malpz(async_stream: UploadFile) -> Tuple[bytes, dict]:
                 internal=ExceptionCodeEnum.MetastoreFileFormatFileTooLargeForUnmalpz,
                 parameters={"file_size": str(ByteSize(MAX_BUNDLED_PRE_EXTRACT_SIZE).human_readable())},
             )
-        unwrapped = malpz.unwrap(buffered_data)
+        unwrapped = await decode_pool.get().run(malpz.unwrap, buffered_data)
         meta = unwrapped.get("meta", {})
         return unwrapped["data"], meta
     finally:
@@ -0,0 +1,62 @@
+"""Run long running calculations in the background of the restapi."""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    """Runs jobs on a bounded thread pool.
+
+    Only one job runs at a time for each key, so concurrent requests for the same calculation share a job.
+    Each user can only have a limited number of jobs queued or running.
+    """
+
+    def __init__(self, name: str, *, max_workers: int, max_per_user: int):
+        self.name = name
+        self.max_per_user = max_per_user
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._jobs: dict[Hashable, Future] = {}
+        self._user_jobs: dict[str, int] = {}
+
+    def get(self, key: Hashable) -> Future | None:
+        """Return the future for the queued or running job with the key."""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def user_jobs(self, user: str) -> int:
+        """Return the number of jobs the user has queued or running."""
+        with self._lock:
+            return self._user_jobs.get(user, 0)
+
+    def submit(self, key: Hashable, user: str, fn: Callable[[], None]) -> bool:
+        """Queue a job, unless a job with the same key is already queued or running.
+
+        Returns false if the job was not queued because the user already has too many jobs.
+        """
+        with self._lock:
+            if key in self._jobs:
+                return True
+            if self._user_jobs.get(user, 0) >= self.max_per_user:
+                return False
+            self._user_jobs[user] = self._user_jobs.get(user, 0) + 1
+            # job can't be removed from tracking before it is added, as removal also takes the lock
+            self._jobs[key] = self._executor.submit(self._run, key, user, fn)
+            return True
+
+    def _run(self, key: Hashable, user: str, fn: Callable[[], None]):
+        """Run the job and stop tracking it once done."""
+        try:
+            fn()
+        except Exception:
+            logger.exception(f"{self.name} job failed for {key}")
+        finally:
+            with self._lock:
+                self._jobs.pop(key, None)
+                self._user_jobs[user] -= 1
+                if not self._user_jobs[user]:
+                    del self._user_jobs[user]
@@ -4,7 +4,7 @@ from azul_security import security as azsec
 
 from azul_metastore import settings
 from azul_metastore.common import search_data, wrapper
-from azul_metastore.encoders import annotation, binary2, cache, plugin, status
+from azul_metastore.encoders import annotation, binary2, cache, link, plugin, status
 
 
 class Manager:
@@ -17,6 +17,7 @@ class Manager:
         self.azsec = azsec.Security()
 
         self.binary2 = binary2.Binary2()
+        self.link = link.Link()
         self.status = status.Status(setting_overrides=self.s.status_index_config.model_dump())
         self.plugin = plugin.Plugin(setting_overrides=self.s.plugin_index_config.model_dump())
 
@@ -27,6 +28,7 @@ class Manager:
         """Make sure all indices and templates exist."""
         # create base indices first
         self.binary2.w.initialise(sd, force=force)
+        self.link.w.initialise(sd, force=force)
         self.status.w.initialise(sd, force=force)
         self.plugin.w.initialise(sd, force=force)
         self.annotation.w.initialise(sd, force=force)
@@ -57,4 +59,5 @@ class Manager:
         """Return the source alias which can be used to query only documents for a specific source."""
         return [
             self.binary2.w.get_subalias(source),
+            self.link.w.get_subalias(source),
         ]
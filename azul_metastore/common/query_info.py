@@ -12,3 +12,5 @@ class IngestError(BaseModel):
     doc: dict | BaseModel
     error_type: str
     error_reason: str
+    # opensearch id of the doc that failed, when the error came from opensearch
+    doc_id: str | None = None
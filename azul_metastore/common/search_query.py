@@ -1,13 +1,16 @@
 """Transforms parsed search queries into autocomplete results and OpenSearch queries."""
 
-from typing import Literal, Optional, Tuple
+from threading import RLock
+from typing import Iterable, Literal, Optional, Tuple
 
+import cachetools
 from azul_bedrock import exceptions_bedrock, exceptions_metastore
 from azul_bedrock.exception_enums import ExceptionCodeEnum
 from azul_bedrock.models_restapi import binaries_auto_complete as bedr_bauto
 from lark import UnexpectedCharacters, UnexpectedInput, UnexpectedToken
 from pydantic import BaseModel
 
+from azul_metastore.common import memcache
 from azul_metastore.common.search_query_parser import (
     Expression,
     FieldComparison,
@@ -26,6 +29,11 @@ BINARY_TAG_KEY = "binary.tag"
 # Magic vaue used for searching for feature tags
 FEATURE_TAG_KEY = "feature.tag"
 
+# Tag searches are resolved to sha256s or feature values before searching binaries.
+# Cache the resolved values briefly as the same search is repeated for every page of results.
+_tag_prefilter_cache = memcache.get_ttl_cache("search_query_tag_prefilter", maxsize=1000, ttl=30)
+_tag_prefilter_lock = RLock()
+
 
 class QueryExtraInfo(BaseModel):
     """Query conversion with additional information added."""
@@ -34,6 +42,58 @@ class QueryExtraInfo(BaseModel):
     is_feature_tag_search: bool = False
 
 
+def _tag_cache_key(tag_type: str, ctx: Context, tag: str) -> tuple:
+    """Return key for a cached tag prefilter, which depends on the users access and security filters."""
+    return (tag_type, tag, ctx.sd.unique(), ".".join(sorted(ctx.sd.security_include)))
+
+
+@cachetools.cached(
+    cache=_tag_prefilter_cache, lock=_tag_prefilter_lock, key=lambda ctx, tag: _tag_cache_key("entity_tag", ctx, tag)
+)
+def _resolve_binary_tag(ctx: Context, tag: str) -> list[str]:
+    """Return sha256s of binaries with the tag."""
+    body = {
+        "query": {
+            "bool": {
+                "must_not": [{"match": {"state": "disabled"}}],
+                "filter": [{"term": {"type": "entity_tag"}}, {"term": {"tag": tag}}],
+            }
+        },
+        "sort": [{"timestamp": {"order": "desc"}}],
+        "size": 10000,
+        "_source": {"includes": ["pivot"]},
+    }
+    resp = ctx.man.annotation.w.search(ctx.sd, body=body)
+    return [x["_source"]["pivot"] for x in resp["hits"]["hits"]]
+
+
+@cachetools.cached(
+    cache=_tag_prefilter_cache, lock=_tag_prefilter_lock, key=lambda ctx, tag: _tag_cache_key("fv_tag", ctx, tag)
+)
+def _resolve_feature_value_tag(ctx: Context, tag: str) -> list[tuple[str, str]]:
+    """Return feature names and values with the tag."""
+    body = {
+        "query": {"bool": {"filter": [{"term": {"type": "fv_tag"}}, {"term": {"tag": tag}}]}},
+        "sort": [{"timestamp": {"order": "desc"}}],
+        "size": 10000,
+        "_source": {"includes": ["feature_name", "feature_value"]},
+    }
+    resp = ctx.man.annotation.w.search(ctx.sd, body=body)
+    return [(x["_source"]["feature_name"], x["_source"]["feature_value"]) for x in resp["hits"]["hits"]]
+
+
+def invalidate_tag_prefilter(tag_type: str, tags: Iterable[str]) -> None:
+    """Remove cached tag prefilters for the tags, so searches reflect tags that were just created or deleted.
+
+    Other processes only see the change once their cached prefilter expires.
+    """
+    tags = set(tags)
+    with _tag_prefilter_lock:
+        for key in list(_tag_prefilter_cache.keys()):
+            if key[0] == tag_type and key[1] in tags:
+                _tag_prefilter_cache.pop(key, None)
+
+
 def _az_field_search_to_opensearch(
     ctx: Context | None,
     key: str,
@@ -67,20 +127,7 @@ def _az_field_search_to_opensearch(
         if key.lower() == BINARY_TAG_KEY:
             extra_info.is_binary_tag_search = True
             # Do a prefilter search for binaries with this tag
-            body = {
-                "query": {
-                    "bool": {
-                        "must_not": [{"match": {"state": "disabled"}}],
-                        "filter": [{"term": {"type": "entity_tag"}}, {"term": {"tag": tag}}],
-                    }
-                },
-                "sort": [{"timestamp": {"order": "desc"}}],
-                "size": 10000,
-                "_source": {"includes": ["pivot"]},
-            }
-
-            resp = ctx.man.annotation.w.search(ctx.sd, body=body)
-            prefilter_binaries = [x["_source"]["pivot"] for x in resp["hits"]["hits"]]
+            prefilter_binaries = _resolve_binary_tag(ctx, tag)
 
             if not prefilter_binaries:
                 raise exceptions_metastore.InvalidSearchException(
@@ -92,16 +139,7 @@ def _az_field_search_to_opensearch(
         else:
             extra_info.is_feature_tag_search = True
             # Do a prefilter search for features with this tag
-            body = {
-                "query": {"bool": {"filter": [{"term": {"type": "fv_tag"}}, {"term": {"tag": tag}}]}},
-                "sort": [{"timestamp": {"order": "desc"}}],
-                "size": 10000,
-                "_source": {"includes": ["feature_name", "feature_value"]},
-            }
-            resp = ctx.man.annotation.w.search(ctx.sd, body=body)
-            prefilter_feature_values = [
-                (x["_source"]["feature_name"], x["_source"]["feature_value"]) for x in resp["hits"]["hits"]
-            ]
+            prefilter_feature_values = _resolve_feature_value_tag(ctx, tag)
 
             if not prefilter_feature_values:
                 raise exceptions_metastore.InvalidSearchException(
@@ -0,0 +1,159 @@
+"""Comparison of ssdeep fuzzy hashes.
+
+Uses libfuzzy when it is installed, otherwise falls back to a slower python implementation
+of the same comparison algorithm.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import CDLL, c_char_p, c_int
+
+logger = logging.getLogger(__name__)
+
+# constants from libfuzzy fuzzy.h
+SPAMSUM_LENGTH = 64
+ROLLING_WINDOW = 7
+MIN_BLOCKSIZE = 3
+
+# comparing fewer candidates than this in a thread pool is slower than comparing them serially
+MIN_THREADED_CANDIDATES = 500
+MAX_THREADS = 4
+
+
+def _load_libfuzzy() -> CDLL | None:
+    """Load libfuzzy once so each comparison doesn't need to look up the library."""
+    try:
+        lib = CDLL("libfuzzy.so")
+    except OSError as e:
+        logger.warning(f"libfuzzy.so could not be loaded ({e}), ssdeep comparisons will use the slower python version")
+        return None
+    lib.fuzzy_compare.argtypes = [c_char_p, c_char_p]
+    lib.fuzzy_compare.restype = c_int
+    return lib
+
+
+_libfuzzy = _load_libfuzzy()
+_executor: ThreadPoolExecutor | None = None
+
+
+def has_libfuzzy() -> bool:
+    """Return true if libfuzzy is available for comparisons."""
+    return _libfuzzy is not None
+
+
+def _eliminate_sequences(chunk: str) -> str:
+    """Remove runs of more than 3 identical characters, as libfuzzy does before comparing."""
+    ret = chunk[:3]
+    for i in range(3, len(chunk)):
+        if chunk[i] == chunk[i - 1] == chunk[i - 2] == chunk[i - 3]:
+            continue
+        ret += chunk[i]
+    return ret
+
+
+def _has_common_substring(s1: str, s2: str) -> bool:
+    """Return true if the strings share a substring the size of the rolling window."""
+    if len(s1) < ROLLING_WINDOW or len(s2) < ROLLING_WINDOW:
+        return False
+    windows = {s1[i : i + ROLLING_WINDOW] for i in range(len(s1) - ROLLING_WINDOW + 1)}
+    return any(s2[i : i + ROLLING_WINDOW] in windows for i in range(len(s2) - ROLLING_WINDOW + 1))
+
+
+def _edit_distance(s1: str, s2: str) -> int:
+    """Return the edit distance where insertions and deletions cost 1 and substitutions cost 2."""
+    previous = list(range(len(s2) + 1))
+    for i, c1 in enumerate(s1, start=1):
+        current = [i]
+        for j, c2 in enumerate(s2, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (0 if c1 == c2 else 2),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def _score_strings(s1: str, s2: str, block_size: int) -> int:
+    """Return similarity of two chunks that were generated with the same block size."""
+    if len(s1) > SPAMSUM_LENGTH or len(s2) > SPAMSUM_LENGTH:
+        return 0
+    if not _has_common_substring(s1, s2):
+        return 0
+    score = _edit_distance(s1, s2)
+    score = (score * SPAMSUM_LENGTH) // (len(s1) + len(s2))
+    score = (100 * score) // SPAMSUM_LENGTH
+    if score >= 100:
+        return 0
+    score = 100 - score
+    # small block sizes can't produce a confident match
+    if block_size >= (99 + ROLLING_WINDOW) // ROLLING_WINDOW * MIN_BLOCKSIZE:
+        return score
+    return min(score, block_size // MIN_BLOCKSIZE * min(len(s1), len(s2)))
+
+
+def _parse(fuzzy_hash: str) -> tuple[int, str, str]:
+    """Split a fuzzy hash into block size, chunk and double chunk."""
+    block_size, chunk, double_chunk = fuzzy_hash.split(":", 2)
+    # hashes can have a filename appended after a comma
+    double_chunk = double_chunk.split(",", 1)[0]
+    return int(block_size), chunk, double_chunk
+
+
+def compare_python(hash1: str, hash2: str) -> int:
+    """Compare 2 ssdeep fuzzyhashes without libfuzzy and return a score for similarity.
+
+    Matches the behaviour of fuzzy_compare from libfuzzy, returning -1 if either hash can't be parsed.
+    """
+    try:
+        bs1, chunk1, dchunk1 = _parse(hash1)
+        bs2, chunk2, dchunk2 = _parse(hash2)
+    except ValueError:
+        return -1
+
+    if bs1 != bs2 and bs1 != bs2 * 2 and bs2 != bs1 * 2:
+        return 0
+
+    chunk1, dchunk1 = _eliminate_sequences(chunk1), _eliminate_sequences(dchunk1)
+    chunk2, dchunk2 = _eliminate_sequences(chunk2), _eliminate_sequences(dchunk2)
+
+    if bs1 == bs2 and chunk1 == chunk2 and dchunk1 == dchunk2:
+        return 100
+
+    if bs1 == bs2:
+        return max(_score_strings(chunk1, chunk2, bs1), _score_strings(dchunk1, dchunk2, bs1 * 2))
+    elif bs1 == bs2 * 2:
+        return _score_strings(chunk1, dchunk2, bs1)
+    else:
+        return _score_strings(dchunk1, chunk2, bs2)
+
+
+def compare(hash1: str, hash2: str) -> int:
+    """Compare 2 ssdeep fuzzyhashes and return a score for similarity between 0 and 100."""
+    if _libfuzzy is None:
+        return compare_python(hash1, hash2)
+    return _libfuzzy.fuzzy_compare(hash1.encode("ascii"), hash2.encode("ascii"))
+
+
+def compare_many(fuzzy_hash: str, candidates: list[str]) -> list[int]:
+    """Compare a fuzzyhash against many candidates, returning the scores in the same order as the candidates.
+
+    Large batches are split over a thread pool when libfuzzy is available, as ctypes releases the GIL.
+    """
+    global _executor
+    if _libfuzzy is None:
+        return [compare_python(fuzzy_hash, x) for x in candidates]
+
+    encoded = fuzzy_hash.encode("ascii")
+    fuzzy_compare = _libfuzzy.fuzzy_compare
+    if len(candidates) < MIN_THREADED_CANDIDATES:
+        return [fuzzy_compare(encoded, x.encode("ascii")) for x in candidates]
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_THREADS, thread_name_prefix="ssdeep")
+    step = -(-len(candidates) // MAX_THREADS)
+    batches = [candidates[i : i + step] for i in range(0, len(candidates), step)]
+    results = _executor.map(lambda batch: [fuzzy_compare(encoded, x.encode("ascii")) for x in batch], batches)
+    return [score for batch in results for score in batch]
@@ -1,37 +1,179 @@
-"""API call to the AI string filter service."""
+"""API call to the AI string filter service.
 
+Concurrent requests for the same file format are coalesced into batched calls over a pooled connection,
+and the verdict for each string is cached so strings seen before are not sent again.
+"""
+
+import asyncio
+import hashlib
 import logging
+import weakref
 
 import httpx
 from azul_bedrock import models_restapi
 from azul_bedrock.exception_enums import ExceptionCodeEnum
 from azul_bedrock.exceptions_bedrock import ApiException
+from prometheus_client import Counter
+
+from azul_metastore import settings
+from azul_metastore.common import memcache
 
 logger = logging.getLogger(__name__)
 
+prom_string_filter = Counter("azul_string_filter_strings", "Strings checked by the AI string filter", ["result"])
+
+# seconds to wait for more concurrent requests before sending a batch that is not full
+BATCH_LINGER = 0.005
+
+# verdict for each string, keyed by file format and string hash
+_verdicts = memcache.get_ttl_cache("string_filter_verdicts", maxsize=200_000, ttl=3600)
+
+
+def _key(file_format: str, string: str) -> bytes:
+    return hashlib.blake2b(f"{file_format}\n{string}".encode(), digest_size=16).digest()
+
+
+class StringFilterClient:
+    """Batches strings from concurrent requests into calls to the AI string filter.
+
+    Must only be used from the event loop that created it.
+    """
+
+    def __init__(self, filter_url: str, *, batch_size: int, max_connections: int, timeout: float):
+        self._client = httpx.AsyncClient(
+            base_url=filter_url,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+        self._batch_size = batch_size
+        # strings waiting to be sent, for each file format
+        self._pending: dict[str, dict[bytes, tuple[dict[str, str | int], asyncio.Future[bool]]]] = {}
+        # verdicts waiting on strings that are pending or being sent
+        self._waiting: dict[bytes, asyncio.Future[bool]] = {}
+        self._flush_handles: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def _send(self, file_format: str, batch: dict[bytes, tuple[dict[str, str | int], asyncio.Future[bool]]]):
+        """Call the AI string filter with a batch of strings and resolve the futures waiting on them."""
+        logger.debug("calling ai string filter with %d strings for file format %s", len(batch), file_format)
+        try:
+            response = await self._client.post(
+                "/v0/strings", params={"file_format": file_format}, json=[x for x, _ in batch.values()]
+            )
+            if response.is_error:
+                error_message = f"AI filter failed with error: {response.content}"
+                logger.warning(error_message)
+                raise ApiException(
+                    status_code=response.status_code,
+                    ref=error_message,
+                    internal=ExceptionCodeEnum.MetastoreAiStringFilterFailure,
+                    parameters={"text_content": str(response.content)},
+                )
+            valid_pairs = {(item["offset"], item["string"]) for item in response.json()}
+        except Exception as e:
+            for key, (_, future) in batch.items():
+                self._waiting.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+                    # requests that timed out won't retrieve the exception
+                    future.exception()
+            return
 
-def call_string_filter(
-    file_format: str, strings: list[models_restapi.SearchResult], filter_url: str
-) -> list[dict[str, int]]:
-    """Call the AI string filter."""
-    base_url = f"{filter_url}/v0/strings?file_format={file_format}"
-    modified_strings = extract_string_and_offset(strings)
-    logger.debug("calling ai string filter with URL %s", base_url)
-    response = httpx.post(base_url, json=modified_strings, timeout=30)
-
-    if response.is_error:
-        error_message = f"AI filter failed with error: {response.content}"
-        logger.warning(error_message)
-        raise ApiException(
-            status_code=response.status_code,
-            ref=error_message,
-            internal=ExceptionCodeEnum.MetastoreAiStringFilterFailure,
-            parameters={"text_content": str(response.content)},
+        for key, (item, future) in batch.items():
+            self._waiting.pop(key, None)
+            verdict = (item["offset"], item["string"]) in valid_pairs
+            _verdicts[key] = verdict
+            prom_string_filter.labels(result="kept" if verdict else "removed").inc()
+            if not future.done():
+                future.set_result(verdict)
+
+    def _flush(self, file_format: str):
+        """Send the strings waiting for a file format."""
+        handle = self._flush_handles.pop(file_format, None)
+        if handle is not None:
+            handle.cancel()
+        batch = self._pending.pop(file_format, None)
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._send(file_format, batch))
+        # keep a reference until the call completes, even if all waiting requests have timed out
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def filter(
+        self, file_format: str, strings: list[models_restapi.SearchResult], timeout: float
+    ) -> list[dict[str, str | int]]:
+        """Return the string and offset of each string kept by the AI string filter, in the order given.
+
+        Raises TimeoutError if the filter has not responded within timeout seconds.
+        """
+        loop = asyncio.get_running_loop()
+        verdicts: list[bool | asyncio.Future[bool]] = []
+        for sr in strings:
+            key = _key(file_format, sr.string)
+            verdict = _verdicts.get(key)
+            if verdict is not None:
+                prom_string_filter.labels(result="cached").inc()
+                verdicts.append(verdict)
+                continue
+            if key in self._waiting:
+                verdicts.append(self._waiting[key])
+                continue
+            future = self._waiting[key] = loop.create_future()
+            pending = self._pending.setdefault(file_format, {})
+            pending[key] = ({"string": sr.string, "offset": sr.offset}, future)
+            verdicts.append(future)
+            if len(pending) >= self._batch_size:
+                self._flush(file_format)
+            elif file_format not in self._flush_handles:
+                self._flush_handles[file_format] = loop.call_later(BATCH_LINGER, self._flush, file_format)
+
+        futures = {x for x in verdicts if isinstance(x, asyncio.Future)}
+        if futures:
+            # futures are shared with other requests, so they must not be cancelled on timeout
+            _, not_done = await asyncio.wait(futures, timeout=timeout)
+            if not_done:
+                raise TimeoutError(f"AI string filter did not respond within {timeout:.1f} seconds")
+
+        ret = []
+        for sr, verdict in zip(strings, verdicts, strict=True):
+            if isinstance(verdict, asyncio.Future):
+                verdict = verdict.result()
+            if verdict:
+                ret.append({"string": sr.string, "offset": sr.offset})
+        return ret
+
+    async def aclose(self):
+        """Close the pooled connections."""
+        await self._client.aclose()
+
+
+# clients for each event loop, as pooled connections can't be shared between loops
+_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, StringFilterClient]] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_client(filter_url: str) -> StringFilterClient:
+    """Return the AI string filter client for the running event loop."""
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(filter_url)
+    if client is None:
+        s = settings.get()
+        client = clients[filter_url] = StringFilterClient(
+            filter_url,
+            batch_size=s.smart_string_filter_batch_size,
+            max_connections=s.smart_string_filter_max_connections,
+            timeout=s.smart_string_filter_timeout,
         )
+    return client
+
 
-    if response is not None:
-        return response.json()
-    return []
+async def call_string_filter(
+    file_format: str, strings: list[models_restapi.SearchResult], filter_url: str, timeout: float
+) -> list[dict[str, str | int]]:
+    """Call the AI string filter, raising TimeoutError if it takes longer than timeout seconds."""
+    return await get_client(filter_url).filter(file_format, strings, timeout)
 
 
 def extract_string_and_offset(
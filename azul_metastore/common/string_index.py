@@ -0,0 +1,342 @@
+"""Local on-disk index of the strings in binaries, so filtered string searches don't re-read the binary.
+
+Each index holds every string in a binary as columns of numpy arrays, with the strings joined by newlines
+(which are never part of a string) so they can be searched in a single pass.
+
+Indexes are built in the background the first time strings of a binary are searched, and later searches
+and pages are served from the index. Binaries are immutable, so indexes never need to be rebuilt.
+Access to the binary must be checked before searching the index.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+from array import array
+from typing import Iterator
+
+import numpy as np
+from azul_bedrock import dispatcher as b_dispatcher
+from azul_bedrock.models_restapi import binaries_data as bedr_bdata
+from prometheus_client import Counter
+
+from azul_metastore import settings
+from azul_metastore.common import data_strings, jobs, memcache
+
+logger = logging.getLogger(__name__)
+
+prom_string_index = Counter("azul_string_index", "Searches of binary strings using the local index", ["result"])
+
+# size of each range read from dispatcher when building an index
+BUILD_READ_SIZE = 4 * 1024 * 1024
+# suffix of index files
+INDEX_SUFFIX = ".npz"
+
+_ENCODINGS = [bedr_bdata.SearchResultType.ASCII, bedr_bdata.SearchResultType.UTF16]
+
+# indexes recently loaded from disk
+_loaded = memcache.get_lru_cache("string_index", maxsize=8)
+_loaded_lock = threading.Lock()
+# binaries that are too large to be indexed
+_unindexable = memcache.get_ttl_cache("string_index_unindexable", maxsize=10_000, ttl=3600)
+
+_build_jobs: jobs.JobRunner | None = None
+_build_jobs_lock = threading.Lock()
+
+
+class StringIndex:
+    """Strings found in a binary, sorted by offset."""
+
+    def __init__(
+        self,
+        *,
+        offsets: np.ndarray,
+        lengths: np.ndarray,
+        encodings: np.ndarray,
+        ends: np.ndarray,
+        text: bytes,
+        size: int,
+        min_length: int,
+        max_length: int,
+    ):
+        self.offsets = offsets
+        # length in bytes of each string in the binary
+        self.lengths = lengths
+        self.encodings = encodings
+        # end of each string in the text
+        self.ends = ends
+        self.starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)[: len(ends)]
+        self.text = text
+        self._lower_text: bytes | None = None
+        self.size = size
+        self.min_length = min_length
+        self.max_length = max_length
+
+    @classmethod
+    def from_matches(cls, matches: list[data_strings.StringMatch], size: int, min_length: int, max_length: int):
+        """Return an index of the strings found in a binary."""
+        matches.sort(key=lambda x: x.offset)
+        offsets = array("q")
+        lengths = array("I")
+        encodings = bytearray()
+        ends = array("q")
+        text = []
+        end = -1
+        for match in matches:
+            offsets.append(match.offset)
+            lengths.append(match.length)
+            encodings.append(_ENCODINGS.index(match.encoding))
+            text.append(match.string)
+            end += len(match.string) + 1
+            ends.append(end)
+        return cls(
+            offsets=np.frombuffer(offsets, dtype=np.int64),
+            lengths=np.frombuffer(lengths, dtype=np.uint32),
+            encodings=np.frombuffer(bytes(encodings), dtype=np.uint8),
+            ends=np.frombuffer(ends, dtype=np.int64),
+            text="\n".join(text).encode("ascii"),
+            size=size,
+            min_length=min_length,
+            max_length=max_length,
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        """Return an index read from a file."""
+        with np.load(path) as data:
+            size, min_length, max_length = (int(x) for x in data["meta"])
+            return cls(
+                offsets=data["offsets"],
+                lengths=data["lengths"],
+                encodings=data["encodings"],
+                ends=data["ends"],
+                text=data["text"].tobytes(),
+                size=size,
+                min_length=min_length,
+                max_length=max_length,
+            )
+
+    def save(self, path: str):
+        """Write the index to a file, replacing it atomically."""
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                offsets=self.offsets,
+                lengths=self.lengths,
+                encodings=self.encodings,
+                ends=self.ends,
+                text=np.frombuffer(self.text, dtype=np.uint8),
+                meta=np.array([self.size, self.min_length, self.max_length], dtype=np.int64),
+            )
+        os.replace(tmp, path)
+
+    def supports(self, min_length: int, max_length: int) -> bool:
+        """Return true if the index holds every string of these lengths."""
+        return self.min_length <= min_length and max_length <= self.max_length
+
+    def _string(self, i: int) -> str:
+        return self.text[self.starts[i] : self.ends[i]].decode("ascii")
+
+    def _candidates_with(self, find_string: str, first: int, last: int) -> Iterator[int]:
+        """Yield indexes of strings between first and last that contain find_string, ignoring case."""
+        try:
+            needle = find_string.lower().encode("ascii")
+        except UnicodeEncodeError:
+            # strings only hold ascii characters
+            return
+        if b"\n" in needle or first >= last:
+            return
+        if self._lower_text is None:
+            self._lower_text = self.text.lower()
+        text_end = int(self.ends[last - 1])
+        pos = self._lower_text.find(needle, int(self.starts[first]), text_end)
+        while pos != -1:
+            i = int(np.searchsorted(self.ends, pos, side="right"))
+            yield i
+            pos = self._lower_text.find(needle, int(self.ends[i]) + 1, text_end)
+
+    def search(
+        self,
+        *,
+        min_length: int,
+        max_length: int,
+        start: int,
+        end: int | None,
+        find_string: str | None,
+        find_regex: re.Pattern[str] | None,
+        max_results: int,
+    ) -> tuple[list[bedr_bdata.SearchResult], int, bool]:
+        """Return strings that are within bytes start to end (exclusive) of the binary and match the filters.
+
+        Returns up to max_results + 1 strings, so callers can tell if there are more results.
+        Also returns the number of bytes of the binary that were covered and True if there is more of the binary.
+        Coverage stops at the first string cut by the end of the range, so the next search starting there finds it.
+        """
+        end = self.size if end is None else min(end, self.size)
+        first = int(np.searchsorted(self.offsets, start, side="left"))
+        last = int(np.searchsorted(self.offsets, end, side="left"))
+        # strings starting at start that are cut can't be found by starting there again, so are skipped instead
+        cut = np.flatnonzero(
+            (self.offsets[first:last] + self.lengths[first:last] > end) & (self.offsets[first:last] > start)
+        )
+        covered_end = end
+        if len(cut):
+            last = first + int(cut[0])
+            covered_end = int(self.offsets[last])
+        if find_string:
+            candidates = self._candidates_with(find_string, first, last)
+        else:
+            candidates = range(first, last)
+
+        strings = []
+        for i in candidates:
+            string_end = int(self.offsets[i] + self.lengths[i])
+            chars = int(self.ends[i] - self.starts[i])
+            if string_end > end or chars < min_length or chars > max_length:
+                continue
+            string = self._string(i)
+            if find_regex is not None and find_regex.search(string) is None:
+                continue
+            strings.append(
+                bedr_bdata.SearchResult(
+                    string=string,
+                    offset=int(self.offsets[i]),
+                    length=int(self.lengths[i]),
+                    encoding=_ENCODINGS[self.encodings[i]],
+                )
+            )
+            if len(strings) > max_results:
+                break
+        return strings, max(covered_end - start, 0), covered_end < self.size
+
+
+def _path(folder: str, sha256: str) -> str:
+    return os.path.join(folder, sha256.lower() + INDEX_SUFFIX)
+
+
+def _load(folder: str, sha256: str) -> StringIndex | None:
+    """Return the index for the binary if it has been built."""
+    path = _path(folder, sha256)
+    with _loaded_lock:
+        index = _loaded.get(path)
+    if index is None:
+        try:
+            index = StringIndex.load(path)
+        except FileNotFoundError:
+            return None
+        with _loaded_lock:
+            _loaded[path] = index
+    try:
+        # mark the index as recently used so it is removed last
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return index
+
+
+def _enforce_budget(folder: str, max_bytes: int):
+    """Remove the least recently used indexes until the indexes fit in the size budget."""
+    entries = []
+    for entry in os.scandir(folder):
+        if entry.name.endswith(INDEX_SUFFIX):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(x[1] for x in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def build(dispatcher: b_dispatcher.DispatcherAPI, source: str, label: str, sha256: str):
+    """Read the binary from dispatcher and write an index of its strings."""
+    s = settings.get()
+    rsp = dispatcher.get_binary(source=source, label=label, sha256=sha256, start_pos=0, end_pos=BUILD_READ_SIZE - 1)
+    size = int(rsp.headers["Content-Range"].split("/")[-1], 10)
+    if size > s.string_index_max_binary_size:
+        _unindexable[sha256.lower()] = True
+        return
+
+    async def _content():
+        yield rsp.content
+        for start in range(BUILD_READ_SIZE, size, BUILD_READ_SIZE):
+            yield dispatcher.get_binary(
+                source=source, label=label, sha256=sha256, start_pos=start, end_pos=start + BUILD_READ_SIZE - 1
+            ).content
+
+    async def _collect() -> list[data_strings.StringMatch]:
+        matches = []
+        async for found, _, _ in data_strings.iter_strings(
+            _content(), s.string_index_min_length, s.string_index_max_length, 0
+        ):
+            matches.extend(found)
+        return matches
+
+    index = StringIndex.from_matches(
+        asyncio.run(_collect()), size, s.string_index_min_length, s.string_index_max_length
+    )
+    os.makedirs(s.string_index_folder, exist_ok=True)
+    index.save(_path(s.string_index_folder, sha256))
+    _enforce_budget(s.string_index_folder, s.string_index_max_bytes)
+
+
+def _get_build_jobs() -> jobs.JobRunner:
+    """Return the runner for building string indexes."""
+    global _build_jobs
+    with _build_jobs_lock:
+        if _build_jobs is None:
+            s = settings.get()
+            _build_jobs = jobs.JobRunner(
+                "string_index", max_workers=s.string_index_workers, max_per_user=s.string_index_workers
+            )
+        return _build_jobs
+
+
+def search_strings(
+    dispatcher: b_dispatcher.DispatcherAPI,
+    user: str,
+    source: str,
+    label: str,
+    sha256: str,
+    *,
+    min_length: int,
+    max_length: int,
+    start: int,
+    end: int | None,
+    find_string: str | None,
+    find_regex: re.Pattern[str] | None,
+    max_results: int,
+) -> tuple[list[bedr_bdata.SearchResult], int, bool] | None:
+    """Search the strings of a binary using its index, starting a build of the index if there isn't one.
+
+    Returns None if the index can't be used, and the binary must be read instead.
+    """
+    s = settings.get()
+    if not s.string_index_folder:
+        return None
+    sha256 = sha256.lower()
+    index = _load(s.string_index_folder, sha256)
+    if index is None:
+        prom_string_index.labels(result="miss").inc()
+        if sha256 not in _unindexable:
+            _get_build_jobs().submit(sha256, user, lambda: build(dispatcher, source, label, sha256))
+        return None
+    if not index.supports(min_length, max_length):
+        prom_string_index.labels(result="unsupported").inc()
+        return None
+    prom_string_index.labels(result="hit").inc()
+    return index.search(
+        min_length=min_length,
+        max_length=max_length,
+        start=start,
+        end=end,
+        find_string=find_string,
+        find_regex=find_regex,
+        max_results=max_results,
+    )
@@ -0,0 +1,139 @@
+"""Local nearest neighbour index for TLSH hashes.
+
+Holds TLSH vectors in numpy arrays so candidates can be scored with the real TLSH distance
+rather than the approximate cosine similarity used by the OpenSearch kNN search.
+"""
+
+import threading
+
+import numpy as np
+
+from azul_metastore.common.tlsh import _tlsh_to_array
+
+# checksum, lvalue, q1 ratio, q2 ratio
+HEADER_LENGTH = 4
+CODE_LENGTH = 32
+VECTOR_LENGTH = HEADER_LENGTH + CODE_LENGTH
+# modulus used when comparing the lvalue and q ratios
+RANGE_LVALUE = 256
+RANGE_QRATIO = 16
+# rows are allocated in blocks to avoid copying the arrays on every add
+INITIAL_CAPACITY = 1024
+
+
+def _bit_pair_diff_table() -> np.ndarray:
+    """Return the TLSH distance between every pair of code bytes.
+
+    Each code byte holds 4 quartile values of 2 bits, where a difference of 3 is penalised as 6.
+    """
+    values = np.arange(256, dtype=np.int16)
+    table = np.zeros((256, 256), dtype=np.uint8)
+    for shift in (0, 2, 4, 6):
+        diff = np.abs(((values[:, None] >> shift) & 3) - ((values[None, :] >> shift) & 3))
+        table += np.where(diff == 3, 6, diff).astype(np.uint8)
+    return table
+
+
+_BIT_PAIR_DIFF = _bit_pair_diff_table()
+
+
+def _mod_diff(x: np.ndarray, y: int, r: int) -> np.ndarray:
+    """Return the distance between values when wrapping at r."""
+    diff = np.abs(x.astype(np.int16) - y)
+    return np.minimum(diff, r - diff)
+
+
+def _header_distance(headers: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Return the header part of the TLSH distance for each row of headers."""
+    ldiff = _mod_diff(headers[:, 1], int(query[1]), RANGE_LVALUE)
+    ret = np.where(ldiff <= 1, ldiff, ldiff * 12)
+    for i in (2, 3):
+        qdiff = _mod_diff(headers[:, i], int(query[i]), RANGE_QRATIO)
+        ret += np.where(qdiff <= 1, qdiff, (qdiff - 1) * 12)
+    ret += headers[:, 0] != query[0]
+    return ret
+
+
+def _code_distance(codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Return the code part of the TLSH distance for each row of codes."""
+    return _BIT_PAIR_DIFF[codes, query[None, :]].sum(axis=1, dtype=np.int32)
+
+
+def vector_to_array(vector: list[int]) -> np.ndarray:
+    """Convert a signed tlsh_vector, as stored in OpenSearch, back to the unsigned TLSH values."""
+    return (np.asarray(vector, dtype=np.int16) + 128).astype(np.uint8)
+
+
+def distance(tlsh1: str, tlsh2: str) -> int:
+    """Return the TLSH distance between 2 hashes, where 0 is identical.
+
+    Matches the distance calculated by the tlsh library with length differences included.
+    """
+    a = np.asarray(_tlsh_to_array(tlsh1), dtype=np.uint8)
+    b = np.asarray(_tlsh_to_array(tlsh2), dtype=np.uint8)
+    header = _header_distance(a[None, :HEADER_LENGTH], b[:HEADER_LENGTH])
+    code = _code_distance(a[None, HEADER_LENGTH:], b[HEADER_LENGTH:])
+    return int(header[0] + code[0])
+
+
+class TlshIndex:
+    """In memory index of TLSH vectors keyed by sha256.
+
+    Queries score every stored vector with the exact TLSH distance.
+    The header distance is computed first and used to skip scoring the code of rows that can't be under the cutoff.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: dict[str, int] = {}
+        self._sha256s: list[str] = []
+        self._headers = np.zeros((INITIAL_CAPACITY, HEADER_LENGTH), dtype=np.uint8)
+        self._codes = np.zeros((INITIAL_CAPACITY, CODE_LENGTH), dtype=np.uint8)
+
+    def __len__(self) -> int:
+        """Return the number of binaries in the index."""
+        return len(self._sha256s)
+
+    def add(self, sha256: str, vector: list[int]):
+        """Add or replace the tlsh_vector for a binary."""
+        values = vector_to_array(vector)
+        if len(values) != VECTOR_LENGTH:
+            raise ValueError(f"tlsh vector for {sha256} has length {len(values)}, expected {VECTOR_LENGTH}")
+        with self._lock:
+            row = self._rows.get(sha256)
+            if row is None:
+                row = len(self._sha256s)
+                if row >= len(self._headers):
+                    self._headers = np.concatenate([self._headers, np.zeros_like(self._headers)])
+                    self._codes = np.concatenate([self._codes, np.zeros_like(self._codes)])
+                self._rows[sha256] = row
+                self._sha256s.append(sha256)
+            self._headers[row] = values[:HEADER_LENGTH]
+            self._codes[row] = values[HEADER_LENGTH:]
+
+    def query(self, vector: list[int], *, max_distance: int, max_count: int) -> list[tuple[str, int]]:
+        """Return (sha256, distance) of the closest binaries, ordered by distance.
+
+        Binaries with an identical TLSH or a distance greater than max_distance are not returned.
+        """
+        if max_count < 1:
+            return []
+        values = vector_to_array(vector)
+        with self._lock:
+            count = len(self._sha256s)
+            headers = self._headers[:count]
+            codes = self._codes[:count]
+            # rows are only ever appended, so the first count entries are stable without copying
+            sha256s = self._sha256s
+
+        distances = _header_distance(headers, values[:HEADER_LENGTH]).astype(np.int32)
+        candidates = np.flatnonzero(distances <= max_distance)
+        distances = distances[candidates] + _code_distance(codes[candidates], values[HEADER_LENGTH:])
+        keep = (distances > 0) & (distances <= max_distance)
+        candidates, distances = candidates[keep], distances[keep]
+
+        if len(candidates) > max_count:
+            closest = np.argpartition(distances, max_count - 1)[:max_count]
+            candidates, distances = candidates[closest], distances[closest]
+        order = np.lexsort((candidates, distances))
+        return [(sha256s[candidates[i]], int(distances[i])) for i in order]
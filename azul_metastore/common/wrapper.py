@@ -559,6 +559,19 @@ class Wrapper:
         with TimeAndLogCommand(sd, self.alias, searches, "msearch", **kwargs) as es:
             return es.msearch(index=self.alias, body=searches, max_concurrent_searches=1, **kwargs)
 
+    def msearch_limited(
+        self, sd: search_data.SearchData, searches: list[dict], *, max_concurrent_searches: int = 1, **kwargs
+    ):
+        """Perform multiple basic opensearch query, with security limits applied to each search as in search().
+
+        Opensearch runs at most max_concurrent_searches of the searches in parallel.
+        """
+        searches = [x if i % 2 == 0 else self._limit_search(sd, x) for i, x in enumerate(searches)]
+        with TimeAndLogCommand(sd, self.alias, searches, "msearch", **kwargs) as es:
+            return es.msearch(
+                index=self.alias, body=searches, max_concurrent_searches=max_concurrent_searches, **kwargs
+            )
+
     def scan(self, sd: search_data.SearchData, body: dict, **kwargs):
         """Return a scan helper for retrieving all matching documents."""
         body = self._limit_search(sd, body)
@@ -643,6 +656,7 @@ class Wrapper:
                         doc=source,
                         error_type=etype,
                         error_reason=ereason,
+                        doc_id=internal["_id"],
                     )
                 )
         return bad_raw_results
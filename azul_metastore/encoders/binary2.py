@@ -560,15 +560,18 @@ class Binary2(base_encoder.BaseIndexEncoder):
         return encoded_event
 
     @classmethod
-    def _apply_event_overrides(cls, event: dict, sha256) -> None:
-        """Mutate the input event overriding opensearch fields for routing and indexing."""
+    def index_extension(cls, sha256: str) -> str:
+        """Return the extension of the index that docs for the binary are partitioned into."""
         # first letter of id
-        index_extension = f".{sha256[0]}"
+        return f".{sha256[0]}"
 
+    @classmethod
+    def _apply_event_overrides(cls, event: dict, sha256) -> None:
+        """Mutate the input event overriding opensearch fields for routing and indexing."""
         overrides = {
             "_binary_index": True,
             "_routing": sha256,
-            "_index_extension": index_extension,
+            "_index_extension": cls.index_extension(sha256),
         }
         event.update(overrides)
 
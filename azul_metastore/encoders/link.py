@@ -0,0 +1,74 @@
+"""Encoder for parent-child links between binaries."""
+
+from __future__ import annotations
+
+import copy
+
+from azul_metastore.encoders import base_encoder, binary2
+
+# the subset of a binary2 'metadata' doc needed to describe a link
+map_link = {
+    "_routing": {"required": True},
+    "dynamic": "strict",
+    "properties": {
+        "security": {"type": "keyword"},
+        "encoded_security": base_encoder.get_security_mapping(),
+        "timestamp": {"type": "date"},
+        "action": {"type": "keyword"},
+        "author": binary2.map_common["author"],
+        # the child binary
+        "sha256": {"eager_global_ordinals": True, "type": "keyword"},
+        "file_format": {"type": "keyword"},
+        "size": {"type": "unsigned_long"},
+        **binary2.map_link,
+        # required to remove links alongside the submission they came from
+        "track_source_references": {"type": "keyword"},
+        "source": {
+            "properties": {
+                "name": {"type": "keyword"},
+                "timestamp": {"type": "date"},
+            },
+            "type": "object",
+        },
+    },
+}
+fields_link = [x for x in map_link["properties"].keys() if x != "encoded_security"]
+
+
+class Link(base_encoder.BaseIndexEncoder):
+    """Compact copy of the parent-child link held by binary2 'metadata' docs.
+
+    Docs share their id with the binary2 doc they were copied from and are routed by the parent sha256,
+    so the children of a binary can be found without aggregating over full binary2 docs.
+    """
+
+    docname = "link"
+    index_settings = {
+        "number_of_shards": 3,
+        "number_of_replicas": 2,
+        "refresh_interval": "30s",
+    }
+    mapping = map_link
+
+    @classmethod
+    def encode(cls, event: dict) -> dict:
+        """Encode from an encoded binary2 'metadata' doc that has a link to a parent."""
+        ret = {k: copy.deepcopy(event[k]) for k in fields_link if k in event and k != "source"}
+        ret["encoded_security"] = copy.deepcopy(event["encoded_security"])
+        ret["source"] = {"name": event["source"]["name"], "timestamp": event["source"]["timestamp"]}
+        ret["_id"] = event["_id"]
+        ret["_routing"] = event["parent"]["sha256"]
+        # partitioned the same as binary2, so links are aged off with the binary2 docs they were copied from
+        ret["_index_extension"] = binary2.Binary2.index_extension(event["sha256"])
+        return ret
+
+    @classmethod
+    def decode(cls, event: dict) -> dict:
+        """Remove derived properties."""
+        cls._decode_security(event)
+        return event
+
+    @classmethod
+    def has_link(cls, event: dict) -> bool:
+        """Return true if the encoded binary2 doc links a binary to a parent."""
+        return "track_link" in event
@@ -19,6 +19,7 @@ from azul_metastore.opensearch_config import (
     write_config_to_opensearch,
 )
 from azul_metastore.query import age_off as _age_off
+from azul_metastore.query.binary2 import binary_consistency
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +62,10 @@ def ingest_binary():
     """Ingest binary events from dispatcher."""
     start_prometheus_server()
     ctx = context.get_writer_context()
+    # links ingested before the link index existed must be in it before child lookups are correct
+    total = binary_consistency.ensure_links_indexed(ctx)
+    if total:
+        logger.info(f"copied {total} existing links to the link index")
     ing = ingestor.BinaryIngestor(ctx)
     ing.main()
 
@@ -200,6 +205,17 @@ def age_off(loop):
         time.sleep(60 * 60)
 
 
+@cli.command()
+def index_links():
+    """Copy parent-child links from binary2 into the link index again.
+
+    The binary ingestor does this once on startup, for binaries ingested before the link index existed.
+    """
+    ctx = context.get_writer_context()
+    total = binary_consistency.index_missing_links(ctx)
+    click.echo(f"indexed {total} links")
+
+
 cli.add_command(entry_purge.cli)
 
 
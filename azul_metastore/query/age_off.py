@@ -124,6 +124,8 @@ def _do_age_off_by_query_experimental() -> dict:
             },
         }
         deleted_doc_count[f"{alias}-submission-{source}"] = ctx.man.binary2.w.delete_loop(ctx.sd, body)
+        # links are copies of submission metadata, so are removed with it but not counted separately
+        ctx.man.link.w.delete_loop(ctx.sd, body)
 
     # ensure db is consistent
     deleted_doc_count[f"{alias}-other"] = binary_consistency.ensure_valid_binaries(ctx)
@@ -4,14 +4,17 @@ from __future__ import annotations
 
 from azul_bedrock import models_restapi
 
+from azul_metastore.common import search_query
 from azul_metastore.context import Context
 from azul_metastore.encoders import annotation
 
+# maximum number of tags returned for each binary when reading tags for many binaries
+MAX_TAGS_PER_BINARY = 100
 
-def read_binaries_tags(ctx: Context, eids: list[str]):
-    """Return tags for the supplied entities."""
-    eids = [x.lower() for x in eids]
-    body = {
+
+def _read_binaries_tags_body(eids: list[str]) -> dict:
+    """Return query for tags of the supplied entities, with tags limited per entity rather than overall."""
+    return {
         "query": {
             "bool": {
                 "filter": [
@@ -21,18 +24,33 @@ def read_binaries_tags(ctx: Context, eids: list[str]):
                 "must_not": [{"term": {"state": "disabled"}}],
             }
         },
-        "sort": ["tag"],
-        "size": 100,
+        "aggs": {
+            "SHA256": {
+                "terms": {"field": "sha256", "size": max(len(eids), 1)},
+                "aggs": {"TAGS": {"top_hits": {"sort": ["tag"], "size": MAX_TAGS_PER_BINARY}}},
+            }
+        },
+        "size": 0,
     }
-    resp = ctx.man.annotation.w.search(ctx.sd, body=body)
 
+
+def _read_binaries_tags_process(resp: dict, eids: list[str]) -> dict[str, list[dict]]:
+    """Return tags for each entity from a tags query response."""
     ret = {x: [] for x in eids}
-    for x in resp["hits"]["hits"]:
-        ann = annotation.Annotation.decode(x["_source"])
-        ret[x["_source"]["sha256"]].append(ann)
+    for bucket in resp["aggregations"]["SHA256"]["buckets"]:
+        for x in bucket["TAGS"]["hits"]["hits"]:
+            ann = annotation.Annotation.decode(x["_source"])
+            ret[x["_source"]["sha256"]].append(ann)
     return ret
 
 
+def read_binaries_tags(ctx: Context, eids: list[str]):
+    """Return tags for the supplied entities."""
+    eids = [x.lower() for x in eids]
+    resp = ctx.man.annotation.w.search(ctx.sd, body=_read_binaries_tags_body(eids))
+    return _read_binaries_tags_process(resp, eids)
+
+
 def read_binary_tags(ctx: Context, sha256: str) -> list[models_restapi.EntityTag]:
     """Return tags for the entity."""
     sha256 = sha256.lower()
@@ -124,6 +142,7 @@ def create_binary_tags(ctx: Context, owner: str, tags: list[dict]) -> None:
         tag["type"] = "entity_tag"
     # FUTURE normalise?, lowercase?
     ctx.man.annotation.w.wrap_and_index_docs(ctx.sd, [ctx.man.annotation.encode(x) for x in tags], refresh=True)
+    search_query.invalidate_tag_prefilter("entity_tag", [x["tag"] for x in tags if "tag" in x])
 
 
 def delete_binary_tag(ctx: Context, sha256: str, tag: str) -> models_restapi.AnnotationUpdated:
@@ -145,6 +164,7 @@ def delete_binary_tag(ctx: Context, sha256: str, tag: str) -> models_restapi.Ann
         },
         refresh=True,
     )
+    search_query.invalidate_tag_prefilter("entity_tag", [tag])
     return models_restapi.AnnotationUpdated(
         total=resp.get("total", 0), updated=resp.get("updated", 0), deleted=resp.get("deleted", 0)
     )
@@ -213,6 +233,7 @@ def create_feature_value_tags(ctx: Context, owner: str, tags: list[dict]) -> Non
         tag["tag"] = tag["tag"].lower()
     docs = [ctx.man.annotation.encode(x) for x in tags]
     ctx.man.annotation.w.wrap_and_index_docs(ctx.sd, docs, refresh=True)
+    search_query.invalidate_tag_prefilter("fv_tag", [x["tag"] for x in tags])
 
 
 def delete_feature_value_tag(ctx: Context, feature: str, value: str, tag: str):
@@ -234,6 +255,7 @@ def delete_feature_value_tag(ctx: Context, feature: str, value: str, tag: str):
         },
         refresh=True,
     )
+    search_query.invalidate_tag_prefilter("fv_tag", [tag])
 
 
 def add_feature_value_tags_legacy(ctx, features: list[models_restapi.ReadFeatureValuesValue]):
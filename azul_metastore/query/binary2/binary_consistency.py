@@ -6,6 +6,11 @@ from azul_bedrock import models_network as azm
 
 from azul_metastore import context
 from azul_metastore.common import utils
+from azul_metastore.encoders import link
+from azul_metastore.query import cache
+
+# cache entry recording that links held by binary2 docs have been copied to the link index
+LINK_BACKFILL = ("migration", "link_index", "1")
 
 
 def get_dispatcher_datastreams(ctx: context.Context, sha256: str) -> Iterable[tuple[str, azm.DataLabel, str]]:
@@ -109,6 +114,40 @@ def ensure_valid_binaries(ctx: context.Context) -> int:
     return parents + metadata
 
 
+def index_missing_links(ctx: context.Context) -> int:
+    """Copy the parent-child links of all binary2 docs into the link index.
+
+    Only needed for binary2 docs ingested before the link index existed, as the ingestor writes both.
+    Existing link docs are overwritten with the same content.
+
+    Returns the number of links indexed.
+    """
+    body = {
+        "_source": {"includes": link.fields_link + ["encoded_security"]},
+        "query": {"bool": {"filter": [{"exists": {"field": "track_link"}}]}},
+    }
+    total = 0
+    docs = ({**x["_source"], "_id": x["_id"]} for x in ctx.man.binary2.w.scan(ctx.sd, body))
+    for chunk in utils.chunker(docs, max_items=1000):
+        ctx.man.link.w.wrap_and_index_docs(ctx.sd, [link.Link.encode(x) for x in chunk])
+        total += len(chunk)
+    return total
+
+
+def ensure_links_indexed(ctx: context.Context) -> int:
+    """Copy existing links into the link index, unless this has already been done.
+
+    Child lookups read the link index, so links ingested before it existed must be copied before it is used.
+
+    Returns the number of links indexed.
+    """
+    if cache.load_generic(ctx, *LINK_BACKFILL) is not None:
+        return 0
+    total = index_missing_links(ctx)
+    cache.store_generic(ctx, *LINK_BACKFILL, data={"links": total})
+    return total
+
+
 class LinkReport:
     """Container for stats generated by ensure_valid_links."""
 
@@ -161,6 +200,8 @@ def ensure_valid_links(
         resp = ctx.man.binary2.w.search(ctx.sd, body)
         # any id we didn't see has been deleted
         deleted_parents = list(set(chunk).difference(x["_id"] for x in resp["hits"]["hits"]))
+        if not deleted_parents:
+            continue
         # find all children with parents in the set
         body = {
             "_source": "sha256",
@@ -171,6 +212,7 @@ def ensure_valid_links(
             },
         }
         # record child sha256 for every link we are about to delete from
+        # binary2 is scanned rather than the link index, as it holds links that were never copied to the link index
         for child in ctx.man.binary2.w.scan(ctx.sd, body):
             children_affected.add(child["_source"]["sha256"])
             yield child["_source"]["sha256"]
@@ -179,6 +221,8 @@ def ensure_valid_links(
         # FUTURE this could be a delete by id to prevent possible issue where data enters system after
         # the above scan and is deleted without being inspected.
         total_deleted += ctx.man.binary2.w.delete_loop(ctx.sd, body=body)
+        # remove the copies of the links too
+        ctx.man.link.w.delete_loop(ctx.sd, body=body)
 
     if not children_affected:
         # no child links were deleted so there is nothing more to process
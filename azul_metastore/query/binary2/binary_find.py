@@ -1,9 +1,11 @@
 """Queries for finding binaries."""
 
+import copy
 import itertools
+import json
 import logging
 import re
-from typing import Optional
+from typing import Iterator, Optional
 
 from azul_bedrock import exceptions_metastore
 from azul_bedrock.exception_enums import ExceptionCodeEnum
@@ -12,22 +14,60 @@ from azul_bedrock.models_restapi import AutocompleteContext
 from azul_bedrock.models_restapi import binaries as bedr_binaries
 from lark import UnexpectedInput
 
-from azul_metastore.common import search_query
+from azul_metastore.common import memcache, search_query, utils
 from azul_metastore.common.search_query import QueryExtraInfo, az_query_to_opensearch
 from azul_metastore.common.search_query_parser import parse
 from azul_metastore.context import Context
-from azul_metastore.query.annotation import read_binaries_tags
+from azul_metastore.query import annotation
+from azul_metastore.query.binary2 import binary_read
 
 logger = logging.getLogger(__name__)
 
+MAX_ALLOWED_BINARIES = 1000
+# number of binaries summarised by each search when summaries are deferred
+SUMMARY_CHUNK_SIZE = 100
+# number of summary searches opensearch may run in parallel from a single msearch
+SUMMARY_CHUNKS_PER_MSEARCH = 4
 
-def _summarise_hashes(
-    ctx: Context,
-    binaries: dict[str, dict],
-) -> None:
-    """Retrieve summary information for specific binaries."""
-    # begin constructing main search object
-    sha256s = [x for x in binaries.keys()]
+# binary summaries and the document count and newest doc timestamp at time of summarising
+# entries are checked for changed docs before use, ttl limits how long a missed change can be served for
+_summary_cache = memcache.get_ttl_cache("binary_find_summary", maxsize=10_000, ttl=600)
+
+
+def _summary_cache_key(ctx: Context, sha256: str) -> tuple:
+    """Return key for a cached binary summary, which depends on the users security and any security filters."""
+    return (
+        sha256,
+        ctx.get_user_security_unique(),
+        tuple(sorted(ctx.sd.security_exclude)),
+        tuple(sorted(ctx.sd.security_include)),
+    )
+
+
+def _summary_cache_lookup(ctx: Context, sha256s: list[str]) -> dict[str, tuple[dict, bedr_binaries.BinaryDocuments]]:
+    """Return cached summaries for the binaries, which have not yet been checked for changes."""
+    cached = {}
+    for sha256 in sha256s:
+        tmp = _summary_cache.get(_summary_cache_key(ctx, sha256))
+        if tmp:
+            cached[sha256] = tmp
+    return cached
+
+
+def _summarise_hashes_from_cache(ctx: Context, binaries: dict[str, dict]) -> list[str]:
+    """Add cached summaries to binaries where the binary documents have not changed since the summary was cached.
+
+    :return: sha256s that still need to be summarised
+    """
+    cached = _summary_cache_lookup(ctx, list(binaries.keys()))
+    unchanged = binary_read.get_binaries_unchanged(ctx, {k: v[1] for k, v in cached.items()})
+    for sha256 in unchanged:
+        binaries[sha256].update(copy.deepcopy(cached[sha256][0]))
+    return [x for x in binaries.keys() if x not in unchanged]
+
+
+def _summarise_hashes_body(sha256s: list[str]) -> dict:
+    """Return the aggregation used to summarise specific binaries."""
     # for deduplicating docs from each source.name
     # Sorting by filename, mime, magic to ensure they are present in the document.
     # sort by entity datastreams label if present, to proritise source info that has backing data
@@ -41,6 +81,8 @@ def _summarise_hashes(
             "SHA256": {
                 "terms": {"field": "sha256", "size": len(sha256s)},
                 "aggs": {
+                    # newest doc for the binary, so cached summaries can be checked for changes
+                    "NEWEST": {"max": {"field": "timestamp"}},
                     "SOURCE": {
                         "terms": {"field": "source.name", "size": 3},
                         "aggs": {
@@ -78,12 +120,31 @@ def _summarise_hashes(
                                 }
                             }
                         },
-                    }
+                    },
                 },
             }
         },
     }
-    resp = ctx.man.binary2.w.search(ctx.sd, body=body)
+    return body
+
+
+def _check_msearch_response(resp: dict) -> dict:
+    """Return the response of a single search from an msearch, raising if the search failed."""
+    if "error" in resp:
+        error = resp["error"]
+        reason = error.get("reason", str(error)) if isinstance(error, dict) else str(error)
+        raise ApiException(
+            status_code=resp.get("status", 500),
+            ref=f"binary search failed: {reason}",
+            internal=ExceptionCodeEnum.MetastoreFindBinaryInvalidSearch,
+            parameters={"inner_exception": reason},
+        )
+    return resp
+
+
+def _summarise_hashes_process(ctx: Context, resp: dict, binaries: dict[str, dict], sha256s: list[str]) -> None:
+    """Add summary information from a summary aggregation to the binaries and cache it."""
+    resp = _check_msearch_response(resp)
     for bsha256 in resp["aggregations"]["SHA256"]["buckets"]:
         sha256 = bsha256["key"]
         summaries = []
@@ -156,6 +217,10 @@ def _summarise_hashes(
                 ret.pop(k)
 
         binaries[sha256].update(ret)
+        _summary_cache[_summary_cache_key(ctx, sha256)] = (
+            copy.deepcopy(ret),
+            bedr_binaries.BinaryDocuments(count=bsha256["doc_count"], newest=bsha256["NEWEST"].get("value_as_string")),
+        )
 
     # for any binaries with no queryable records, record that we have no data for them
     for k in sha256s:
@@ -163,6 +228,87 @@ def _summarise_hashes(
             binaries[k] = {"exists": False, "has_content": False}
 
 
+def _summarise_hashes(
+    ctx: Context,
+    binaries: dict[str, dict],
+) -> None:
+    """Retrieve summary information for specific binaries."""
+    sha256s = _summarise_hashes_from_cache(ctx, binaries)
+    if not sha256s:
+        return
+    resp = ctx.man.binary2.w.search(ctx.sd, body=_summarise_hashes_body(sha256s))
+    _summarise_hashes_process(ctx, resp, binaries, sha256s)
+
+
+def _summarise_hashes_chunked(
+    ctx: Context,
+    binaries: dict[str, dict],
+    *,
+    chunk_size: int = SUMMARY_CHUNK_SIZE,
+    chunks_per_msearch: int = SUMMARY_CHUNKS_PER_MSEARCH,
+) -> Iterator[list[str]]:
+    """Retrieve summary information for specific binaries in batches.
+
+    Each msearch runs several batches in parallel, and the sha256s of each batch are yielded in order
+    as soon as their summary information has been added to binaries.
+    Binaries with cached summaries are batched the same way, but are not searched for.
+    """
+    uncached = set(_summarise_hashes_from_cache(ctx, binaries))
+    chunks = list(utils.chunker(list(binaries.keys()), chunk_size))
+    for i in range(0, len(chunks), chunks_per_msearch):
+        wave = chunks[i : i + chunks_per_msearch]
+        to_search = [[x for x in chunk if x in uncached] for chunk in wave]
+        searches = []
+        for chunk in to_search:
+            if chunk:
+                searches.append({"index": ctx.man.binary2.w.alias})
+                searches.append(_summarise_hashes_body(chunk))
+        responses = []
+        if searches:
+            allresp = ctx.man.binary2.w.msearch_limited(
+                ctx.sd, searches=searches, max_concurrent_searches=len(searches) // 2
+            )
+            responses = allresp["responses"]
+        for chunk, search in zip(wave, to_search, strict=True):
+            if search:
+                _summarise_hashes_process(ctx, responses.pop(0), binaries, search)
+            yield chunk
+
+
+def _enrich_binaries(ctx: Context, binaries: dict[str, dict]) -> dict[str, list]:
+    """Add summary information to the binaries and return the tags for each binary.
+
+    Tags, summaries and checks for changes to cached summaries are made with a single msearch.
+    Only cached summaries that turn out to have changed require an additional search.
+    """
+    sha256s = list(binaries.keys())
+    cached = _summary_cache_lookup(ctx, sha256s)
+    uncached = [x for x in sha256s if x not in cached]
+    documents = {k: v[1] for k, v in cached.items()}
+
+    searches = [{"index": ctx.man.annotation.w.alias}, annotation._read_binaries_tags_body(sha256s)]
+    if uncached:
+        searches += [{"index": ctx.man.binary2.w.alias}, _summarise_hashes_body(uncached)]
+    searches += binary_read._binaries_unchanged_searches(ctx, documents)
+    allresp = ctx.man.binary2.w.msearch_limited(
+        ctx.sd, searches=searches, max_concurrent_searches=SUMMARY_CHUNKS_PER_MSEARCH
+    )
+    responses = allresp["responses"]
+
+    tags = annotation._read_binaries_tags_process(_check_msearch_response(responses.pop(0)), sha256s)
+    if uncached:
+        _summarise_hashes_process(ctx, responses.pop(0), binaries, uncached)
+    unchanged = binary_read._binaries_unchanged_process(documents, responses)
+    for sha256 in unchanged:
+        binaries[sha256].update(copy.deepcopy(cached[sha256][0]))
+
+    changed = [x for x in cached.keys() if x not in unchanged]
+    if changed:
+        resp = ctx.man.binary2.w.search(ctx.sd, body=_summarise_hashes_body(changed))
+        _summarise_hashes_process(ctx, resp, binaries, changed)
+    return tags
+
+
 def _wrap_search_has_child(query: list[dict], include_highlights: bool) -> list:
     """Wraps a query in appropriate has_child query with highlighting."""
     counter = 0
@@ -210,32 +356,20 @@ def _wrap_search_has_child(query: list[dict], include_highlights: bool) -> list:
     return ret
 
 
-def find_binaries(
+def _search_binaries(
     ctx: Context,
     *,
-    sort: bedr_binaries.FindBinariesSortEnum = bedr_binaries.FindBinariesSortEnum.score,
-    sort_asc: bool = False,
-    term: Optional[str] = None,
-    hashes: Optional[list[str]] = None,
-    max_binaries: int = 100,
-    count_binaries: bool = False,
-) -> bedr_binaries.EntityFind:
-    """Search for entities matching specific criteria.
-
-    Due to structure of documents (1 doc per path per plugin per entity), its not possible to search across
-    the results of multiple plugins. i.e. entity WHERE feature 1 FROM plugin 1 AND feature 2 FROM plugin 2
-    Thus, all features, values and feature_values must be produced by a single author for this to work as expected.
-
-    :param ctx: query context object
-    :param sort: order of entities in results
-    :param sort_asc: sort in ascending order if true
-    :param term: An free text search in Azul's search syntax
-    :param hashes: list of binary hashes to search
-    :param max_binaries: limit resulting entities to this number
-    :param count_binaries: will count the total number of matching binaries if true
-    :return: dictionary with number of results and limited list of results
+    sort: bedr_binaries.FindBinariesSortEnum,
+    sort_asc: bool,
+    term: Optional[str],
+    hashes: Optional[list[str]],
+    max_binaries: int,
+    count_binaries: bool,
+) -> tuple[dict[str, dict], list[str], Optional[dict]]:
+    """Find the sha256s of binaries matching the search criteria, without any summary information.
+
+    :return: matching binaries in order with any highlights, normalised hashes and the raw opensearch response
     """
-    MAX_ALLOWED_BINARIES = 1000
     if max_binaries > MAX_ALLOWED_BINARIES:
         raise exceptions_metastore.InvalidSearchException(
             internal=ExceptionCodeEnum.MetastoreBinaryFindTooManyBinariesRequested,
@@ -378,18 +512,54 @@ def find_binaries(
                         # deduplicate unique highlights
                         hls[k] = list(set(hls[k]))
 
-    # perform query to enrich with summary info for binary
-    if binary_info:
-        _summarise_hashes(ctx, binary_info)
+    return binary_info, hashes_normal, resp
+
+
+def find_binaries(
+    ctx: Context,
+    *,
+    sort: bedr_binaries.FindBinariesSortEnum = bedr_binaries.FindBinariesSortEnum.score,
+    sort_asc: bool = False,
+    term: Optional[str] = None,
+    hashes: Optional[list[str]] = None,
+    max_binaries: int = 100,
+    count_binaries: bool = False,
+) -> bedr_binaries.EntityFind:
+    """Search for entities matching specific criteria.
+
+    Due to structure of documents (1 doc per path per plugin per entity), its not possible to search across
+    the results of multiple plugins. i.e. entity WHERE feature 1 FROM plugin 1 AND feature 2 FROM plugin 2
+    Thus, all features, values and feature_values must be produced by a single author for this to work as expected.
+
+    :param ctx: query context object
+    :param sort: order of entities in results
+    :param sort_asc: sort in ascending order if true
+    :param term: An free text search in Azul's search syntax
+    :param hashes: list of binary hashes to search
+    :param max_binaries: limit resulting entities to this number
+    :param count_binaries: will count the total number of matching binaries if true
+    :return: dictionary with number of results and limited list of results
+    """
+    binary_info, hashes_normal, resp = _search_binaries(
+        ctx,
+        sort=sort,
+        sort_asc=sort_asc,
+        term=term,
+        hashes=hashes,
+        max_binaries=max_binaries,
+        count_binaries=count_binaries,
+    )
+
+    # perform query to enrich with summary info and tags for binary
+    tags = _enrich_binaries(ctx, binary_info) if binary_info else {}
 
     # remove entities that couldn't be summarised
     # the has_child query doesn't filter with user-supplied 'security_exclude' so this is necessary
     binary_info = {x: y for (x, y) in binary_info.items() if "exists" in y}
 
     # add binary tags to results
-    tags = read_binaries_tags(ctx, list(binary_info.keys()))
     for k, v in tags.items():
-        if not v:
+        if not v or k not in binary_info:
             continue
         binary_info[k]["tags"] = v
 
@@ -452,6 +622,67 @@ def find_binaries(
     return bedr_binaries.EntityFind(**ret)
 
 
+def find_binaries_deferred(
+    ctx: Context,
+    *,
+    sort: bedr_binaries.FindBinariesSortEnum = bedr_binaries.FindBinariesSortEnum.score,
+    sort_asc: bool = False,
+    term: Optional[str] = None,
+    max_binaries: int = 100,
+    count_binaries: bool = False,
+) -> Iterator[str]:
+    """Search for entities matching specific criteria, returning summary information as it becomes available.
+
+    Performs the same search as find_binaries, but rather than waiting for all binaries to be summarised
+    this returns newline delimited json, with the first row containing the ordered sha256s of all matching binaries.
+
+    Following rows contain summary information for batches of those binaries as each batch completes.
+    Binaries that could not be summarised (i.e. filtered by security) are listed as 'removed' in these rows.
+
+    The search is performed before returning, so invalid searches raise immediately.
+
+    :param ctx: query context object
+    :param sort: order of entities in results
+    :param sort_asc: sort in ascending order if true
+    :param term: An free text search in Azul's search syntax
+    :param max_binaries: limit resulting entities to this number
+    :param count_binaries: will count the total number of matching binaries if true
+    :return: generator of json lines
+    """
+    binary_info, _hashes_normal, resp = _search_binaries(
+        ctx,
+        sort=sort,
+        sort_asc=sort_asc,
+        term=term,
+        hashes=None,
+        max_binaries=max_binaries,
+        count_binaries=count_binaries,
+    )
+    first: dict = {"type": "binaries", "sha256s": list(binary_info.keys())}
+    if count_binaries and resp:
+        first["items_count"] = resp["hits"]["total"]["value"]
+
+    def _generate() -> Iterator[str]:
+        yield json.dumps(first) + "\n"
+        for chunk in _summarise_hashes_chunked(ctx, binary_info):
+            tags = annotation.read_binaries_tags(ctx, chunk)
+            items = []
+            removed = []
+            for sha256 in chunk:
+                tmp = binary_info[sha256]
+                # the has_child query doesn't filter with user-supplied 'security_exclude' so this is necessary
+                if "exists" not in tmp:
+                    removed.append(sha256)
+                    continue
+                if tags.get(sha256):
+                    tmp["tags"] = tags[sha256]
+                tmp["key"] = sha256
+                items.append(bedr_binaries.EntityFindItem(**tmp).model_dump(mode="json", exclude_none=True))
+            yield json.dumps({"type": "summaries", "items": items, "removed": removed}) + "\n"
+
+    return _generate()
+
+
 def generate_autocomplete(input: str, offset: int) -> AutocompleteContext:
     """Determines what should be autocompleted based on the current user input state."""
     return search_query.generate_autocomplete(input, offset)
@@ -2,7 +2,7 @@
 
 import json
 import logging
-from typing import Optional
+from typing import Iterator, Optional
 
 from azul_bedrock import models_restapi
 from azul_bedrock.exception_enums import ExceptionCodeEnum
@@ -13,11 +13,49 @@ from azul_metastore.common.search_query import az_query_to_opensearch
 from azul_metastore.common.search_query_parser import parse
 from azul_metastore.context import Context
 from azul_metastore.encoders import binary2
-from azul_metastore.query.binary2.binary_find import _wrap_search_has_child
+from azul_metastore.query.binary2.binary_find import _summarise_hashes, _wrap_search_has_child
 
 logger = logging.getLogger(__name__)
 
 
+def _find_all_binaries_body(ctx: Context, *, term: Optional[str], num_binaries: int) -> dict:
+    """Return the composite aggregation search used to page through all binaries matching a term."""
+    body: dict = {
+        "query": {
+            "bool": {
+                "filter": [{"has_child": {"type": "metadata", "query": {"exists": {"field": "source.name"}}}}],
+                "should": [],
+            }
+        },
+        "size": 0,
+        "aggs": {
+            "COMPOSITE": {
+                "composite": {
+                    "size": num_binaries,
+                    "sources": [{"SHA256": {"terms": {"field": "_id"}}}],
+                }
+            }
+        },
+    }
+
+    if term is not None:
+        # Transform an Azul free-text search expression to an OpenSearch query
+        try:
+            parse_ast = parse(term)
+        except UnexpectedInput as e:
+            raise ApiException(
+                status_code=400,
+                internal=ExceptionCodeEnum.MetastoreFailedToParseTermQuery,
+                parameters={"inner_exception": str(e)},
+            ) from None
+
+        if parse_ast is not None:
+            result, _extra_info = az_query_to_opensearch(ctx, parse_ast)
+            result = _wrap_search_has_child([result], include_highlights=False)
+            body["query"]["bool"]["filter"] = result
+    return body
+
+
 def find_all_binaries(
     ctx: Context,
     *,
@@ -46,23 +84,7 @@ def find_all_binaries(
     # FUTURE could use PIT point-in-time to stabilise these results.
     #  Right now, if new docs enter the system after the first search, they may
     #  be included in results depending on timing.
-    body: dict = {
-        "query": {
-            "bool": {
-                "filter": [{"has_child": {"type": "metadata", "query": {"exists": {"field": "source.name"}}}}],
-                "should": [],
-            }
-        },
-        "size": 0,
-        "aggs": {
-            "COMPOSITE": {
-                "composite": {
-                    "size": num_binaries,
-                    "sources": [{"SHA256": {"terms": {"field": "_id"}}}],
-                }
-            }
-        },
-    }
+    body = _find_all_binaries_body(ctx, term=term, num_binaries=num_binaries)
     if after:
         try:
             json_loaded_after = json.loads(after)
@@ -76,22 +98,6 @@ def find_all_binaries(
         # first request so count expected number of records
         body["aggs"]["TOTAL"] = {"cardinality": {"field": "_id", "precision_threshold": 1000}}  # ty:ignore[invalid-assignment]
 
-    if term is not None:
-        # Transform an Azul free-text search expression to an OpenSearch query
-        try:
-            parse_ast = parse(term)
-        except UnexpectedInput as e:
-            raise ApiException(
-                status_code=400,
-                internal=ExceptionCodeEnum.MetastoreFailedToParseTermQuery,
-                parameters={"inner_exception": str(e)},
-            ) from None
-
-        if parse_ast is not None:
-            result, _extra_info = az_query_to_opensearch(ctx, parse_ast)
-            result = _wrap_search_has_child([result], include_highlights=False)
-            body["query"]["bool"]["filter"] = result
-
     # perform search
     resp = ctx.man.binary2.w.search(ctx.sd, body=body)
     after = resp["aggregations"]["COMPOSITE"].get("after_key", None)
@@ -115,6 +121,59 @@ def find_all_binaries(
     return ret
 
 
+def stream_all_binaries(
+    ctx: Context,
+    *,
+    term: Optional[str] = None,
+    page_size: int = 1000,
+    include_summary: bool = False,
+) -> Iterator[str]:
+    """Return a generator of newline delimited json for every binary matching the criteria.
+
+    Uses the same query as find_all_binaries but pages through the composite aggregation internally,
+    so callers can recall very large result sets with a single request.
+
+    The search term is parsed before the generator is returned, so invalid terms raise immediately
+    rather than part way through a response.
+
+    :param ctx: query context object
+    :param term: An free text search in Azul's search syntax
+    :param page_size: Number of binary sha256s to retrieve from opensearch per page
+    :param include_summary: Also include summary information (hashes, file format, sources) for each binary
+
+    :return: generator of json lines, one per binary
+    """
+    body = _find_all_binaries_body(ctx, term=term, num_binaries=page_size)
+
+    def _generate() -> Iterator[str]:
+        while True:
+            # opensearch is only queried for the next page once the previous page has been consumed
+            resp = ctx.man.binary2.w.search(ctx.sd, body=body)
+            buckets = resp["aggregations"]["COMPOSITE"]["buckets"]
+            if not buckets:
+                return
+            sha256s = [row["key"]["SHA256"] for row in buckets]
+            if include_summary:
+                binary_info = {x: {} for x in sha256s}
+                _summarise_hashes(ctx, binary_info)
+                for sha256 in sha256s:
+                    summary = binary_info[sha256]
+                    # the has_child query doesn't filter with user-supplied 'security_exclude' so this is necessary
+                    if not summary.get("exists"):
+                        continue
+                    yield json.dumps({"sha256": sha256, **summary}) + "\n"
+            else:
+                for sha256 in sha256s:
+                    yield json.dumps({"sha256": sha256}) + "\n"
+
+            after = resp["aggregations"]["COMPOSITE"].get("after_key", None)
+            if not after:
+                return
+            body["aggs"]["COMPOSITE"]["composite"]["after"] = after
+
+    return _generate()
+
+
 def find_all_family_binaries(
     ctx: Context,
     sha256: str,
@@ -194,7 +253,9 @@ def find_all_family_binaries(
         body["aggs"]["TOTAL"] = {"cardinality": {"field": sha256_field, "precision_threshold": 1000}}  # ty:ignore[invalid-assignment]
 
     # perform search
-    resp = ctx.man.binary2.w.search(ctx.sd, body=body)
+    # links are routed by parent so finding children only searches a single shard
+    kwargs = {} if is_parent else {"routing": sha256}
+    resp = ctx.man.link.w.search(ctx.sd, body=body, **kwargs)
     after = resp["aggregations"]["FAMILY"].get("after_key", None)
     if after:
         after = json.dumps(after)
@@ -1,5 +1,6 @@
 """Queries for reading various information about binaries that doesn't fit elsewhere."""
 
+import asyncio
 import contextlib
 
 from azul_bedrock import exceptions_bedrock
@@ -10,6 +11,14 @@ from azul_bedrock.models_restapi import binaries as bedr_binaries
 
 from azul_metastore.context import Context
 
+# Size 10 was chosen to account for cases where a stream may have aged off and have multiple sources.
+# In theory size 1 should be enough but if a binary aged off in the dispatcher S3 store and hadn't aged-off in
+# opensearch, this size allows for other source/labels to be search for an older sourcing event that still has
+# the file.
+MAX_STREAM_REFERENCE_DOCS = 10
+# maximum number of dispatcher requests made at once when checking that streams exist
+MAX_CONCURRENT_STREAM_CHECKS = 10
+
 
 def get_total_binary_count(ctx: Context) -> int:
     """Return number of binaries in the system."""
@@ -46,30 +55,47 @@ def verify_stream_exists(
     return True, results[0][0], results[0][1]
 
 
-def _find_stream_references(ctx: Context, sha256: str) -> list[tuple[str, azm.DataLabel]]:
-    """Return a list of unique sources and labels associated with a sha256."""
-    if not sha256:
-        raise BaseAzulException(internal=ExceptionCodeEnum.MetastoreSha256NotProvidedForFindingStreamRefs)
-    sha256 = sha256.lower()
-    # Search any metadata to find the datastream source/label references
-    body: dict[
-        str, int | dict[str, dict[str, list[dict[str, dict[str, str]]]]] | list[dict[str, dict[str, str]]] | list[str]
-    ] = {
-        # Size 10 was chosen to account for cases where a stream may have aged off and have multiple sources.
-        # In theory size 1 should be enough but if a binary aged off in the dispatcher S3 store and hadn't aged-off in
-        # opensearch, this size allows for other source/labels to be search for an older sourcing event that still has
-        # the file.
-        "size": 10,
-        "query": {"bool": {"filter": [{"term": {"datastreams.sha256": sha256}}]}},
-        "sort": [{"timestamp": {"order": "desc"}}],
-        "_source": ["source.name", "datastreams.label", "datastreams.sha256"],
-    }
-    resp = ctx.man.binary2.w.complex_search(ctx.sd, body=body)
-    hits = resp.get("hits", {}).get("hits", [])
+async def async_verify_streams_exist(
+    ctx: Context, sha256s: list[str], is_check_stream_in_dispatcher=True
+) -> dict[str, tuple[bool, str, azm.DataLabel]]:
+    """Return the result of verify_stream_exists for each sha256, keyed by the sha256 as supplied.
+
+    Stream references for all sha256s are found with a single search, and the dispatcher is then checked for
+    many streams at once.
+    """
+    lowered = sorted({x.lower() for x in sha256s})
+    # opensearch and dispatcher clients are blocking so are run outside the event loop
+    references = await asyncio.to_thread(_find_stream_references_bulk, ctx, lowered)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_STREAM_CHECKS)
+
+    async def _has_binary(source: str, label: azm.DataLabel, sha256: str) -> bool:
+        async with semaphore:
+            try:
+                await asyncio.to_thread(ctx.dispatcher.has_binary, source=source, label=label, sha256=sha256)
+            except ApiException:
+                return False
+            return True
+
+    async def _verify(sha256: str) -> tuple[bool, str, azm.DataLabel]:
+        results = references.get(sha256, [])
+        if len(results) == 0:
+            return False, "", azm.DataLabel.TEST
+        if not is_check_stream_in_dispatcher:
+            return True, results[0][0], results[0][1]
+        # check every label at once but keep the first that exists
+        found = await asyncio.gather(*(_has_binary(source, label, sha256) for source, label in results))
+        for (source, label), exists in zip(results, found, strict=True):
+            if exists:
+                return True, source, label
+        return False, "", azm.DataLabel.TEST
+
+    verified = dict(zip(lowered, await asyncio.gather(*(_verify(x) for x in lowered)), strict=True))
+    return {x: verified[x.lower()] for x in sha256s}
+
 
+def _stream_references_from_hits(hits: list[dict], sha256: str) -> list[tuple[str, azm.DataLabel]]:
+    """Return a list of unique sources and labels for the sha256 in the datastreams of the hits."""
     results: set[tuple[str, azm.DataLabel]] = set()
-    if len(hits) == 0:
-        return []
     for h in hits:
         h_source: dict = h.get("_source")
 
@@ -91,6 +117,55 @@ def _find_stream_references(ctx: Context, sha256: str) -> list[tuple[str, azm.Da
     return list(results)
 
 
+def _find_stream_references(ctx: Context, sha256: str) -> list[tuple[str, azm.DataLabel]]:
+    """Return a list of unique sources and labels associated with a sha256."""
+    if not sha256:
+        raise BaseAzulException(internal=ExceptionCodeEnum.MetastoreSha256NotProvidedForFindingStreamRefs)
+    sha256 = sha256.lower()
+    # Search any metadata to find the datastream source/label references
+    body: dict[
+        str, int | dict[str, dict[str, list[dict[str, dict[str, str]]]]] | list[dict[str, dict[str, str]]] | list[str]
+    ] = {
+        "size": MAX_STREAM_REFERENCE_DOCS,
+        "query": {"bool": {"filter": [{"term": {"datastreams.sha256": sha256}}]}},
+        "sort": [{"timestamp": {"order": "desc"}}],
+        "_source": ["source.name", "datastreams.label", "datastreams.sha256"],
+    }
+    resp = ctx.man.binary2.w.complex_search(ctx.sd, body=body)
+    hits = resp.get("hits", {}).get("hits", [])
+    return _stream_references_from_hits(hits, sha256)
+
+
+def _find_stream_references_bulk(ctx: Context, sha256s: list[str]) -> dict[str, list[tuple[str, azm.DataLabel]]]:
+    """Return the unique sources and labels associated with each of the lowercase sha256s."""
+    if not sha256s:
+        return {}
+    # same docs as _find_stream_references for each sha256, with one search
+    body = {
+        "size": 0,
+        "query": {"bool": {"filter": [{"terms": {"datastreams.sha256": sha256s}}]}},
+        "aggs": {
+            "STREAMS": {
+                "terms": {"field": "datastreams.sha256", "include": sha256s, "size": len(sha256s)},
+                "aggs": {
+                    "HITS": {
+                        "top_hits": {
+                            "size": MAX_STREAM_REFERENCE_DOCS,
+                            "sort": [{"timestamp": {"order": "desc"}}],
+                            "_source": ["source.name", "datastreams.label", "datastreams.sha256"],
+                        }
+                    }
+                },
+            }
+        },
+    }
+    resp = ctx.man.binary2.w.complex_search(ctx.sd, body=body)
+    return {
+        bucket["key"]: _stream_references_from_hits(bucket["HITS"]["hits"]["hits"], bucket["key"])
+        for bucket in resp["aggregations"]["STREAMS"]["buckets"]
+    }
+
+
 def find_stream_metadata(ctx: Context, sha256: str, stream_hash: str) -> tuple[str | None, azm.Datastream | None]:
     """Return exemplar stream metadata and an exemplar source for the specified entity id.
 
@@ -182,11 +257,10 @@ def get_author_stats(ctx: Context, name: str, version: str) -> int:
     return aggs["entities"]["value"]
 
 
-def get_binary_newer(ctx: Context, sha256: str, timestamp: str) -> bedr_binaries.BinaryDocuments:
-    """Return true if there is data available for the entity newer than the supplied timestamp."""
-    sha256 = sha256.lower()
+def _binary_newer_body(sha256: str, timestamp: str) -> dict:
+    """Return query for docs of the binary newer than the supplied timestamp."""
     # this query must match the equivalent part of read()
-    body = {
+    return {
         "query": {
             "bool": {
                 "filter": [
@@ -198,6 +272,12 @@ def get_binary_newer(ctx: Context, sha256: str, timestamp: str) -> bedr_binaries
         "size": 0,
         "aggs": {"NEWEST": {"max": {"field": "timestamp"}}},
     }
+
+
+def get_binary_newer(ctx: Context, sha256: str, timestamp: str) -> bedr_binaries.BinaryDocuments:
+    """Return true if there is data available for the entity newer than the supplied timestamp."""
+    sha256 = sha256.lower()
+    body = _binary_newer_body(sha256, timestamp)
     resp = ctx.man.binary2.w.search(ctx.sd, body=body, routing=sha256)
     ret = bedr_binaries.BinaryDocuments(count=0, newest=None)
     if resp["aggregations"]["NEWEST"]["value"]:
@@ -205,3 +285,49 @@ def get_binary_newer(ctx: Context, sha256: str, timestamp: str) -> bedr_binaries
             count=resp["hits"]["total"]["value"], newest=resp["aggregations"]["NEWEST"]["value_as_string"]
         )
     return ret
+
+
+def _binaries_unchanged_searches(ctx: Context, documents: dict[str, bedr_binaries.BinaryDocuments]) -> list[dict]:
+    """Return msearch rows that check whether each binary has the supplied document count and newest timestamp."""
+    searches = []
+    for sha256 in documents.keys():
+        # route to the shard holding the binary
+        searches.append({"index": ctx.man.binary2.w.alias, "routing": sha256})
+        searches.append(
+            {
+                "query": {"bool": {"filter": [{"term": {"sha256": sha256}}]}},
+                "size": 0,
+                "track_total_hits": True,
+                "aggs": {"NEWEST": {"max": {"field": "timestamp"}}},
+            }
+        )
+    return searches
+
+
+def _binaries_unchanged_process(
+    documents: dict[str, bedr_binaries.BinaryDocuments], responses: list[dict]
+) -> set[str]:
+    """Return the sha256s that are unchanged, from the msearch responses of _binaries_unchanged_searches."""
+    ret = set()
+    for (sha256, docs), resp in zip(documents.items(), responses, strict=True):
+        # treat failed searches as changed so the caller recalculates
+        if "error" in resp:
+            continue
+        if (
+            resp["hits"]["total"]["value"] == docs.count
+            and resp["aggregations"]["NEWEST"].get("value_as_string") == docs.newest
+        ):
+            ret.add(sha256)
+    return ret
+
+
+def get_binaries_unchanged(ctx: Context, documents: dict[str, bedr_binaries.BinaryDocuments]) -> set[str]:
+    """Return the sha256s where the document count and newest timestamp still match the supplied values.
+
+    All binaries are checked with a single msearch.
+    Comparing the count as well as the newest timestamp catches docs that were added out of order or deleted.
+    """
+    if not documents:
+        return set()
+    allresp = ctx.man.binary2.w.msearch_limited(ctx.sd, searches=_binaries_unchanged_searches(ctx, documents))
+    return _binaries_unchanged_process(documents, allresp["responses"])
@@ -1,5 +1,6 @@
 """Queries for reading relationships between binaries."""
 
+import copy
 import logging
 
 from azul_bedrock import models_network as azm
@@ -7,11 +8,22 @@ from azul_bedrock import models_restapi
 from azul_bedrock.models_restapi import PathNode
 from azul_bedrock.models_restapi import binaries as bedr_binaries
 
+from azul_metastore.common import memcache
 from azul_metastore.context import Context
 from azul_metastore.encoders import binary2
 
 logger = logging.getLogger(__name__)
 
+# directions that links can be followed from a binary
+CHILDREN = "children"
+PARENTS = "parents"
+
+# actions of docs that link a binary to its parent
+_LINK_ACTIONS = [azm.BinaryAction.Sourced, azm.BinaryAction.Extracted, azm.BinaryAction.Mapped]
+
+# parent or child links of a binary, with the count and newest timestamp of the docs they were found in
+_nearby_cache = memcache.get_ttl_cache("binary_related_nearby", maxsize=10_000, ttl=600)
+
 
 def read_children(ctx: Context, sha256: str, detail: bool = False, bucket_size=100) -> list[bedr_binaries.PathNode]:
     """Return binary_link information about a specific binary."""
@@ -48,7 +60,8 @@ def read_children(ctx: Context, sha256: str, detail: bool = False, bucket_size=1
             },
         },
     }
-    resp = ctx.man.binary2.w.search(ctx.sd, body=body)
+    # links are routed by parent so only a single shard is searched
+    resp = ctx.man.link.w.search(ctx.sd, body=body, routing=sha256)
     children = []
     for bucket in resp["aggregations"]["CHILDREN"]["buckets"]:
         row = bucket["HITS"]["hits"]["hits"][0]["_source"]
@@ -70,15 +83,7 @@ def _read_nearby_find_children(sha256s: set[str], index_alias: str, max_nodes: i
         "query": {
             "bool": {
                 "filter": [
-                    {
-                        "terms": {
-                            "action": [
-                                azm.BinaryAction.Sourced,
-                                azm.BinaryAction.Extracted,
-                                azm.BinaryAction.Mapped,
-                            ]
-                        }
-                    },
+                    {"terms": {"action": _LINK_ACTIONS}},
                     # get child documents - matching parent sha256
                     {"terms": {"parent.sha256": sha256s_list}},
                 ],
@@ -89,6 +94,8 @@ def _read_nearby_find_children(sha256s: set[str], index_alias: str, max_nodes: i
             "RELATED": {
                 "terms": {"field": "parent.sha256", "size": len(sha256s_list)},
                 "aggs": {
+                    # for checking if cached links have changed
+                    "NEWEST": {"max": {"field": "timestamp"}},
                     # group by child sha256
                     "RELATED": {
                         "terms": {"field": "sha256", "size": max_nodes},
@@ -103,7 +110,7 @@ def _read_nearby_find_children(sha256s: set[str], index_alias: str, max_nodes: i
                                 }
                             }
                         },
-                    }
+                    },
                 },
             }
         },
@@ -125,15 +132,7 @@ def _read_nearby_find_parents(sha256s: set[str], index_alias: str, max_nodes: in
             "bool": {
                 "filter": [
                     # ensure doc has a source
-                    {
-                        "terms": {
-                            "action": [
-                                azm.BinaryAction.Sourced,
-                                azm.BinaryAction.Extracted,
-                                azm.BinaryAction.Mapped,
-                            ]
-                        }
-                    },
+                    {"terms": {"action": _LINK_ACTIONS}},
                     # get child documents - matching sha256
                     {"terms": {"sha256": sha256s_list}},
                 ],
@@ -144,6 +143,8 @@ def _read_nearby_find_parents(sha256s: set[str], index_alias: str, max_nodes: in
             "RELATED": {
                 "terms": {"field": "sha256", "size": len(sha256s_list)},
                 "aggs": {
+                    # for checking if cached links have changed
+                    "NEWEST": {"max": {"field": "timestamp"}},
                     # group by parent sha256
                     "RELATED": {
                         "terms": {"field": "parent.sha256", "size": max_nodes},
@@ -188,6 +189,127 @@ def _read_nearby_find_parents(sha256s: set[str], index_alias: str, max_nodes: in
     return queries
 
 
+def _read_nearby_newest_body(direction: str, sha256s: list[str]) -> dict:
+    """Return a query for the count and newest timestamp of the docs linking each binary in the direction."""
+    field = "parent.sha256" if direction == CHILDREN else "sha256"
+    return {
+        "size": 0,
+        "query": {"bool": {"filter": [{"terms": {"action": _LINK_ACTIONS}}, {"terms": {field: sha256s}}]}},
+        "aggs": {
+            "RELATED": {
+                "terms": {"field": field, "size": len(sha256s)},
+                "aggs": {"NEWEST": {"max": {"field": "timestamp"}}},
+            }
+        },
+    }
+
+
+def _nearby_cache_key(ctx: Context, direction: str, sha256: str, max_nodes: int) -> tuple:
+    """Return key for cached links, which depend on the users security and any security filters."""
+    return (
+        direction,
+        sha256,
+        max_nodes,
+        ctx.get_user_security_unique(),
+        tuple(sorted(ctx.sd.security_exclude)),
+        tuple(sorted(ctx.sd.security_include)),
+    )
+
+
+def _nearby_cache_store(ctx: Context, direction: str, sha256s: set[str], max_nodes: int, resp: dict) -> list[dict]:
+    """Cache the link buckets for each binary from a response, returning the buckets."""
+    buckets = resp["aggregations"]["RELATED"]["buckets"]
+    missing = set(sha256s)
+    for bucket in buckets:
+        missing.discard(bucket["key"])
+        _nearby_cache[_nearby_cache_key(ctx, direction, bucket["key"], max_nodes)] = (
+            copy.deepcopy(bucket),
+            bucket["doc_count"],
+            bucket["NEWEST"].get("value_as_string"),
+        )
+    # binaries without links are cached too, so they aren't searched for every time they are in the frontier
+    for sha256 in missing:
+        _nearby_cache[_nearby_cache_key(ctx, direction, sha256, max_nodes)] = (None, 0, None)
+    return buckets
+
+
+def _read_nearby_search(ctx: Context, lookups: list[tuple[str, set[str], int]]) -> dict:
+    """Return the links in each direction for the binaries in the lookups of (direction, sha256s, max_nodes).
+
+    Links for each binary are cached and shared with other users with the same security.
+    Cached links are only searched for again if the count or newest timestamp of the docs they were found in
+    has changed, which is checked with a cheaper aggregation.
+
+    Returns a response in the same format as a msearch of _read_nearby_find_children and _read_nearby_find_parents.
+    """
+    finders = {CHILDREN: _read_nearby_find_children, PARENTS: _read_nearby_find_parents}
+    alias = ctx.man.binary2.w.alias
+    lookup_buckets: list[list[dict]] = [[] for _ in lookups]
+    errors = []
+
+    def _fetch(fetches: list[tuple[int, set[str]]], checks: list[tuple[int, dict[str, tuple]]]) -> list[tuple]:
+        """Search for the links of uncached binaries and check cached links, returning the stale lookups."""
+        searches = []
+        for i, sha256s in fetches:
+            direction, _, max_nodes = lookups[i]
+            searches += finders[direction](sha256s, alias, max_nodes=max_nodes)
+        for i, found in checks:
+            searches += [{"index": alias}, _read_nearby_newest_body(lookups[i][0], list(found))]
+        if not searches:
+            return []
+        responses = iter(ctx.man.binary2.w.msearch(ctx.sd, searches=searches)["responses"])
+
+        for i, sha256s in fetches:
+            resp = next(responses)
+            if "error" in resp:
+                errors.append(resp)
+                continue
+            direction, _, max_nodes = lookups[i]
+            lookup_buckets[i] += _nearby_cache_store(ctx, direction, sha256s, max_nodes, resp)
+
+        stale = []
+        for i, found in checks:
+            resp = next(responses)
+            current = {}
+            # treat failed searches as changed so the links are searched for again
+            if "error" not in resp:
+                for bucket in resp["aggregations"]["RELATED"]["buckets"]:
+                    current[bucket["key"]] = (bucket["doc_count"], bucket["NEWEST"].get("value_as_string"))
+            changed = set()
+            for sha256, (bucket, count, newest) in found.items():
+                if "error" in resp or current.get(sha256, (0, None)) != (count, newest):
+                    changed.add(sha256)
+                elif bucket:
+                    lookup_buckets[i].append(copy.deepcopy(bucket))
+            if changed:
+                stale.append((i, changed))
+        return stale
+
+    fetches = []
+    checks = []
+    for i, (direction, sha256s, max_nodes) in enumerate(lookups):
+        found = {}
+        for sha256 in sha256s:
+            entry = _nearby_cache.get(_nearby_cache_key(ctx, direction, sha256, max_nodes))
+            if entry:
+                found[sha256] = entry
+        if len(found) < len(sha256s):
+            fetches.append((i, sha256s - found.keys()))
+        if found:
+            checks.append((i, found))
+    stale = _fetch(fetches, checks)
+    if stale:
+        _fetch(stale, [])
+
+    responses = []
+    for buckets in lookup_buckets:
+        # keep the order of a terms aggregation
+        buckets.sort(key=lambda x: (-x["doc_count"], x["key"]))
+        responses.append({"aggregations": {"RELATED": {"buckets": buckets}}})
+    # failed searches raise when processed
+    return {"responses": responses + errors}
+
+
 def _read_nearby_process_resp(
     resp: dict, in_parents: set[str], in_children: set[str]
 ) -> tuple[dict[str, models_restapi.ReadNearbyLink], set[str], set[str], set[str]]:
@@ -281,9 +403,7 @@ def read_nearby(
     """
     sha256 = sha256.lower()
     # Do an initial search for all children and parents for the starting node.
-    searches = _read_nearby_find_children({sha256}, ctx.man.binary2.w.alias, max_nodes=30)
-    searches += _read_nearby_find_parents({sha256}, ctx.man.binary2.w.alias, max_nodes=30)
-    resp = ctx.man.binary2.w.msearch(ctx.sd, searches=searches)
+    resp = _read_nearby_search(ctx, [(CHILDREN, {sha256}, 30), (PARENTS, {sha256}, 30)])
     unique_links, parents, children, cousins = _read_nearby_process_resp(
         resp, in_parents={sha256}, in_children={sha256}
     )
@@ -305,8 +425,10 @@ def read_nearby(
         elif len(unique_links) > 500:
             # prevent exponential growth
             max_nodes_per_iteration = 1
-        searches = _read_nearby_find_children(children, ctx.man.binary2.w.alias, max_nodes=max_nodes_per_iteration)
-        searches += _read_nearby_find_parents(parents, ctx.man.binary2.w.alias, max_nodes=max_nodes_per_iteration)
+        lookups = [
+            (CHILDREN, children, max_nodes_per_iteration),
+            (PARENTS, parents, max_nodes_per_iteration),
+        ]
         # Search for children's parents, parents children, at various depths.
         is_check_for_cousins = (
             include_cousins and len(seen_cousins) < max_cousins and current_iterations <= max_cousin_distance
@@ -315,17 +437,19 @@ def read_nearby(
         # Because is_check_for_cousins is false it's safe to exit
         # Note - This covers the edge case where is_check_for_cousins was true last iteration and false this iteration
         # of the loop. Which can happen due to max_cousins being too large or max_cousin_distance being too large.
-        if not is_check_for_cousins and len(searches) == 0:
+        if not is_check_for_cousins and not children and not parents:
             break
         if is_check_for_cousins:
-            # find parents of children and children of parents (new cousins)
-            searches += _read_nearby_find_children(parents, ctx.man.binary2.w.alias, max_nodes=max_nodes_per_iteration)
-            searches += _read_nearby_find_parents(children, ctx.man.binary2.w.alias, max_nodes=max_nodes_per_iteration)
-            # extend known cousins
-            searches += _read_nearby_find_children(cousins, ctx.man.binary2.w.alias, max_nodes=max_nodes_per_iteration)
-            searches += _read_nearby_find_parents(cousins, ctx.man.binary2.w.alias, max_nodes=max_nodes_per_iteration)
-
-        resp = ctx.man.binary2.w.msearch(ctx.sd, searches=searches)
+            lookups += [
+                # find parents of children and children of parents (new cousins)
+                (CHILDREN, parents, max_nodes_per_iteration),
+                (PARENTS, children, max_nodes_per_iteration),
+                # extend known cousins
+                (CHILDREN, cousins, max_nodes_per_iteration),
+                (PARENTS, cousins, max_nodes_per_iteration),
+            ]
+
+        resp = _read_nearby_search(ctx, lookups)
         # update seen ids, so we don't query them again
         seen_parents.update(parents)
         seen_children.update(children)
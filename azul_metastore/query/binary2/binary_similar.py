@@ -1,39 +1,144 @@
 """Queries for finding similar binaries."""
 
-from ctypes import CDLL, create_string_buffer
+import logging
+import threading
+import time
+from collections import deque
 from typing import Generator
 
+import numpy as np
 import pendulum
+from azul_bedrock import exceptions_metastore
 from azul_bedrock.exception_enums import ExceptionCodeEnum
-from azul_bedrock.exceptions_bedrock import ApiException, BaseAzulException
+from azul_bedrock.exceptions_bedrock import ApiException
 from azul_bedrock.models_restapi import binaries as bedr_binaries
-
-from azul_metastore.common.entropy import TOTAL_ENTROPY_BITS, convert_entropy_to_opensearch_entropy
+from opensearchpy import exceptions as osex
+
+from azul_metastore import context, settings
+from azul_metastore.common import jobs, ssdeep
+from azul_metastore.common.entropy import (
+    TOTAL_ENTROPY_BITS,
+    convert_entropy_to_opensearch_entropy,
+    hamming_distances,
+)
 from azul_metastore.common.tlsh import encode_tlsh_into_vector, strip_tlsh_version
+from azul_metastore.common.tlsh_index import TlshIndex
 from azul_metastore.context import Context
 from azul_metastore.query import cache
 
+logger = logging.getLogger(__name__)
+
+# most candidates from the local tlsh index that will be checked for user access
+MAX_TLSH_LOCAL_CANDIDATES = 10_000
+
+_tlsh_index: TlshIndex | None = None
+# monotonic time the last load of the local tlsh index was started
+_tlsh_index_started: float | None = None
+_tlsh_index_lock = threading.Lock()
+# the local tlsh index is loaded by a single background thread
+_tlsh_index_jobs = jobs.JobRunner("tlsh_index", max_workers=1, max_per_user=1)
+
+# seconds before an unfinished similar by features calculation is assumed to have been abandoned
+SIMILAR_FEATURES_ABANDONED_AFTER = 600
+
+_feature_jobs: jobs.JobRunner | None = None
+_feature_jobs_lock = threading.Lock()
+
 
 def ssdeep_compare(hash1: str, hash2: str) -> int:
     """Compare 2 ssdeep fuzzyhashes and return a score for similarity.
 
-    Uses libfuzzy-dev library
+    Uses libfuzzy-dev library if available.
     """
+    return ssdeep.compare(hash1, hash2)
+
+
+def load_tlsh_index(ctx: Context) -> TlshIndex:
+    """Load the tlsh_vector of every binary visible to the context into a new local index."""
+    body = {
+        "_source": {"includes": ["sha256", "tlsh_vector"]},
+        "query": {"exists": {"field": "tlsh_vector"}},
+    }
+    index = TlshIndex()
+    for hit in ctx.man.binary2.w.scan(ctx.sd, body=body):
+        index.add(hit["_source"]["sha256"], hit["_source"]["tlsh_vector"])
+    return index
+
+
+def _reload_tlsh_index():
+    """Load a new local tlsh index and replace the current one."""
+    global _tlsh_index
     try:
-        score = CDLL("libfuzzy.so").fuzzy_compare(
-            create_string_buffer(hash1.encode("ascii")),
-            create_string_buffer(hash2.encode("ascii")),
-        )
-        return score
-    except OSError:
-        raise BaseAzulException(internal=ExceptionCodeEnum.MetastoreLibFuzzyFailedToInitalise) from None
+        _tlsh_index = load_tlsh_index(context.get_writer_context())
+    except (exceptions_metastore.NoWriteException, osex.AuthenticationException) as e:
+        logger.error(f"could not load local tlsh index: {str(e)}")
+
+
+def get_tlsh_index() -> TlshIndex | None:
+    """Return the local tlsh index, reloading it in the background if it is older than the refresh period.
+
+    Returns None if the local index is disabled or has not finished loading.
+    Requests keep using the previous index while it is reloading.
+    """
+    global _tlsh_index_started
+    s = settings.get()
+    if not s.tlsh_local_index:
+        return None
+
+    with _tlsh_index_lock:
+        # failed loads are also only retried after the refresh period
+        now = time.monotonic()
+        if _tlsh_index_started is None or now - _tlsh_index_started > s.tlsh_local_index_refresh:
+            _tlsh_index_started = now
+            _tlsh_index_jobs.submit("tlsh_index", "system", _reload_tlsh_index)
+    return _tlsh_index
+
+
+def _read_similar_from_tlsh_index(ctx: Context, index: TlshIndex, tlsh: str, maxCount: int) -> list[dict]:
+    """Compares binaries in the local tlsh index by TLSH distance.
+
+    The score is 100 minus the TLSH distance, so identical hashes would score 100.
+    Binaries with an identical TLSH are not returned, matching the kNN search.
+    """
+    search_hash = encode_tlsh_into_vector(tlsh)
+    if not search_hash:
+        return []
+    matches = index.query(
+        search_hash, max_distance=settings.get().tlsh_local_max_distance, max_count=MAX_TLSH_LOCAL_CANDIDATES
+    )
+
+    # the index is loaded with the writer context, so only keep matches the user has access to
+    similar_hashes: list[dict] = []
+    step = max(maxCount * 2, 100)
+    for i in range(0, len(matches), step):
+        batch = matches[i : i + step]
+        body = {
+            "_source": {"includes": ["sha256"]},
+            "query": {"bool": {"filter": [{"terms": {"sha256": [x[0] for x in batch]}}]}},
+            "size": len(batch),
+            "collapse": {"field": "sha256"},
+        }
+        resp = ctx.man.binary2.w.search(ctx.sd, body=body)
+        visible = {hit["_source"]["sha256"] for hit in resp["hits"]["hits"]}
+        for sha256, distance in batch:
+            if sha256 in visible:
+                similar_hashes.append({"sha256": sha256, "score": max(0, 100 - distance)})
+        if len(similar_hashes) >= maxCount:
+            break
+
+    return similar_hashes[:maxCount]
 
 
 def read_similar_from_tlsh(ctx: Context, tlsh: str, maxCount: int) -> list[dict]:
     """Compares binaries in OpenSearch by TLSH.
 
     This uses the kNN binary vector searching algorithm to find similar TLSH hashes by bit difference.
+    If the local tlsh index is enabled and loaded, binaries are instead scored with the real TLSH distance.
     """
+    index = get_tlsh_index()
+    if index is not None:
+        return _read_similar_from_tlsh_index(ctx, index, tlsh, maxCount)
+
     search_hash = encode_tlsh_into_vector(tlsh)
 
     # Normalise the hash to eliminate TLSH exact matches
@@ -151,9 +256,10 @@ def read_similar_from_ssdeep(ctx: Context, fuzzy_hash: str, maxCount: int) -> li
 
     similarHashes: list[dict] = []
 
-    for hit in resp["hits"]["hits"]:
-        # calculate score
-        score = ssdeep_compare(fuzzy_hash, hit["_source"]["ssdeep"])
+    hits = resp["hits"]["hits"]
+    # calculate scores
+    scores = ssdeep.compare_many(fuzzy_hash, [hit["_source"]["ssdeep"] for hit in hits])
+    for hit, score in zip(hits, scores, strict=True):
         similarHashes.append({"sha256": hit["_source"]["sha256"], "score": score})
 
     # sort hashes by score
@@ -166,6 +272,81 @@ def read_similar_from_ssdeep(ctx: Context, fuzzy_hash: str, maxCount: int) -> li
     return similarHashes
 
 
+def _count_collisions(hits: list[dict], fval_ids: dict[tuple[str, str], int], target: np.ndarray) -> np.ndarray:
+    """Return the number of feature values each hit has in common with the sorted target feature value ids."""
+    hit_rows = []
+    hit_ids = []
+    for i, hit in enumerate(hits):
+        for x in hit["_source"]["features"]:
+            fid = fval_ids.get((x["name"], x["value"]))
+            if fid is not None:
+                hit_rows.append(i)
+                hit_ids.append(fid)
+
+    # feature values can be repeated in a doc, so only count each once per hit
+    num_ids = max(len(fval_ids), 1)
+    pairs = np.unique(np.array(hit_rows, dtype=np.int64) * num_ids + np.array(hit_ids, dtype=np.int64))
+    rows, ids = np.divmod(pairs, num_ids)
+    common = np.isin(ids, target)
+    return np.bincount(rows[common], minlength=len(hits))
+
+
+def _similar_features_status(status: str) -> dict:
+    """Return similar by features results with no matches."""
+    return {
+        "num_feature_values": 0,
+        "timestamp": pendulum.now(tz=pendulum.UTC).to_iso8601_string(),
+        "matches": [],
+        "status": status,
+    }
+
+
+def _get_feature_jobs() -> jobs.JobRunner:
+    """Return the runner for similar by features calculations."""
+    global _feature_jobs
+    with _feature_jobs_lock:
+        if _feature_jobs is None:
+            s = settings.get()
+            _feature_jobs = jobs.JobRunner(
+                "similar_features",
+                max_workers=s.similar_features_workers,
+                max_per_user=s.similar_features_jobs_per_user,
+            )
+        return _feature_jobs
+
+
+def start_similar_from_features(ctx: Context, sha256: str, *, recalculate: bool = False) -> dict:
+    """Return cached similar by features results, calculating them in the background if required.
+
+    A calculation is started if there are no results, the previous calculation was abandoned or
+    recalculate is set. Clients should poll until the status is complete.
+
+    Requests for the same binary and user security share a single calculation.
+    If the user already has too many calculations running, nothing is started and the client must poll again.
+    """
+    sha256 = sha256.lower()
+    runner = _get_feature_jobs()
+    key = (sha256, ctx.get_user_security_unique())
+    ret = cache.load_generic(ctx, "similar", sha256, "v2")
+    unfinished = ret is not None and ret["status"] != "complete"
+    if runner.get(key):
+        # cached results may be from before a recalculation started
+        return ret if ret and unfinished else _similar_features_status("starting")
+
+    if ret and not recalculate:
+        abandoned_before = pendulum.now(tz=pendulum.UTC).subtract(seconds=SIMILAR_FEATURES_ABANDONED_AFTER)
+        if not unfinished or pendulum.parse(ret["timestamp"]) >= abandoned_before:  # type: ignore
+            return ret
+
+    def _calculate():
+        deque(read_similar_from_features(ctx, sha256, recalculate=True), maxlen=0)
+
+    if not runner.submit(key, ctx.user_info.username, _calculate):
+        waiting = "waiting for your other calculations to finish"
+        return {**ret, "status": waiting} if ret else _similar_features_status(waiting)
+    return _similar_features_status("starting")
+
+
 def read_similar_from_features(ctx: Context, sha256: str, *, recalculate: bool = False) -> Generator[dict, None, None]:
     """Find similar entities based on features.
 
@@ -183,12 +364,7 @@ def read_similar_from_features(ctx: Context, sha256: str, *, recalculate: bool =
         yield ret
         return
 
-    ret = {
-        "num_feature_values": 0,
-        "timestamp": pendulum.now(tz=pendulum.UTC).to_iso8601_string(),
-        "matches": [],
-        "status": "starting",
-    }
+    ret = _similar_features_status("starting")
     yield ret
 
     def _cache():
@@ -240,9 +416,17 @@ def read_similar_from_features(ctx: Context, sha256: str, *, recalculate: bool =
         num_fvals += len(set_fval)
     ret["num_feature_values"] = num_fvals
 
-    map_entity: dict[str, dict] = {}
-    for i, author in enumerate(author_docs.keys()):
-        set_fval = author_feature_vals[author]
+    # intern feature values so collisions can be counted with numpy
+    fval_ids: dict[tuple[str, str], int] = {}
+    for fvals in author_feature_vals.values():
+        for x in fvals:
+            fval_ids.setdefault(x, len(fval_ids))
+
+    authors = list(author_docs.keys())
+    entity_rows: dict[str, int] = {}
+    author_collisions: list[tuple[list[int], np.ndarray]] = []
+    for i, author in enumerate(authors):
+        target = np.array(sorted(fval_ids[x] for x in author_feature_vals[author]), dtype=np.int64)
         ret["status"] = f"({i + 1}/{len(author_docs)}) calculating matches for {author}"
         _cache()
         body = {
@@ -280,51 +464,48 @@ def read_similar_from_features(ctx: Context, sha256: str, *, recalculate: bool =
             },
         }
         resp = ctx.man.binary2.w.search(ctx.sd, body=body)
-        for row in resp["hits"]["hits"]:
-            doc = row["_source"]
-            # calculate number of matching feature values to target
-            collision = len(set_fval.intersection(set((x["name"], x["value"]) for x in doc["features"])))
-
-            # create new match for entity if it doesn't exist
-            map_entity.setdefault(
-                doc["sha256"],
-                dict(
-                    sha256=doc["sha256"],
-                    contributions={},
-                    score_sum=0,
-                ),
+        hits = resp["hits"]["hits"]
+        rows = [entity_rows.setdefault(x["_source"]["sha256"], len(entity_rows)) for x in hits]
+        author_collisions.append((rows, _count_collisions(hits, fval_ids, target)))
+
+    # best collision count for each entity (row) and author (column)
+    contributions = np.zeros((len(entity_rows), len(authors)), dtype=np.int64)
+    contributed = np.zeros((len(entity_rows), len(authors)), dtype=bool)
+    for i, (rows, collisions) in enumerate(author_collisions):
+        np.maximum.at(contributions[:, i], rows, collisions)
+        contributed[rows, i] = True
+
+    score_sum = contributions.sum(axis=1)
+    score_percent = (score_sum / max(num_fvals, 1) * 100).astype(np.int64)
+
+    # sort by score_sum and sha256, keeping most similar
+    sha256s = list(entity_rows.keys())
+    sha256_rank = np.empty(len(sha256s), dtype=np.int64)
+    sha256_rank[np.argsort(np.array(sha256s, dtype=str), kind="stable")] = np.arange(len(sha256s))
+    keep = np.flatnonzero((score_sum > 1) | (score_percent > 1))
+    keep = keep[np.lexsort((sha256_rank[keep], -score_sum[keep]))][:20]
+
+    ret["matches"] = []
+    for row in keep:
+        row_contributions = [(x, int(contributions[row, i])) for i, x in enumerate(authors) if contributed[row, i]]
+        # sort contributions by score
+        row_contributions.sort(key=lambda x: x[1], reverse=True)
+        ret["matches"].append(
+            dict(
+                sha256=sha256s[row],
+                contributions=row_contributions,
+                score_sum=int(score_sum[row]),
+                score_percent=int(score_percent[row]),
             )
-            res = map_entity[doc["sha256"]]
-            res["contributions"].setdefault(author, 0)
-            res["contributions"][author] = max(collision, res["contributions"][author])
-
-    # order contributions as a list & calculate sum score
-    for row in map_entity.values():
-        row["contributions"] = [(x, y) for x, y in row["contributions"].items()]
-        row["score_sum"] = sum([x[1] for x in row["contributions"]])
-
-    rows = sorted(map_entity.values(), key=lambda x: x["score_sum"], reverse=True)
-
-    # get percentage match
-    for row in rows:
-        row["score_percent"] = int((row["score_sum"] / num_fvals) * 100)
-
-    # sort by score_sum and sha256
-    rows.sort(key=lambda x: x["sha256"])
-    rows.sort(key=lambda x: x["score_sum"], reverse=True)
-    rows = [x for x in rows if (x["score_sum"] > 1 or x["score_percent"] > 1)]
-
-    # sort contributions by score
-    [x["contributions"].sort(key=lambda x: x[1], reverse=True) for x in rows]
-
-    # keep most similar
-    ret["matches"] = rows[:20]
+        )
     ret["status"] = "complete"
     _cache()
     yield ret
 
 
 MINIMUM_ENTROPY_SIMILARITY_PERCENTAGE = 90
+# most candidates that will be fetched from the kNN search when looking for entropy matches
+MAX_ENTROPY_CANDIDATES = 1000
 
 
 def read_similar_from_entropy(
@@ -332,69 +513,60 @@ def read_similar_from_entropy(
 ) -> list[bedr_binaries.SimilarEntropyMatchRow]:
     """Compares binaries in OpenSearch by Entropy.
 
-    This uses the kNN binary vector searching algorithm to find similar Entropy vectors by bit difference.
+    This uses the kNN binary vector searching algorithm to find candidates with similar Entropy vectors,
+    which are then scored by the exact number of bits that differ from the provided entropy.
+    If too few candidates meet the minimum similarity, the kNN search is repeated with more candidates.
     """
     search_entropy = convert_entropy_to_opensearch_entropy(entropy)
     # Entropy can't be searched because it's too small so return empty list.
     if not search_entropy:
         return []
 
-    body = {
-        "_source": {"includes": ["sha256"]},
-        "query": {
-            "knn": {
-                "entropy_vector": {
-                    "vector": search_entropy,
-                    "k": max_matches + 10,  # max matches plus a slight buffer in-case of collapsing sha256's
-                    # Requires OpenSearch 2.4+
-                    # https://opensearch.org/docs/latest/vector-search/filter-search-knn/efficient-knn-filtering/
-                    "filter": {
-                        "bool": {
-                            "must_not": [
-                                # Don't match on yourself.
-                                {"match": {"sha256": original_sha256}},
-                            ],
-                        }
-                    },
+    k = max_matches + 10  # max matches plus a slight buffer in-case of collapsing sha256's
+    while True:
+        body = {
+            "_source": {"includes": ["sha256", "entropy_vector"]},
+            "query": {
+                "knn": {
+                    "entropy_vector": {
+                        "vector": search_entropy,
+                        "k": k,
+                        # Requires OpenSearch 2.4+
+                        # https://opensearch.org/docs/latest/vector-search/filter-search-knn/efficient-knn-filtering/
+                        "filter": {
+                            "bool": {
+                                "must_not": [
+                                    # Don't match on yourself.
+                                    {"match": {"sha256": original_sha256}},
+                                ],
+                            }
+                        },
+                    }
                 }
-            }
-        },
-        "size": max_matches,
-        # we only care about unique entity ids
-        "collapse": {"field": "sha256"},
-    }
-
-    resp = ctx.man.binary2.w.search(ctx.sd, body=body)
+            },
+            "size": k,
+            # we only care about unique entity ids
+            "collapse": {"field": "sha256"},
+        }
+        resp = ctx.man.binary2.w.search(ctx.sd, body=body)
 
-    similar_hashes: list[bedr_binaries.SimilarEntropyMatchRow] = []
+        hits = resp["hits"]["hits"]
+        distances = hamming_distances(search_entropy, [hit["_source"]["entropy_vector"] for hit in hits])
+        similar_hashes: list[bedr_binaries.SimilarEntropyMatchRow] = []
+        for hit, different_bits in zip(hits, distances.tolist(), strict=True):
+            # Calculate percentage similar
+            percentage_score = 100 * ((TOTAL_ENTROPY_BITS - different_bits) / TOTAL_ENTROPY_BITS)
+            # Skip elements if they don't meet minimum similarity.
+            if percentage_score < MINIMUM_ENTROPY_SIMILARITY_PERCENTAGE:
+                continue
+            similar_hashes.append(
+                bedr_binaries.SimilarEntropyMatchRow(sha256=hit["_source"]["sha256"], score=round(percentage_score, 4))
+            )
 
-    for hit in resp["hits"]["hits"]:
-        # Convert score to percentage of match
-        # Original score form is score=1/(1+d)
-        # Where d is the number of bits that didn't match in the hamming comparison
-        # %1 removes whole numbers added because opensearch adds a 1 as part of the score boosting provided by DSL.
-        # This does lose some precision but is insignificant
-        score = hit["_score"]
-        # If the score isn't exactly one perform modulus 1, it it is 1 it's an exact match.
-        score = score % 1
-        # If the score is a whole number 1,2,3... (which can happen, the files match 100%)
-        if hit["_score"] > 0 and score == 0:
-            score = 1
-        if score == 0:
-            # If score is still 0 there is a 0% percentage match and this achieve that result.
-            different_bits = TOTAL_ENTROPY_BITS
-        else:
-            # Total number of bits that differ between the two vectors d=(1/x) - 1
-            different_bits = (1 / score) - 1
-        # Calculate percentage similar
-        percentage_score = 100 * ((TOTAL_ENTROPY_BITS - different_bits) / TOTAL_ENTROPY_BITS)
-        # Skip elements if they don't meet minimum similarity.
-        if percentage_score < MINIMUM_ENTROPY_SIMILARITY_PERCENTAGE:
-            continue
-
-        similar_hashes.append(
-            bedr_binaries.SimilarEntropyMatchRow(sha256=hit["_source"]["sha256"], score=round(percentage_score, 4))
-        )
+        # stop once there are enough matches, or there are no more candidates to find
+        if len(similar_hashes) >= max_matches or resp["hits"]["total"]["value"] < k or k >= MAX_ENTROPY_CANDIDATES:
+            break
+        k = min(k * 2, MAX_ENTROPY_CANDIDATES)
 
     # sort hashes by score
     similar_hashes.sort(key=lambda x: x.score, reverse=True)
@@ -69,8 +69,13 @@ async def _submit_binary_data_with_sources(
     meta = await ctx.dispatcher.async_submit_binary(initial_source, label, data, SUBMIT_BINARY_TIMEOUT_SECONDS)
 
     if meta.sha256:
-        for additional_source in sources[1:]:
-            ctx.dispatcher.copy_binary(initial_source, additional_source, label, meta.sha256)
+        # copies are independent so are made at the same time, outside of the event loop
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(ctx.dispatcher.copy_binary, initial_source, additional_source, label, meta.sha256)
+                for additional_source in sources[1:]
+            )
+        )
     else:
         logger.warning("Failed to copy datastream due to sha256 not being set!")
 
@@ -107,11 +112,10 @@ async def _process_augmented_streams(
     return augstream_meta
 
 
-def _submit_binary_event(
+def _submit_binary_events(
     *,
     author: azm.Author,
-    entity: azm.BinaryEvent.Entity,
-    filename: str | None,
+    children: list[tuple[azm.BinaryEvent.Entity, str | None]],
     source: str,
     timestamp: str,
     references: dict[str, str],
@@ -120,8 +124,11 @@ def _submit_binary_event(
     ctx: context.Context,
     priv_ctx: context.Context,
     expedite: bool,
-):
-    """Submit an event to the dispatcher."""
+) -> list[basic_events.BinaryEvent | Exception]:
+    """Submit an event for each entity to the dispatcher.
+
+    Returns the event created for each entity, or the error if it could not be submitted.
+    """
     # check that source is valid
     if not settings.check_source_exists(source):
         raise ApiException(
@@ -143,43 +150,49 @@ def _submit_binary_event(
     # Remove on any event beyond the inital submission as, always 1 on a sourced event.
     if submit_settings:
         submit_settings[binary_submit_manual.SUBMIT_SETTINGS_DEPTH_REMOVAL_KEY] = "2"
-    event_details = azm.BinaryEvent(
-        kafka_key="meta-tmp",  # temporary id so we can create the object
-        action=azm.BinaryAction.Sourced,
-        model_version=azm.CURRENT_MODEL_VERSION,
-        timestamp=timestamp,  # type: ignore
-        author=author,
-        entity=entity,
-        source=azm.Source(
-            name=source,
+    submissions = []
+    for entity, filename in children:
+        event_details = azm.BinaryEvent(
+            kafka_key="meta-tmp",  # temporary id so we can create the object
+            action=azm.BinaryAction.Sourced,
+            model_version=azm.CURRENT_MODEL_VERSION,
             timestamp=timestamp,  # type: ignore
-            references=references,
-            settings=submit_settings,
-            path=[
-                azm.PathNode(
-                    author=author,
-                    action=azm.BinaryAction.Sourced,
-                    timestamp=timestamp,  # type: ignore
-                    sha256=entity.sha256 or "",
-                    filename=data_common.basename(filename) if filename else None,
-                    size=entity.size,
-                    file_format=entity.file_format,
-                )
-            ],
-            security=security,
-        ),
-    )
-    # set fake ID as dispatcher will generate a proper one
-    event_details.kafka_key = "tmp"
-    submission = [event_details]
-    if expedite:
-        # generate deep copy with the expedite flag set
-        ev_expedited = azm.BinaryEvent(**event_details.model_dump())
-        ev_expedited.flags.expedite = True
-        submission.append(ev_expedited)
+            author=author,
+            entity=entity,
+            source=azm.Source(
+                name=source,
+                timestamp=timestamp,  # type: ignore
+                references=references,
+                settings=submit_settings,
+                path=[
+                    azm.PathNode(
+                        author=author,
+                        action=azm.BinaryAction.Sourced,
+                        timestamp=timestamp,  # type: ignore
+                        sha256=entity.sha256 or "",
+                        filename=data_common.basename(filename) if filename else None,
+                        size=entity.size,
+                        file_format=entity.file_format,
+                    )
+                ],
+                security=security,
+            ),
+        )
+        # set fake ID as dispatcher will generate a proper one
+        event_details.kafka_key = "tmp"
+        submission = [event_details]
+        if expedite:
+            # generate deep copy with the expedite flag set
+            ev_expedited = azm.BinaryEvent(**event_details.model_dump())
+            ev_expedited.flags.expedite = True
+            submission.append(ev_expedited)
+        submissions.append(submission)
 
     # send to dispatcher and get enhanced copy of events
-    resp = ctx.dispatcher.submit_events(submission, model=azm.ModelType.Binary, include_ok=True)
+    keys = [(entity.sha256 or "").lower() for entity, _ in children]
+    accepted = binary_submit_manual.submit_events_for_children(
+        ctx, submissions, keys, lambda ev: ev["entity"]["sha256"].lower(), model=azm.ModelType.Binary
+    )
 
     # index to metastore immediately
     # slow - skip this for automated submissions
@@ -188,7 +201,7 @@ def _submit_binary_event(
             # write events immediately
             binary_create.create_binary_events(
                 priv_ctx,
-                [azm.BinaryEvent(**x) for x in resp.ok],
+                [azm.BinaryEvent(**x) for ok in accepted if not isinstance(ok, Exception) for x in ok],
                 immediate=True,
             )
         except Exception as e:
@@ -199,15 +212,89 @@ def _submit_binary_event(
                 parameters={"inner_exception": str(e)},
             ) from e
 
-    if len(resp.ok) == 0:
-        raise ApiException(
-            status_code=HTTP_500_INTERNAL_SERVER_ERROR,
-            ref="Dispatcher rejected the submitted events",
-            internal=ExceptionCodeEnum.MetastoreBinarySubmitDispatcherRejectedEvent,
-            parameters={"response": str(resp)},
-        )
-    model = basic_events.BinaryEvent(**resp.ok[0])
-    return model
+    ret: list[basic_events.BinaryEvent | Exception] = []
+    for key, ok in zip(keys, accepted, strict=True):
+        if isinstance(ok, Exception):
+            ret.append(ok)
+        elif len(ok) == 0:
+            ret.append(
+                ApiException(
+                    status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+                    ref="Dispatcher rejected the submitted events",
+                    internal=ExceptionCodeEnum.MetastoreBinarySubmitDispatcherRejectedEvent,
+                    parameters={"sha256": key},
+                )
+            )
+        else:
+            ret.append(basic_events.BinaryEvent(**ok[0]))
+    return ret
+
+
+async def _submit_unpacked_content(
+    ctx: context.Context,
+    sources_to_submit: list[str],
+    binary: UploadFile,
+    *,
+    extract: bool,
+    password: str,
+    filename: str | None,
+    augstream_meta: list[azm.Datastream],
+) -> list[tuple[str | None, azm.BinaryEvent.Entity | Exception]]:
+    """Submit each file unpacked from the binary to dispatcher, several at a time.
+
+    Returns the filename and entity of each file in the order they were unpacked,
+    or the error if it could not be submitted.
+    """
+    semaphore = asyncio.Semaphore(max(settings.get().submit_concurrency, 1))
+
+    async def _submit(local_filename: str | None, data: UploadFile | AsyncIterable[bytes]):
+        try:
+            # submit file to dispatcher and transform returned metadata
+            binary_details = await _submit_binary_data_with_sources(
+                ctx, sources_to_submit, azm.DataLabel.CONTENT, data
+            )
+            # the dispatcher sets the label - override it here
+            # FUTURE make dispatcher set this label
+            binary_details.label = azm.DataLabel.CONTENT
+            return local_filename, _transform_metadata_to_binary_entity(
+                binary_details, local_filename, augstreams=augstream_meta
+            )
+        except Exception as e:
+            logger.warning(f"failed to submit {local_filename or 'file'}: {e}")
+            return local_filename, e
+        finally:
+            semaphore.release()
+
+    tasks: list[asyncio.Task] = []
+    try:
+        async for data, fname in fileformat.unpack_content(binary, extract, password):
+            # archives always need to use internal filename
+            # non-archives always need to use provided filename
+            local_filename = fname if extract else filename
+            # extraction waits for a free slot, so extracted files aren't held while waiting to be submitted
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(_submit(local_filename, data)))
+    finally:
+        # submissions that started are finished, even if extraction fails
+        results = await asyncio.gather(*tasks)
+    return results
+
+
+def _raise_for_failed_children(children: list[tuple[str | None, object]], errors: dict[int, Exception]):
+    """Raise an exception describing each child that could not be submitted."""
+    if not errors:
+        return
+    if len(errors) == len(children):
+        # nothing was submitted, so report the error as if there was a single file
+        raise next(iter(errors.values()))
+    raise ApiException(
+        status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+        ref=f"Unable to submit {len(errors)} of {len(children)} files",
+        internal=ExceptionCodeEnum.MetastoreDispatcherRejectedEvents,
+        parameters={
+            "failures": [{"index": i, "filename": children[i][0], "error": str(e)} for i, e in sorted(errors.items())],
+        },
+    )
 
 
 async def high_level_submit_binary(
@@ -278,7 +365,11 @@ async def high_level_submit_binary(
     # Not checking that parent stream exists as the only check that matters is that the stream was present in Azul.
     if (
         parent_sha256
-        and not binary_read.verify_stream_exists(ctx, parent_sha256, is_check_stream_in_dispatcher=False)[0]
+        and not (
+            await asyncio.to_thread(
+                binary_read.verify_stream_exists, ctx, parent_sha256, is_check_stream_in_dispatcher=False
+            )
+        )[0]
     ):
         raise ApiException(
             status_code=HTTP_422_UNPROCESSABLE_CONTENT,
@@ -294,28 +385,23 @@ async def high_level_submit_binary(
         sources_to_submit.append(source)
     else:
         # attaching to parent, query opensearch to get list of sources
-        sources_to_submit = binary_read.list_all_sources_for_binary(ctx, parent_sha256)
+        sources_to_submit = await asyncio.to_thread(binary_read.list_all_sources_for_binary, ctx, parent_sha256)
 
     augstream_meta = await _process_augmented_streams(ctx, sources_to_submit, augstreams)
 
-    entities: list[azm.BinaryEvent.Entity] = []
+    # filename and entity of each file, or the error if it could not be submitted
+    children: list[tuple[str | None, azm.BinaryEvent.Entity | Exception]] = []
     if binary:
         try:
-            async for data, fname in fileformat.unpack_content(binary, extract, password):
-                # archives always need to use internal filename
-                # non-archives always need to use provided filename
-                local_filename = fname if extract else filename
-                # submit file to dispatcher and transform returned metadata
-                binary_details = await _submit_binary_data_with_sources(
-                    ctx, sources_to_submit, azm.DataLabel.CONTENT, data
-                )
-                # the dispatcher sets the label - override it here
-                # FUTURE make dispatcher set this label
-                binary_details.label = azm.DataLabel.CONTENT
-                entity = _transform_metadata_to_binary_entity(
-                    binary_details, local_filename, augstreams=augstream_meta
-                )
-                entities.append(entity)
+            children = await _submit_unpacked_content(
+                ctx,
+                sources_to_submit,
+                binary,
+                extract=extract,
+                password=password,
+                filename=filename,
+                augstream_meta=augstream_meta,
+            )
         except exceptions_metastore.ExtractException as e:
             raise ApiException(
                 status_code=HTTP_422_UNPROCESSABLE_CONTENT,
@@ -327,78 +413,84 @@ async def high_level_submit_binary(
         # dataless submission
         # this query limits docs to the callers permissions
         # so the hash may exist in the system but the error is raised anyway
-        try:
-            doc = next(binary_submit_dataless.stream_dispatcher_events_for_binary(ctx, sha256))
-        except StopIteration:
+        doc = await asyncio.to_thread(
+            lambda: next(binary_submit_dataless.stream_dispatcher_events_for_binary(ctx, sha256), None)
+        )
+        if doc is None:
             raise ApiException(
                 status_code=HTTP_404_NOT_FOUND,
                 ref="Unable to find existing metadata",
                 internal=ExceptionCodeEnum.MetastoreDatalessSubmissionBinaryDoesNotExist,
                 parameters={"sha256": sha256},
-            ) from None
+            )
         # first entry in data block must have been generated by dispatcher for 'content'
         binary_details = azm.BinaryEvent(**doc).entity.datastreams[0]
         entity = _transform_metadata_to_binary_entity(binary_details, filename, augstreams=augstream_meta)
-        entities.append(entity)
-    if not entities:
+        children.append((filename, entity))
+    if not children:
         raise ApiException(
             status_code=HTTP_422_UNPROCESSABLE_CONTENT,
             ref="Unable to extract files",
             internal=ExceptionCodeEnum.MetastoreUnableToExtractAnyFiles,
         )
 
-    # Submit events to dispatcher and track the returned submission data.
-    return_val: list[bedr_bdata.BinaryData] = []
+    # files that were uploaded still have events submitted if other files failed
+    errors: dict[int, Exception] = {i: x for i, (_, x) in enumerate(children) if isinstance(x, Exception)}
+    submitted = {i: x for i, (_, x) in enumerate(children) if i not in errors}
 
-    for entity in entities:
+    # Submit events to dispatcher, batching the events for all files into as few requests as possible.
+    submit_args = dict(
+        author=author,
+        submit_settings=submit_settings,
+        timestamp=timestamp,
+        security=security,
+        ctx=ctx,
+        priv_ctx=priv_ctx,
+        expedite=expedite,
+    )
+    to_submit = [(entity, _get_filename(entity)) for entity in submitted.values()]
+    results: list = []
+    if to_submit and is_source_submission and source:
+        # build up a submission event
+        results = await asyncio.to_thread(
+            _submit_binary_events, children=to_submit, source=source, references=references, **submit_args
+        )
+    elif to_submit:
+        # parent-child insert
+        results = await asyncio.to_thread(
+            binary_submit_manual.submit_children,
+            children=to_submit,
+            original_source=sources_to_submit[0],
+            parent_sha256=parent_sha256,
+            relationship=relationship,
+            **submit_args,
+        )
+    for i, result in zip(submitted, results, strict=True):
+        if isinstance(result, Exception):
+            errors[i] = result
+    _raise_for_failed_children(children, errors)
+
+    # Track the returned submission data.
+    return_val: list[bedr_bdata.BinaryData] = []
+    for (entity, filename), result in zip(to_submit, results, strict=True):
         # Indexing first element because that is where we store the main content with the label "content".
         # This is the main binary that has been uploaded for the event in question and is the metadata we want.
         new_model = bedr_bdata.BinaryData(**entity.datastreams[0].model_dump())
-
-        # get the filename again
-        filenames = [x.value for x in entity.features if x.name == "filename"]
-        filename = filenames[0] if filenames else None
-
         if filename:
             new_model.filename = filename
-
-        if is_source_submission and source:
-            # build up a submission event
-            return_model = _submit_binary_event(
-                author=author,
-                entity=entity,
-                filename=filename,
-                source=source,
-                timestamp=timestamp,
-                references=references,
-                submit_settings=submit_settings,
-                security=security,
-                ctx=ctx,
-                priv_ctx=priv_ctx,
-                expedite=expedite,
-            )
-            new_model.track_source_references = return_model.track_source_references
-        else:
-            # parent-child insert
-            binary_submit_manual.submit(
-                author=author,
-                original_source=sources_to_submit[0],
-                parent_sha256=parent_sha256,
-                entity=entity,
-                timestamp=timestamp,
-                relationship=relationship,
-                submit_settings=submit_settings,
-                filename=filename,
-                security=security,
-                ctx=ctx,
-                priv_ctx=priv_ctx,
-                expedite=expedite,
-            )
+        if isinstance(result, basic_events.BinaryEvent):
+            new_model.track_source_references = result.track_source_references
         return_val.append(new_model)
 
     return return_val
 
 
+def _get_filename(entity: azm.BinaryEvent.Entity) -> str | None:
+    """Return the filename feature of an entity."""
+    filenames = [x.value for x in entity.features if x.name == "filename"]
+    return filenames[0] if filenames else None
+
+
 async def submit_download_request(
     ctx: context.Context,
     priv_ctx: context.Context,
@@ -453,7 +545,9 @@ async def submit_download_request(
         action=azm.DownloadAction.Requested,
     )
 
-    resp = ctx.dispatcher.submit_events(events=[download_event], model=azm.ModelType.Download, include_ok=True)
+    resp = await asyncio.to_thread(
+        ctx.dispatcher.submit_events, events=[download_event], model=azm.ModelType.Download, include_ok=True
+    )
 
     if len(resp.ok) == 0:
         raise ApiException(
@@ -1,14 +1,17 @@
 """Queries to assist with manual child submissions."""
 
+import copy
 import logging
-from typing import Iterable
+from collections import defaultdict
+from typing import Callable, Iterable
 
+from azul_bedrock import models_api
 from azul_bedrock import models_network as azm
 from azul_bedrock.exception_enums import ExceptionCodeEnum
 from azul_bedrock.exceptions_bedrock import ApiException
 from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
 
-from azul_metastore import context
+from azul_metastore import context, settings
 from azul_metastore.common import data_common
 from azul_metastore.encoders import binary2 as rc
 from azul_metastore.query import binary_create
@@ -66,11 +69,18 @@ def _stream_events_for_manual_submission(
 
 
 def _stream_append_manual_insert(
-    ctx: context.Context, child_event: dict, submit_settings: dict[str, str]
+    ctx: context.Context, child_event: dict, submit_settings: dict[str, str], parent_rows: list[dict] | None = None
 ) -> Iterable[azm.BinaryEvent]:
-    """Read all events for parent and propagate to new child."""
+    """Read all events for parent and propagate to new child.
+
+    Events already read for the parent can be given in parent_rows, which are not modified.
+    """
     parent_sha256 = child_event["entity"]["parent_sha256"].lower()
-    for row in _stream_events_for_manual_submission(ctx, parent_sha256):
+    if parent_rows is None:
+        rows = _stream_events_for_manual_submission(ctx, parent_sha256)
+    else:
+        rows = (copy.deepcopy(x) for x in parent_rows)
+    for row in rows:
         # add child node to parents path and assemble child event
         node = child_event["entity"]["child_history"]
         row["source"]["path"].append(node)
@@ -97,71 +107,174 @@ def _stream_append_manual_insert(
         yield event
 
 
-def submit(
+def _split_ok_events(
+    resp: models_api.ResponsePostEvent, events: list[list[azm.BaseEvent]], keys: list[str], key: Callable[[dict], str]
+) -> list[list[dict]]:
+    """Return the accepted events for each child."""
+    if resp.total_failures == 0 and len(resp.ok) == sum(len(x) for x in events):
+        # every event was accepted, and dispatcher returns them in the order they were sent
+        ret = []
+        pos = 0
+        for x in events:
+            ret.append(resp.ok[pos : pos + len(x)])
+            pos += len(x)
+        return ret
+    by_key = defaultdict(list)
+    for ev in resp.ok:
+        by_key[key(ev)].append(ev)
+    # children can be duplicates with the same key, so each takes the next events for its key in the order sent
+    ret = []
+    taken: dict[str, int] = defaultdict(int)
+    for k, x in zip(keys, events, strict=True):
+        ret.append(by_key[k][taken[k] : taken[k] + len(x)])
+        taken[k] += len(x)
+    return ret
+
+
+def submit_events_for_children(
+    ctx: context.Context,
+    events: list[list[azm.BaseEvent]],
+    keys: list[str],
+    key: Callable[[dict], str],
+    *,
+    model: azm.ModelType,
+    params: dict | None = None,
+) -> list[list[dict] | Exception]:
+    """Submit the events for each child to dispatcher, in as few requests as possible.
+
+    keys identify each child, and key returns the identity of the child an accepted event is for.
+    Returns the events accepted by dispatcher for each child, or the error if the request failed.
+    """
+    batch_size = settings.get().submit_events_batch_size
+    ret: list[list[dict] | Exception] = []
+    start = 0
+    while start < len(events):
+        # events for a child are never split between requests
+        end = start + 1
+        count = len(events[start])
+        while end < len(events) and count + len(events[end]) <= batch_size:
+            count += len(events[end])
+            end += 1
+        batch = events[start:end]
+        if count == 0:
+            ret.extend([] for _ in batch)
+        else:
+            try:
+                resp = ctx.dispatcher.submit_events(
+                    [ev for x in batch for ev in x], model=model, params=params, include_ok=True
+                )
+                ret.extend(_split_ok_events(resp, batch, keys[start:end], key))
+            except Exception as e:
+                logger.warning(f"failed to submit events for {len(batch)} children: {e}")
+                ret.extend(e for _ in batch)
+        start = end
+    return ret
+
+
+def submit_children(
     *,
     author: azm.Author,
     original_source: str,
     parent_sha256: str,
-    entity: azm.BinaryEvent.Entity,
+    children: list[tuple[azm.BinaryEvent.Entity, str | None]],
     security: str,
     relationship: dict,
     submit_settings: dict[str, str],
     timestamp: str,
-    filename: str | None,
     ctx: context.Context,
     priv_ctx: context.Context,
     expedite: bool,
-):
-    """User triggered insertion of an entity as child of another entity."""
+) -> list[Exception | None]:
+    """User triggered insertion of entities as children of another entity.
+
+    Returns the error for each child that could not be inserted, or None if it was inserted.
+    """
     author.security = security
     params = {"name": "metastore-insert", "version": "2021-03-19"}
 
-    if filename:
-        filename = data_common.basename(filename)
-
-    event = azm.InsertEvent(
-        kafka_key="meta-tmp",
-        model_version=azm.CURRENT_MODEL_VERSION,
-        author=author,
-        entity=azm.InsertEvent.Entity(
-            original_source=original_source,
-            parent_sha256=parent_sha256,
-            child=entity,
-            child_history=azm.PathNode(
-                author=author,
-                action=azm.BinaryAction.Extracted,
-                sha256=entity.sha256 if entity.sha256 else "",
-                filename=filename,
-                size=entity.size,
-                file_format=entity.file_format,
-                relationship=relationship,
-                timestamp=timestamp,  # type: ignore
+    inserts = []
+    for entity, filename in children:
+        if filename:
+            filename = data_common.basename(filename)
+
+        event = azm.InsertEvent(
+            kafka_key="meta-tmp",
+            model_version=azm.CURRENT_MODEL_VERSION,
+            author=author,
+            entity=azm.InsertEvent.Entity(
+                original_source=original_source,
+                parent_sha256=parent_sha256,
+                child=entity,
+                child_history=azm.PathNode(
+                    author=author,
+                    action=azm.BinaryAction.Extracted,
+                    sha256=entity.sha256 if entity.sha256 else "",
+                    filename=filename,
+                    size=entity.size,
+                    file_format=entity.file_format,
+                    relationship=relationship,
+                    timestamp=timestamp,  # type: ignore
+                ),
             ),
-        ),
-        timestamp=timestamp,  # type: ignore
-    )
+            timestamp=timestamp,  # type: ignore
+        )
+        inserts.append([event])
 
     # send to dispatcher and get enhanced copy of events
     # as this is not a binary event, there is nothing to expedite
-    resp = ctx.dispatcher.submit_events([event], model=azm.ModelType.Insert, params=params, include_ok=True)
-    if len(resp.ok) == 0:
-        raise ApiException(
-            status_code=HTTP_500_INTERNAL_SERVER_ERROR,
-            ref="Dispatcher rejected the submitted events",
-            internal=ExceptionCodeEnum.MetastoreDispatcherRejectedEvents,
-            parameters={"response": resp},
-        )
-    full_event = resp.ok[0]
+    keys = [(entity.sha256 or "").lower() for entity, _ in children]
+    accepted = submit_events_for_children(
+        ctx,
+        inserts,
+        keys,
+        lambda ev: ev["entity"]["child"]["sha256"].lower(),
+        model=azm.ModelType.Insert,
+        params=params,
+    )
+    errors: list[Exception | None] = [None] * len(children)
+    full_events = {}
+    for i, ok in enumerate(accepted):
+        if isinstance(ok, Exception):
+            errors[i] = ok
+        elif len(ok) == 0:
+            errors[i] = ApiException(
+                status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+                ref="Dispatcher rejected the submitted events",
+                internal=ExceptionCodeEnum.MetastoreDispatcherRejectedEvents,
+                parameters={"sha256": keys[i]},
+            )
+        else:
+            full_events[i] = ok[0]
+    if not full_events:
+        return errors
 
     # calculate required binary events and send through to dispatcher for processing
-    binary_events = list(_stream_append_manual_insert(priv_ctx, full_event, submit_settings))
-    logger.debug(f"creating manual insertion events: {len(binary_events)}")
-    resp = ctx.dispatcher.submit_events(binary_events, model=azm.ModelType.Binary, params=params, include_ok=True)
+    # every child has the same parent, so events for the parent are only read once
+    parent_rows = list(_stream_events_for_manual_submission(priv_ctx, parent_sha256.lower()))
+    indexes = list(full_events)
+    binary_events = [
+        list(_stream_append_manual_insert(priv_ctx, full_events[i], submit_settings, parent_rows)) for i in indexes
+    ]
+    logger.debug(f"creating manual insertion events: {sum(len(x) for x in binary_events)}")
+    accepted = submit_events_for_children(
+        ctx,
+        binary_events,
+        [keys[i] for i in indexes],
+        lambda ev: ev["entity"]["sha256"].lower(),
+        model=azm.ModelType.Binary,
+        params=params,
+    )
+    created = []
+    for i, ok in zip(indexes, accepted, strict=True):
+        if isinstance(ok, Exception):
+            errors[i] = ok
+        else:
+            created.extend(ok)
 
     if expedite:
         # we need the metastore to propagate through existing records
         try:
-            binary_create.create_binary_events(priv_ctx, [azm.BinaryEvent(**x) for x in resp.ok])
+            binary_create.create_binary_events(priv_ctx, [azm.BinaryEvent(**x) for x in created])
             priv_ctx.refresh()
         except Exception as e:
             raise ApiException(
@@ -170,3 +283,4 @@ def submit(
                 internal=ExceptionCodeEnum.MetastoreSubmissionsCantCreateInsertionEvents,
                 parameters={"inner_exception": str(e)},
             ) from e
+    return errors
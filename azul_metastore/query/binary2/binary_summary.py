@@ -7,13 +7,17 @@ from azul_bedrock import models_restapi
 from azul_bedrock.models_restapi import BinaryMetadataDetail as Detail
 
 from azul_metastore import context, settings
-from azul_metastore.common import utils
+from azul_metastore.common import memcache, utils
 from azul_metastore.encoders import binary2 as rc
 from azul_metastore.query import annotation, plugin
-from azul_metastore.query.binary2 import binary_related
+from azul_metastore.query.binary2 import binary_read, binary_related
 
 logger = logging.getLogger(__name__)
 
+# binary metadata and the document count and newest doc timestamp at time of reading
+# entries are checked for changed docs before use, ttl limits how long a missed change can be served for
+_read_cache = memcache.get_ttl_cache("binary_summary_read", maxsize=1000, ttl=600)
+
 
 def read(
     ctx: context.Context,
@@ -28,7 +32,11 @@ def read(
         details: list[Detail] = [x for x in Detail]
 
     sha256 = sha256.lower()
-    ret = _read_within(ctx, sha256, details=details, bucket_size=bucket_size, author=author)
+    if author:
+        # document checks for cached results are made across all authors
+        ret = _read_within(ctx, sha256, details=details, bucket_size=bucket_size, author=author)
+    else:
+        ret = _read_within_cached(ctx, sha256, details=details, bucket_size=bucket_size)
 
     if Detail.children in details:
         # get children
@@ -46,6 +54,36 @@ def read(
     return ret
 
 
+def _read_within_cached(
+    ctx: context.Context,
+    sha256: str,
+    details: list[models_restapi.BinaryMetadataDetail],
+    bucket_size: int,
+) -> models_restapi.BinaryMetadata:
+    """Return plugin information about a specific binary, reusing a cached result if the binary is unchanged."""
+    key = (
+        sha256,
+        frozenset(details),
+        bucket_size,
+        ctx.get_user_security_unique(),
+        tuple(sorted(ctx.sd.security_exclude)),
+        tuple(sorted(ctx.sd.security_include)),
+    )
+    cached = _read_cache.get(key)
+    if cached and binary_read.get_binaries_unchanged(ctx, {sha256: cached[1]}):
+        return cached[0].model_copy(deep=True)
+
+    # newest document is always required to check for changes to the binary
+    ret = _read_within(ctx, sha256, details=[*details, Detail.documents], bucket_size=bucket_size)
+    documents = ret.documents.model_copy()
+    if Detail.documents not in details:
+        ret.documents.newest = None
+    # count is only accurate below 10k docs unless total hits are requested
+    if documents.count < 10000 or Detail.total_hits in details:
+        _read_cache[key] = (ret.model_copy(deep=True), documents)
+    return ret
+
+
 def _read_within(
     ctx: context.Context,
     sha256: str,
@@ -12,7 +12,7 @@ from pydantic import BaseModel
 from azul_metastore.common.query_info import IngestError
 from azul_metastore.common.utils import capture_write_stats, get_author_from_generic_event
 from azul_metastore.context import Context
-from azul_metastore.encoders import binary2
+from azul_metastore.encoders import binary2, link
 from azul_metastore.models import basic_events
 from azul_metastore.query import age_off
 
@@ -22,6 +22,12 @@ azul_ingest_drop_already_aged_off = Counter(
     ["plugin"],
 )
 
+azul_ingest_link_errors = Counter(
+    "azul_ingest_link_errors",
+    "Links copied from binary2 docs that failed to index in the link index.",
+    ["error_type"],
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -115,6 +121,8 @@ def _create_binary_events(
     if len(results) == 0:
         return bad_raw_results, duplicate_docs, dict()
 
+    # encode links before wrapping, as wrapping removes the id from the binary2 docs
+    links = [link.Link.encode(x) for x in results if link.Link.has_link(x)]
     wrapped = priv_ctx.man.binary2.w.wrap_docs(results)
     # try indexing, and if it fails then ensure that all features are mapped in the template correctly, and retry
     doc_errors = priv_ctx.man.binary2.w.index_docs(priv_ctx.sd, wrapped, refresh=immediate)
@@ -127,6 +135,16 @@ def _create_binary_events(
             )
             doc_errors = priv_ctx.man.binary2.w.index_docs(priv_ctx.sd, wrapped, refresh=immediate)
 
+    # only copy links that were saved to binary2, links share their id with the binary2 doc
+    failed_ids = {x.doc_id for x in doc_errors}
+    link_errors = priv_ctx.man.link.w.wrap_and_index_docs(
+        priv_ctx.sd, [x for x in links if x["_id"] not in failed_ids], refresh=immediate, raise_on_errors=False
+    )
+    # the binary2 doc was saved, so a failed link is not an ingest failure of the event
+    for err in link_errors:
+        azul_ingest_link_errors.labels(err.error_type).inc()
+        logger.error(f"failed to index link {err.error_type}: {err.error_reason}")
+
     author_results: dict[str, int] = defaultdict(int)
     for r in results:
         if isinstance(r, BaseModel):
@@ -157,6 +157,8 @@ class Purger:
                 )
 
             total_purged_count += len(id_deletes)
+            # remove copies of any links held by the deleted docs, which share ids with the binary2 docs
+            ctx.man.link.w.delete_loop(ctx.sd, {"query": {"ids": {"values": [doc["_id"] for doc in docs]}}})
 
         if not total_purged_count:
             return 0, None
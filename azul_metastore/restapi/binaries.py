@@ -13,14 +13,14 @@ from azul_bedrock.models_restapi import AutocompleteContext
 from azul_bedrock.models_restapi import binaries as bedr_binaries
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
     Body,
     Depends,
     Path,
     Query,
     Response,
 )
-from starlette.status import HTTP_422_UNPROCESSABLE_CONTENT
+from starlette.responses import StreamingResponse
+from starlette.status import HTTP_200_OK, HTTP_422_UNPROCESSABLE_CONTENT
 
 from azul_metastore import context
 from azul_metastore.common.search_query import validate_term_query
@@ -100,6 +100,55 @@ def find_binaries(
     return qr.fr(ctx, data, resp)
 
 
+@router.post(
+    "/v0/binaries/deferred",
+    response_class=StreamingResponse,
+    responses={
+        HTTP_200_OK: {
+            "description": "Newline delimited json with matching sha256s followed by batches of summaries",
+            "content": {"application/x-ndjson": {}},
+        },
+    },
+)
+def find_binaries_deferred(
+    term: str = Query(None, description="A free text Azul search term"),
+    sort: bedr_binaries.FindBinariesSortEnum = Query(
+        bedr_binaries.FindBinariesSortEnum.score,
+        description="Sort results by this property.",
+    ),
+    sort_asc: bool = Query(
+        False,
+        description="Sort results in ascending order.",
+    ),
+    max_entities: int = Query(100, description="Maximum number of binaries to return"),
+    count_entities: bool = Query(False, description="Also return the total number of binaries that match the search"),
+    ctx: context.Context = Depends(qr.ctx),
+):
+    """Find entities in the system based on search term, streaming summary information as it is retrieved.
+
+    The first line holds the sha256s of matching binaries in result order (and the total count if requested).
+    Each following line holds summary rows for a batch of those binaries, and any binaries that were removed
+    from results as they could not be summarised.
+    """
+    try:
+        lines = binary_find.find_binaries_deferred(
+            ctx,
+            term=term,
+            sort=sort,
+            sort_asc=sort_asc,
+            max_binaries=max_entities,
+            count_binaries=count_entities,
+        )
+    except exceptions_metastore.InvalidSearchException as e:
+        raise exceptions_metastore.convert_exception_to_api_exception(
+            base_exception=e, new_error_enum=ExceptionCodeEnum.MetastoreFindBinaryInvalidSearch, status_code=400
+        ) from e
+
+    resp = StreamingResponse(lines, media_type="application/x-ndjson", status_code=HTTP_200_OK)
+    qr.set_security_headers(ctx, resp)
+    return resp
+
+
 @router.post("/v0/binaries/all", response_model=qr.gr(bedr_binaries.EntityFindSimple), **qr.kw)
 def find_all_binaries(
     resp: Response,
@@ -146,6 +195,48 @@ def find_all_binaries(
     return qr.fr(ctx, data, resp)
 
 
+@router.post(
+    "/v0/binaries/all/stream",
+    response_class=StreamingResponse,
+    responses={
+        HTTP_200_OK: {
+            "description": "Newline delimited json with one row per binary",
+            "content": {"application/x-ndjson": {}},
+        },
+    },
+)
+def stream_all_binaries(
+    term: str = Query(None, description="A free text Azul search term"),
+    include_summary: bool = Query(False, description="Include summary information for each binary"),
+    page_size: int = Query(1000, description="Number of sha256s to read from opensearch at a time", ge=1, le=10000),
+    ctx: context.Context = Depends(qr.ctx),
+):
+    """Stream every binary in the system matching the search term as newline delimited json.
+
+    Each line is a json object with the sha256 of a matching binary, and summary information if requested.
+    Rows are sorted alphabetically by sha256.
+
+    This avoids the overhead of paging through '/v0/binaries/all' when recalling very large result sets.
+    As with '/v0/binaries/all', results are not 'point-in-time' and binaries added during the
+    request may or may not be included.
+    """
+    try:
+        lines = binary_find_paginate.stream_all_binaries(
+            ctx,
+            term=term,
+            page_size=page_size,
+            include_summary=include_summary,
+        )
+    except exceptions_metastore.InvalidSearchException as e:
+        raise exceptions_metastore.convert_exception_to_api_exception(
+            e, new_error_enum=ExceptionCodeEnum.MetastoreFindBinaryInvalidSearch, status_code=400
+        ) from e
+
+    resp = StreamingResponse(lines, media_type="application/x-ndjson", status_code=HTTP_200_OK)
+    qr.set_security_headers(ctx, resp)
+    return resp
+
+
 @router.post("/v0/binaries/all/parents", response_model=qr.gr(bedr_binaries.EntityFindSimpleFamily), **qr.kw)
 def find_all_parents(
     resp: Response,
@@ -338,15 +429,15 @@ def get_similar_entropy_binaries(
 @router.get("/v0/binaries/{sha256}/similar/features", response_model=qr.gr(bedr_binaries.SimilarFeatureMatch), **qr.kw)
 def get_similar_feature_binaries(
     resp: Response,
-    bt: BackgroundTasks,
     sha256: str = Path(..., pattern="[a-fA-F0-9]{64}"),
     recalculate: bool = False,
     ctx: context.Context = Depends(qr.ctx),
 ):
-    """Return info about entities with similar features to the provided sha256."""
-    gen = binary_similar.read_similar_from_features(ctx, sha256, recalculate=recalculate)
-    data = next(gen)
-    bt.add_task(lambda: next(gen))
+    """Return info about entities with similar features to the provided sha256.
+
+    Matches are calculated in the background, poll until the status is complete.
+    """
+    data = binary_similar.start_similar_from_features(ctx, sha256, recalculate=recalculate)
     return qr.fr(ctx, data, resp)
 
 
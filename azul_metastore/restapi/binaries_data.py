@@ -1,22 +1,18 @@
 """Download or interact with binary datastreams."""
 
-import io
-import itertools
+import asyncio
+import functools
 import logging
 import re
 import time
-from dataclasses import dataclass, field
-from typing import AsyncIterable, Awaitable, Callable, Generator
+from typing import AsyncIterable, Awaitable, Callable
 
-import pyzipper
 from azul_bedrock.exception_enums import ExceptionCodeEnum
 from azul_bedrock.exceptions_bedrock import (
     ApiException,
     BaseError,
-    DispatcherApiException,
 )
 from azul_bedrock.models_restapi import binaries_data as bedr_binaries_data
-from cart import cart
 from fastapi import (
     APIRouter,
     Body,
@@ -31,7 +27,15 @@ from starlette.responses import StreamingResponse
 from starlette.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
 from azul_metastore import context, settings
-from azul_metastore.common import data_hex, data_strings, string_filter
+from azul_metastore.common import (
+    block_cache,
+    data_hex,
+    data_strings,
+    data_zip,
+    fileformat,
+    string_filter,
+    string_index,
+)
 from azul_metastore.common.fileformat import get_attachment_type
 from azul_metastore.query.binary2 import binary_read
 from azul_metastore.restapi.quick import qr
@@ -54,7 +58,7 @@ async def check_has_binary(
 ):
     """Check if a binary exists."""
     # check user can access binary (enforce security)
-    exists, source, label = binary_read.verify_stream_exists(ctx, sha256)
+    exists, source, label = await asyncio.to_thread(binary_read.verify_stream_exists, ctx, sha256)
     if not exists:
         raise ApiException(
             status_code=HTTP_404_NOT_FOUND,
@@ -83,7 +87,7 @@ async def download_binary_encoded(
 ):
     """Download a binary file and cart it."""
     # check user can access binary (enforce security)
-    exists, source, label = binary_read.verify_stream_exists(ctx, sha256)
+    exists, source, label = await asyncio.to_thread(binary_read.verify_stream_exists, ctx, sha256)
 
     try:
         if not exists:
@@ -94,8 +98,7 @@ async def download_binary_encoded(
                 parameters={"sha256": sha256},
             )
         async_iter_content = await ctx.dispatcher.async_get_binary(source, label, sha256)
-        # Disable digestors as we don't need them and they are super slow.
-        packed_cart_stream = cart.async_pack_iterable(async_iter_content, auto_digests=())
+        packed_cart_stream = await fileformat.async_pack_cart(async_iter_content)
         qr.set_security_headers(ctx, resp)
         return StreamingResponse(
             packed_cart_stream,
@@ -125,7 +128,6 @@ async def download_binaries(
     """Download requested binaries in a ZIP file."""
     # do simple hash lookup to check if user can access binary
     try:
-        to_download = []
         for sha256 in binaries:
             if not re.match(r"[a-fA-F0-9]{64}", sha256):
                 raise ApiException(
@@ -133,7 +135,10 @@ async def download_binaries(
                     internal=ExceptionCodeEnum.MetastoreInvalidSha256Provided,
                     parameters={"sha256": sha256},
                 )
-            exists, source, label = binary_read.verify_stream_exists(ctx, sha256)
+        verified = await binary_read.async_verify_streams_exist(ctx, binaries)
+        to_download = []
+        for sha256 in binaries:
+            exists, source, label = verified[sha256]
             if exists:
                 to_download.append((source, label, sha256))
 
@@ -145,22 +150,14 @@ async def download_binaries(
                 internal=ExceptionCodeEnum.MetastoreBulkUnableToDownloadAnyBinaries,
             )
 
-        success = False
-        ostream = io.BytesIO()
-        with pyzipper.ZipFile(ostream, mode="w", compression=pyzipper.ZIP_DEFLATED) as zf:
-            for source, label, sha256 in to_download:
-                try:
-                    rsp = ctx.dispatcher.get_binary(source, label, sha256)
-                except DispatcherApiException:
-                    continue
-                else:
-                    data = rsp.content
-                    zf.writestr(sha256, data)
-                    success = True
-        ostream.seek(0)
-
+        # files are fetched and compressed as the response is sent, so the whole zip is never held in memory
+        entries = [
+            (sha256, functools.partial(ctx.dispatcher.async_get_binary, source, label, sha256))
+            for source, label, sha256 in to_download
+        ]
+        zip_stream = data_zip.ZipStream(entries)
         # check that we got at least one file for the zip
-        if not success:
+        if not await zip_stream.first_entry():
             raise ApiException(
                 status_code=HTTP_404_NOT_FOUND,
                 ref="No items found",
@@ -170,7 +167,7 @@ async def download_binaries(
         for _source, _label, sha256 in to_download:
             ctx.man.s.log_to_loki(ctx.user_info.username, request, sha256)
 
-        resp = StreamingResponse(ostream, media_type="application/octet-stream", status_code=HTTP_200_OK)
+        resp = StreamingResponse(zip_stream.stream(), media_type="application/octet-stream", status_code=HTTP_200_OK)
         qr.set_security_headers(ctx, resp)
         return resp
     except (HTTPException, ApiException) as e:
@@ -196,7 +193,8 @@ async def download_binary_raw(
     ctx: context.Context = Depends(qr.ctx),
 ):
     """Download a stream for a binary for permitted file types."""
-    source, stream_data = binary_read.find_stream_metadata(
+    source, stream_data = await asyncio.to_thread(
+        binary_read.find_stream_metadata,
         ctx,
         sha256=sha256,
         stream_hash=stream,
@@ -268,42 +266,6 @@ def get_hex_view(
     ctx: context.Context = Depends(qr.ctx),
 ) -> bedr_binaries_data.BinaryHexView:
     """Return JSON of hex text of file requested."""
-
-    def hex_group_formatter(iterable, _chunk_size) -> list[str]:
-        """Print data bytes in readable hex."""
-        # convert each byte to plaintext
-        ret = [format(x, "0>2x").upper() for x in iterable]
-        # Buffer to ensure always chuck_size numb. in array returned
-        ret += ["" for _ in range(len(ret), _chunk_size)]
-        return ret
-
-    def hex_group_line_formatter(iterable, _chunk_size) -> str:
-        """Print data bytes in readable hex."""
-        # convert each byte to plaintext
-        ret = [format(x, "0>2x").lower() for x in iterable]
-        # group every two bytes together
-        tmp = ["".join(ret[i : (i + 2)]) for i in range(0, _chunk_size, 2)]
-        # separate every two bytes by a space
-        return " ".join(x for x in tmp if x)
-
-    def hex_viewer(
-        stream, _offset, _chunk_size
-    ) -> Generator[bedr_binaries_data.BinaryHexView.BinaryHexValue, None, None]:
-        """Iterate through binary displaying as human readable hex."""
-        for chunk_count in itertools.count(1):
-            chunk = stream[(chunk_count - 1) * _chunk_size : (chunk_count - 1) * _chunk_size + _chunk_size]
-            if not chunk:
-                return
-            if shortform:
-                hex = hex_group_line_formatter(chunk, _chunk_size)
-            else:
-                hex = hex_group_formatter(chunk, _chunk_size)
-            yield bedr_binaries_data.BinaryHexView.BinaryHexValue(
-                address=_offset + (chunk_count - 1) * _chunk_size,
-                hex=hex,
-                ascii=data_hex.ascii_group_formatter(chunk),
-            )
-
     # do simple hash lookup to check if user can access binary
     exists, source, label = binary_read.verify_stream_exists(ctx, sha256)
 
@@ -322,19 +284,26 @@ def get_hex_view(
         else:
             end_byte = offset + max_bytes_to_read - 1
 
-        rsp = ctx.dispatcher.get_binary(
-            source=source,
-            label=label,
-            sha256=sha256,
-            start_pos=offset,
-            end_pos=end_byte,
-        )
-
-        data = rsp.content
+        # blocking calls are fine in this route, as fastapi runs sync routes in a threadpool
+        cache = block_cache.get()
+        if cache is not None and end_byte is not None and cache.cacheable(offset, end_byte):
+            # pages of the hex view are usually read in order, so are served from cached blocks
+            data, total_content_length = cache.read(ctx.dispatcher, source, label, sha256, offset, end_byte)
+        else:
+            rsp = ctx.dispatcher.get_binary(
+                source=source,
+                label=label,
+                sha256=sha256,
+                start_pos=offset,
+                end_pos=end_byte,
+            )
+            data = rsp.content
+            total_content_length = len(data)
+            if offset != 0 or end_byte is not None:
+                total_content_length = int(rsp.headers["Content-Range"].split("/")[-1], 10)
 
         # Sort out ranges
         if offset != 0 or end_byte is not None:
-            total_content_length = int(rsp.headers["Content-Range"].split("/")[-1], 10)
             if end_byte is None:
                 next_start_byte = total_content_length
             else:
@@ -343,24 +312,15 @@ def get_hex_view(
             next_offset = min(total_content_length, next_start_byte)
 
         else:
-            total_content_length = len(rsp.content)
             has_more = False
             next_offset = total_content_length
 
-        chunk_size = 16
-        values = list(hex_viewer(data, offset, chunk_size))
-        if shortform:
-            header = bedr_binaries_data.BinaryHexView.BinaryHexHeader(
-                address="ADDRESS",
-                hex=hex_group_line_formatter(range(chunk_size), chunk_size),
-                ascii="ASCII",
-            )
-        else:
-            header = bedr_binaries_data.BinaryHexView.BinaryHexHeader(
-                address="ADDRESS",
-                hex=hex_group_formatter(range(chunk_size), chunk_size),
-                ascii="ASCII",
-            )
+        values = data_hex.hex_view_rows(data, offset, shortform)
+        header = bedr_binaries_data.BinaryHexView.BinaryHexHeader(
+            address="ADDRESS",
+            hex=data_hex.hex_view_header(shortform),
+            ascii="ASCII",
+        )
     except (HTTPException, ApiException) as e:
         qr.set_security_headers(ctx, resp, ex=e)
         raise
@@ -386,10 +346,19 @@ async def _handle_search_query(
         Awaitable[tuple[list[bedr_binaries_data.SearchResult], int, bool]],
     ],
     is_ai_filtering: bool = False,
+    indexed_provider: (
+        Callable[
+            [str, str, int, int | None], Awaitable[tuple[list[bedr_binaries_data.SearchResult], int, bool] | None]
+        ]
+        | None
+    ) = None,
 ) -> bedr_binaries_data.BinaryStrings:
-    """Generic handler that searches for content in a file with a given search engine."""
+    """Generic handler that searches for content in a file with a given search engine.
+
+    If an indexed provider is given and can answer the search, the file is not read.
+    """
     # do simple hash lookup to check if user can access binary
-    exists, source, label = binary_read.verify_stream_exists(ctx, sha256)
+    exists, source, label = await asyncio.to_thread(binary_read.verify_stream_exists, ctx, sha256)
     if not exists:
         raise ApiException(
             status_code=HTTP_404_NOT_FOUND,
@@ -404,8 +373,14 @@ async def _handle_search_query(
     else:
         end_byte = offset + max_bytes_to_read - 1
 
-    async_iterable_content = await ctx.dispatcher.async_get_binary(source, label, sha256, offset, end_byte)
-    strings, read_content_length, has_more = await provider(async_iterable_content, offset)
+    indexed = await indexed_provider(source, label, offset, end_byte) if indexed_provider else None
+    if indexed is not None:
+        strings, read_content_length, has_more = indexed
+    else:
+        async_iterable_content = await block_cache.async_get_binary(
+            ctx.dispatcher, source, label, sha256, offset, end_byte
+        )
+        strings, read_content_length, has_more = await provider(async_iterable_content, offset)
     next_offset = offset + read_content_length
     if is_ai_filtering:
         return bedr_binaries_data.BinaryStrings(
@@ -516,6 +491,26 @@ async def get_strings(
         strings.sort(key=lambda x: x.offset)
         return strings, read_content_length, has_more_content
 
+    async def indexed_handler(
+        source: str, label: str, current_offset: int, end_byte: int | None
+    ) -> tuple[list[bedr_binaries_data.SearchResult], int, bool] | None:
+        """Search the local index of the binary's strings, if there is one."""
+        return await asyncio.to_thread(
+            string_index.search_strings,
+            ctx.dispatcher,
+            ctx.user_info.username,
+            source,
+            label,
+            sha256,
+            min_length=min_length,
+            max_length=max_length,
+            start=current_offset,
+            end=None if end_byte is None else end_byte + 1,
+            find_string=exported_find_filter,
+            find_regex=exported_regex,
+            max_results=take_n_strings,
+        )
+
     try:
         search = await _handle_search_query(
             sha256,
@@ -525,6 +520,8 @@ async def get_strings(
             ctx,
             search_handler,
             is_ai_filtering,
+            # ai filtering processes every string read, rather than a page of strings
+            None if is_ai_filtering else indexed_handler,
         )
     except (HTTPException, ApiException) as e:
         qr.set_security_headers(ctx, resp, ex=e)
@@ -538,26 +535,30 @@ async def get_strings(
     if file_format and s.smart_string_filter_url:
         while True:
             last_processed_offset = 0
-            batch_size = 2000
+            batch_size = s.smart_string_filter_batch_size
             ai_filtered_strings = []
             MAX_STRINGS_TO_FIND = 20
-            TIME_OUT = 30  # 30 second timeout
-            start_time = time.time()
+            deadline = time.monotonic() + s.smart_string_filter_timeout
 
             for i in range(0, len(search.strings), batch_size):
                 try:
                     current_batch_size = min(batch_size, len(search.strings) - i)
                     batch = search.strings[i : i + current_batch_size]  # Slice the list into batches
                     # call the AI string filter pod
-                    response = string_filter.call_string_filter(file_format, batch, s.smart_string_filter_url)
+                    response = await string_filter.call_string_filter(
+                        file_format, batch, s.smart_string_filter_url, timeout=max(deadline - time.monotonic(), 0)
+                    )
                     ai_filtered_strings.extend(response)
                     safe_index = i + min(batch_size, len(search.strings) - i) - 1
                     last_processed_offset = search.strings[safe_index].offset
                     if len(ai_filtered_strings) >= MAX_STRINGS_TO_FIND:
                         break
-                    if (time.time() - start_time) > TIME_OUT:
+                    if time.monotonic() > deadline:
                         time_out = True
                         break
+                except TimeoutError:
+                    time_out = True
+                    break
                 except (HTTPException, ApiException) as e:
                     qr.set_security_headers(ctx, resp, ex=e)
                     raise
@@ -672,15 +673,6 @@ async def search_hex(
     return search
 
 
-def find_common_strings(stringsA: set[str], stringsB: set[str]) -> list[str]:
-    """Find all common strings between two sets."""
-    result = []
-    for s in stringsA:
-        if s in stringsB:
-            result.append(s)
-    return result
-
-
 @router.get(
     "/v0/binaries/{sha256A}/{sha256B}/strings",
     response_model=bedr_binaries_data.CommonBinaryStrings,
@@ -720,19 +712,11 @@ async def get_common_strings(
 
     Looks for ASCII, UTF-16 and UTF-32 big and little endian strings.
     """
-
-    @dataclass
-    class Sha256StreamAndStrings:
-        """Hold the stream that is being processed and the strings associated with that stream."""
-
-        content_stream: AsyncIterable[bytes]
-        content_read: int = 0
-        strings: set[str] = field(default_factory=set)
-
-    sha256_info: list[Sha256StreamAndStrings] = []
+    end_byte = max_bytes_to_read - 1 if max_bytes_to_read is not None else None
+    content_streams: list[AsyncIterable[bytes]] = []
     for sha256 in [sha256A, sha256B]:
         # do simple hash lookup to check if user can access binary
-        exists, source, label = binary_read.verify_stream_exists(ctx, sha256)
+        exists, source, label = await asyncio.to_thread(binary_read.verify_stream_exists, ctx, sha256)
         if not exists:
             raise ApiException(
                 status_code=HTTP_404_NOT_FOUND,
@@ -740,58 +724,23 @@ async def get_common_strings(
                 internal=ExceptionCodeEnum.MetastoreBinaryStreamNotFound,
                 parameters={"sha256": sha256},
             )
-        if max_bytes_to_read is not None:
-            max_bytes_to_read = max_bytes_to_read - 1
-        async_iterable_content = await ctx.dispatcher.async_get_binary(source, label, sha256, 0, max_bytes_to_read)
-        sha256_info.append(
-            Sha256StreamAndStrings(
-                content_stream=async_iterable_content,
-            )
-        )
-    common_strings: list[str] = list()
-    all_file_content_read = False
-
-    while len(common_strings) < take_n_strings:
-        all_files_complete = True
-        for cur_sha256 in sha256_info:
-            (
-                strings,
-                read_content_length,
-                has_more_content,
-            ) = await data_strings.get_strings(
-                data_stream=cur_sha256.content_stream,
-                min_length=min_length,
-                max_length=max_length,
-                offset=0,
-                find_string=None,
-                find_regex=None,
-                strings_to_read_before_stopping=take_n_strings
-                * 2,  # doubled to reduce number of calls to find common strings
-            )
-            # set all the internals
-            cur_sha256.content_read += read_content_length
-            cur_sha256.strings.update(set(x.string for x in strings))
-            if has_more_content:
-                all_files_complete = False
-
-        common_strings = find_common_strings(sha256_info[0].strings, sha256_info[1].strings)
-        # Exit if all files have no more content
-        if all_files_complete:
-            all_file_content_read = True
-            break
+        content_streams.append(await block_cache.async_get_binary(ctx.dispatcher, source, label, sha256, 0, end_byte))
+
+    common, content_read, all_file_content_read = await data_strings.get_common_strings(
+        (content_streams[0], content_streams[1]),
+        min_length=min_length,
+        max_length=max_length,
+        take_n_strings=take_n_strings,
+    )
 
     qr.set_security_headers(ctx, resp)
 
     # All content is read so all strings were found.
-    incomplete_compare = True
-    if all_file_content_read:
-        incomplete_compare = False
-
-    # If the content of a file is longer than what was read not all strings were found.
-    if max_bytes_to_read is not None:
-        for f in sha256_info:
-            if f.content_read > max_bytes_to_read - 2:
-                incomplete_compare = True
+    incomplete_compare = not all_file_content_read
+
+    # If all requested content of a file was read, the file may be longer so not all strings were found.
+    if max_bytes_to_read is not None and any(read >= max_bytes_to_read for read in content_read):
+        incomplete_compare = True
     # Sort for consistency as sets are being used.
-    common_strings.sort()
+    common_strings = sorted(common)
     return bedr_binaries_data.CommonBinaryStrings(strings=common_strings, incomplete=incomplete_compare)
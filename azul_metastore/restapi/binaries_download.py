@@ -1,5 +1,7 @@
 """Submit or trigger processing for binaries."""
 
+import asyncio
+
 from azul_bedrock import models_restapi
 from azul_bedrock.exception_enums import ExceptionCodeEnum
 from azul_bedrock.exceptions_bedrock import ApiException, BaseError
@@ -100,7 +102,9 @@ async def get_binary_download_request_status(
     ctx: context.Context = Depends(qr.ctx),
 ):
     """Get the status per plugin for a download request that was submitted."""
-    result = status.get_binary_status_for_download_plugins(ctx, sha256, include_download_requests)
+    result = await asyncio.to_thread(
+        status.get_binary_status_for_download_plugins, ctx, sha256, include_download_requests
+    )
     if len(result) == 0:
         raise ApiException(
             status_code=HTTP_404_NOT_FOUND,
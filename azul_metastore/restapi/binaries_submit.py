@@ -1,5 +1,6 @@
 """Submit or trigger processing for binaries."""
 
+import asyncio
 import json
 import logging
 from typing import Annotated, Optional, Self
@@ -507,7 +508,7 @@ async def expedite_processing(
     security = ctx.azsec.get_default_security()
     try:
         qr.set_security_headers(ctx, resp, security)
-        binary_expedite.expedite_processing(ctx, qr.writer, sha256, bypass_cache)
+        await asyncio.to_thread(binary_expedite.expedite_processing, ctx, qr.writer, sha256, bypass_cache)
         return True
     except (HTTPException, ApiException) as e:
         qr.set_security_headers(ctx, resp, security, ex=e)
@@ -180,6 +180,12 @@ class Metastore(BaseSettings):
     admin_role: str = "admin"
     # URL for AI string filter
     smart_string_filter_url: str = ""
+    # max strings sent to the AI string filter in one call, coalesced across concurrent requests
+    smart_string_filter_batch_size: int = 2000
+    # max concurrent connections to the AI string filter
+    smart_string_filter_max_connections: int = 10
+    # seconds a strings request may spend waiting on the AI string filter
+    smart_string_filter_timeout: float = 30.0
     # destination folder for sha256s txt that need to be checked for usage after a deletion
     # ensure that this folder is persistent to avoid orphaned files (i.e. pvc not ephemeral)
     purge_sha256_folder: str = ""
@@ -191,9 +197,51 @@ class Metastore(BaseSettings):
     # cache that prevents duplicate opensearch doc creation
     binary2_cache_count: int = 1_000_000  # number of ids to cache, approx 64 bytes per id
 
+    # max files extracted from a submission that are uploaded to dispatcher at the same time
+    submit_concurrency: int = 8
+    # max events sent to dispatcher in a single request when submitting extracted files
+    submit_events_batch_size: int = 1000
+
+    # worker threads that cart/uncart and unmalpz files, so large files don't hold up requests
+    decode_workers: int = 4
+    # chunks of each decoded stream that are buffered while waiting to be read
+    decode_queue_chunks: int = 16
+    # worker threads that cart downloads, separate from decode workers as each is held until the client has read
+    # the whole download
+    download_encode_workers: int = 16
+
     # Change the restapi into readonly mode where uploads are no longer allowed.
     readonly_mode: bool = False
 
+    # find similar tlsh hashes with a local index scored by tlsh distance, rather than the opensearch kNN search
+    tlsh_local_index: bool = False
+    # seconds before the local tlsh index is reloaded from opensearch
+    tlsh_local_index_refresh: int = 3600
+    # maximum tlsh distance for a binary to be considered similar when using the local index
+    tlsh_local_max_distance: int = 100
+
+    # number of similar by features calculations that can run at once in the background
+    similar_features_workers: int = 4
+    # number of similar by features calculations that a single user can have queued or running
+    similar_features_jobs_per_user: int = 2
+
+    # number of blocks of binaries cached for paging through hex views and strings, 0 to disable
+    binary_block_cache_count: int = 64
+    # size in bytes of each cached block of a binary
+    binary_block_size: int = 1024 * 1024
+
+    # folder for local indexes of the strings in binaries, used for repeated string searches. empty to disable
+    string_index_folder: str = ""
+    # total size in bytes of the string indexes kept, least recently used indexes are removed first
+    string_index_max_bytes: int = 10 * 1024 * 1024 * 1024
+    # binaries larger than this are not indexed
+    string_index_max_binary_size: int = 512 * 1024 * 1024
+    # shortest and longest strings kept in the index, searches outside these lengths read the binary
+    string_index_min_length: int = 4
+    string_index_max_length: int = 1000
+    # number of string indexes that can be built at once in the background
+    string_index_workers: int = 2
+
     def log_to_loki(
         self,
         username: str,
@@ -0,0 +1,82 @@
+"""Benchmark memory use and throughput of extracting archives with thousands of members."""
+
+import io
+import random
+import tarfile
+import time
+import tracemalloc
+import zipfile
+
+from azul_metastore.common import fileformat
+from benchmark_common import BaseBenchmarkTest
+
+MB = 1024 * 1024
+MEMBERS = fileformat.MAX_BUNDLED_FILES - 1
+# sizes of members, mostly small with a few large files
+SIZES = [4 * 1024] * (MEMBERS - 20) + [4 * MB] * 20
+
+
+def _members(rng: random.Random) -> dict[str, bytes]:
+    """Return members of compressible, but not trivially compressible, data."""
+    words = [rng.randbytes(8) for _ in range(256)]
+    ret = {}
+    for i, size in enumerate(SIZES):
+        ret[f"dir_{i % 10}/file_{i}.bin"] = b"".join(rng.choices(words, k=size // 8))
+    return ret
+
+
+def _zip(members: dict[str, bytes]) -> bytes:
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return out.getvalue()
+
+
+def _tar_gz(members: dict[str, bytes]) -> bytes:
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode="w:gz") as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return out.getvalue()
+
+
+class TestBenchmarkArchiveExtract(BaseBenchmarkTest):
+    """Benchmark extracting zip and tar.gz archives holding ~80MB of files.
+
+    Does not need OpenSearch.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Required."""
+        members = _members(random.Random(42))
+        cls.size = sum(len(x) for x in members.values())
+        cls.archives = {"zip": _zip(members), "tar.gz": _tar_gz(members)}
+
+    def _extract(self, data: bytes) -> tuple[float, int]:
+        """Extract each member as an upload would, returning seconds taken and peak memory allocated."""
+        tracemalloc.start()
+        start = time.perf_counter()
+        count = 0
+        for member in fileformat.iter_archive(io.BytesIO(data)):
+            while member.stream.read(fileformat.EXTRACT_CHUNK_SIZE):
+                pass
+            member.stream.close()
+            count += 1
+        taken = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertEqual(MEMBERS, count)
+        return taken, peak
+
+    def test_extract(self):
+        for kind, data in self.archives.items():
+            taken, peak = self._extract(data)
+            print(
+                f"{kind} ({len(data) / MB:.1f}MB, {MEMBERS} members): {self.size / MB / taken:.1f}MB/s extracted, "
+                f"{MEMBERS / taken:.0f} members/s, peak memory {peak / MB:.1f}MB"
+            )
+        self.benchmark.pedantic(lambda: self._extract(self.archives["tar.gz"]), rounds=3)
@@ -0,0 +1,56 @@
+"""Benchmark finding common strings between two large binaries."""
+
+import asyncio
+import random
+
+from azul_metastore.common import data_strings
+from benchmark_common import BaseBenchmarkTest
+
+MB = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def _blob(rng: random.Random, words: list[bytes], size: int) -> bytes:
+    """Return random binary data of the given size with the words spread through it."""
+    out = bytearray()
+    while len(out) < size:
+        out += rng.randbytes(rng.randint(8, 64))
+        out += b"\x00" + rng.choice(words) + b"\x00"
+    return bytes(out[:size])
+
+
+async def _stream(data: bytes):
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield data[i : i + CHUNK_SIZE]
+
+
+class TestBenchmarkCommonStrings(BaseBenchmarkTest):
+    """Benchmark the common strings engine against two synthetic 50MB blobs with a controlled overlap.
+
+    Does not need OpenSearch.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Required."""
+        rng = random.Random(42)
+        shared = [b"shared_%06d" % i for i in range(20000)]
+        only_a = [b"only_a_%06d" % i for i in range(20000)]
+        only_b = [b"only_b_%06d" % i for i in range(20000)]
+        cls.blob_a = _blob(rng, shared + only_a, 50 * MB)
+        cls.blob_b = _blob(rng, shared + only_b, 50 * MB)
+
+    def _compare(self, take_n_strings: int):
+        def run():
+            return asyncio.run(
+                data_strings.get_common_strings((_stream(self.blob_a), _stream(self.blob_b)), 4, 200, take_n_strings)
+            )
+
+        common, _, _ = self.benchmark.pedantic(run, rounds=3)
+        self.assertTrue(all(s.startswith("shared_") for s in common))
+
+    def test_take_5000(self):
+        self._compare(5000)
+
+    def test_take_all(self):
+        self._compare(1_000_000)
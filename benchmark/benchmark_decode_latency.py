@@ -0,0 +1,78 @@
+"""Benchmark event loop latency while large uploads are uncarted."""
+
+import asyncio
+import io
+import os
+import time
+
+from cart import cart
+
+from azul_metastore.common import decode_pool
+from benchmark_common import BaseBenchmarkTest
+
+MB = 1024 * 1024
+UPLOAD_SIZE = 100 * MB
+UPLOADS = 8
+CHUNK_SIZE = 64 * 1024
+# how often the event loop is checked for responsiveness
+TICK_SECONDS = 0.01
+
+
+async def _stream(data: bytes):
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield data[i : i + CHUNK_SIZE]
+
+
+async def _uncart(unpack, data: bytes) -> int:
+    stream, _ = await unpack(_stream(data))
+    return sum([len(x) async for x in stream])
+
+
+async def _lag(unpack, data: bytes) -> tuple[float, float, float]:
+    """Uncart concurrent uploads, returning seconds taken and the mean and max delay of a ticking task."""
+    lags = []
+
+    async def _ticker():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            lags.append(time.perf_counter() - start - TICK_SECONDS)
+
+    ticker = asyncio.create_task(_ticker())
+    start = time.perf_counter()
+    sizes = await asyncio.gather(*[_uncart(unpack, data) for _ in range(UPLOADS)])
+    taken = time.perf_counter() - start
+    ticker.cancel()
+    assert sizes == [UPLOAD_SIZE] * UPLOADS
+    return taken, sum(lags) / max(len(lags), 1), max(lags, default=taken)
+
+
+class TestBenchmarkDecodeLatency(BaseBenchmarkTest):
+    """Benchmark how long the event loop is held up while concurrent 100MB uploads are uncarted.
+
+    Does not need OpenSearch.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Required."""
+        # half random, half compressible
+        raw = os.urandom(UPLOAD_SIZE // 2) + b"\x00" * (UPLOAD_SIZE // 2)
+        out = io.BytesIO()
+        cart.pack_stream(io.BytesIO(raw), out, auto_digests=())
+        cls.carted = out.getvalue()
+
+    def test_decode_latency(self):
+        pool = decode_pool.DecodePool(workers=4, queue_chunks=16)
+        self.addCleanup(pool._executor.shutdown)
+        runs = {
+            "inline": cart.async_unpack_iterable,
+            "decode pool": lambda x: pool.stream(cart.async_unpack_iterable, x),
+        }
+        for name, unpack in runs.items():
+            taken, mean, worst = asyncio.run(_lag(unpack, self.carted))
+            print(
+                f"{name} ({UPLOADS} x {UPLOAD_SIZE // MB}MB): {UPLOADS * UPLOAD_SIZE / MB / taken:.0f}MB/s, "
+                f"event loop delay mean {mean * 1000:.1f}ms max {worst * 1000:.1f}ms"
+            )
+        self.benchmark.pedantic(asyncio.run, args=(_lag(runs["decode pool"], self.carted),), rounds=1)
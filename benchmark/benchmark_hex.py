@@ -0,0 +1,43 @@
+"""Benchmark rendering the hex view of large ranges."""
+
+import os
+
+from azul_metastore.common import data_hex
+from benchmark_common import BaseBenchmarkTest
+
+MB = 1024 * 1024
+
+
+class TestBenchmarkHexView(BaseBenchmarkTest):
+    """Benchmark rendering random data as hex view rows.
+
+    Does not need OpenSearch.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Required."""
+        cls.data = os.urandom(100 * MB)
+
+    def _render(self, size: int, shortform: bool):
+        data = self.data[:size]
+        rows = self.benchmark.pedantic(data_hex.hex_view_rows, args=(data, 0, shortform), rounds=3)
+        self.assertEqual(size // data_hex.HEX_ROW_SIZE, len(rows))
+
+    def test_shortform_1mb(self):
+        self._render(MB, True)
+
+    def test_shortform_10mb(self):
+        self._render(10 * MB, True)
+
+    def test_shortform_100mb(self):
+        self._render(100 * MB, True)
+
+    def test_longform_1mb(self):
+        self._render(MB, False)
+
+    def test_longform_10mb(self):
+        self._render(10 * MB, False)
+
+    def test_longform_100mb(self):
+        self._render(100 * MB, False)
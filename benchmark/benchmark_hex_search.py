@@ -0,0 +1,60 @@
+"""Benchmark searching for many hex patterns in a single pass against searching for each pattern in turn."""
+
+import asyncio
+import os
+import random
+import time
+
+from azul_metastore.common import data_hex
+from benchmark_common import BaseBenchmarkTest
+
+MB = 1024 * 1024
+SIZE = 50 * MB
+CHUNK_SIZE = 64 * 1024
+PATTERN_COUNT = 50
+
+
+async def _stream(data: bytes):
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield data[i : i + CHUNK_SIZE]
+
+
+class TestBenchmarkHexSearch(BaseBenchmarkTest):
+    """Benchmark hex pattern search throughput over random data.
+
+    Does not need OpenSearch.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Required."""
+        rng = random.Random(42)
+        cls.data = os.urandom(SIZE)
+        # patterns taken from the data so every pattern has at least one hit
+        cls.patterns = []
+        for _ in range(PATTERN_COUNT):
+            start = rng.randrange(SIZE - 16)
+            cls.patterns.append(cls.data[start : start + rng.randint(4, 16)])
+
+    def _report(self, name: str, elapsed: float):
+        print(
+            f"{name}: {PATTERN_COUNT} patterns over {SIZE // MB}MB in {elapsed:.2f}s, {SIZE / MB / elapsed:.1f} MB/s"
+        )
+
+    def test_single_pattern_loop(self):
+        async def run():
+            for pattern in self.patterns:
+                await data_hex.get_hex_hits(_stream(self.data), 0, 1000, pattern)
+
+        start = time.perf_counter()
+        self.benchmark.pedantic(asyncio.run, args=(run(),), rounds=1)
+        self._report("single pattern loop", time.perf_counter() - start)
+
+    def test_multi_pattern(self):
+        async def run():
+            return await data_hex.get_multi_hex_hits(_stream(self.data), 0, 1000 * PATTERN_COUNT, self.patterns)
+
+        start = time.perf_counter()
+        hits, _, _ = self.benchmark.pedantic(asyncio.run, args=(run(),), rounds=1)
+        self._report("multi pattern", time.perf_counter() - start)
+        self.assertTrue(all(hits[pattern] for pattern in self.patterns))
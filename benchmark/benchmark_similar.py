@@ -0,0 +1,115 @@
+"""Benchmark finding similar TLSH hashes with the OpenSearch kNN search and the local TLSH index."""
+
+import random
+import time
+
+from azul_metastore.common import tlsh_index
+from azul_metastore.common.tlsh import _swap_byte
+from azul_metastore.query.binary2 import binary_similar
+from benchmark_common import BaseBenchmarkTest, BinaryIngestorLocal
+
+MAX_MATCHES = 20
+SAMPLE_COUNT = 200
+
+
+def _random_vector(rng: random.Random) -> list[int]:
+    return [rng.randint(-128, 127) for _ in range(tlsh_index.VECTOR_LENGTH)]
+
+
+def _mutate_vector(rng: random.Random, vector: list[int], changes: int) -> list[int]:
+    """Return a copy of the vector with some of the code bytes randomised, keeping the header."""
+    ret = list(vector)
+    for i in rng.sample(range(tlsh_index.HEADER_LENGTH, tlsh_index.VECTOR_LENGTH), changes):
+        ret[i] = rng.randint(-128, 127)
+    return ret
+
+
+def _vector_to_tlsh(vector: list[int]) -> str:
+    """Reverse of tlsh._tlsh_to_array, for use in queries."""
+    values = tlsh_index.vector_to_array(vector).tolist()
+    data = [_swap_byte(values[0]), _swap_byte(values[1]), (values[2] << 4) | values[3]] + values[4:]
+    return "T1" + bytes(data).hex().upper()
+
+
+class TestBenchmarkTlshLocalIndex(BaseBenchmarkTest):
+    """Benchmark the local TLSH index against a synthetic set of 1 million binaries.
+
+    Does not need OpenSearch.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Required."""
+        rng = random.Random(42)
+        cls.index = tlsh_index.TlshIndex()
+        cls.queries = []
+        for i in range(1_000_000):
+            vector = _random_vector(rng)
+            if i % 10_000 == 0:
+                # a near duplicate for each query, which must be found
+                cls.queries.append(vector)
+                cls.index.add(f"near{i}", _mutate_vector(rng, vector, 3))
+            cls.index.add(f"e{i}", vector)
+
+    def test_query(self):
+        """Query the index for every near duplicate."""
+
+        def func_wrapper():
+            for vector in self.queries:
+                self.index.query(vector, max_distance=100, max_count=MAX_MATCHES)
+
+        self.benchmark.pedantic(func_wrapper, rounds=10)
+
+        found = 0
+        for i, vector in enumerate(self.queries):
+            found += f"near{i * 10_000}" in {x[0] for x in self.index.query(vector, max_distance=100, max_count=1)}
+        print(f"near duplicates found: {found}/{len(self.queries)}")
+        self.assertEqual(found, len(self.queries))
+
+
+class TestBenchmarkTlshSearch(BaseBenchmarkTest):
+    """Compare recall and latency of the kNN search and the local TLSH index for the indexed binaries.
+
+    Uses the same seeded data as TestBenchmarkSearch.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Required."""
+        super().setUpClass()
+        # seed and cleanup indices, for faster results disable this re-seeding between runs.
+        cls.cleanup_indices()
+        BinaryIngestorLocal().main(refresh=True)
+
+        start = time.perf_counter()
+        cls.index = binary_similar.load_tlsh_index(cls.ctx)
+        print(f"loaded {len(cls.index)} tlsh vectors in {time.perf_counter() - start:.2f}s")
+
+        body = {"_source": {"includes": ["tlsh_vector"]}, "query": {"exists": {"field": "tlsh_vector"}}}
+        vectors = [x["_source"]["tlsh_vector"] for x in cls.ctx.man.binary2.w.scan(cls.ctx.sd, body=body)]
+        cls.samples = [_vector_to_tlsh(x) for x in random.Random(42).sample(vectors, SAMPLE_COUNT)]
+
+    def test_knn_search(self):
+        def func_wrapper():
+            for tlsh in self.samples:
+                binary_similar.read_similar_from_tlsh(self.ctx, tlsh, MAX_MATCHES)
+
+        self.benchmark.pedantic(func_wrapper, rounds=5)
+
+    def test_local_search(self):
+        def func_wrapper():
+            for tlsh in self.samples:
+                binary_similar._read_similar_from_tlsh_index(self.ctx, self.index, tlsh, MAX_MATCHES)
+
+        self.benchmark.pedantic(func_wrapper, rounds=5)
+
+    def test_knn_recall(self):
+        """Recall of the kNN search, for the binaries under the TLSH distance cutoff found by the local index."""
+        expected = found = 0
+        for tlsh in self.samples:
+            local = binary_similar._read_similar_from_tlsh_index(self.ctx, self.index, tlsh, MAX_MATCHES)
+            local = {x["sha256"] for x in local}
+            knn = {x["sha256"] for x in binary_similar.read_similar_from_tlsh(self.ctx, tlsh, MAX_MATCHES)}
+            expected += len(local)
+            found += len(local & knn)
+        print(f"kNN recall: {found}/{expected} ({100 * found / max(expected, 1):.1f}%)")
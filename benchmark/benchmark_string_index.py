@@ -0,0 +1,109 @@
+"""Benchmark string searches reading the binary against searches of the local string index."""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from azul_metastore.common import data_strings, string_index
+from benchmark_common import BaseBenchmarkTest
+
+MB = 1024 * 1024
+SIZE = 50 * MB
+CHUNK_SIZE = 64 * 1024
+# filters used for each repeat query
+FILTERS = ["http", "kernel32", "password", "error", "0x"]
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, total: int):
+        self.content = content
+        self.headers = {"Content-Range": f"bytes */{total}"}
+
+
+class FakeDispatcher:
+    """Serves range reads of a binary held in memory."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def get_binary(self, source: str, label: str, sha256: str, start_pos: int = 0, end_pos: int | None = None):
+        end = len(self.data) if end_pos is None else end_pos + 1
+        return FakeResponse(self.data[start_pos:end], len(self.data))
+
+
+async def _stream(data: bytes):
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield data[i : i + CHUNK_SIZE]
+
+
+def _blob(rng: random.Random) -> bytes:
+    """Return random binary data with strings spread through it."""
+    words = [w.encode() for w in FILTERS + ["section", "import", "config", "user", "Software\\Microsoft"]]
+    out = bytearray()
+    while len(out) < SIZE:
+        out += rng.randbytes(rng.randint(16, 256))
+        out += b"\x00" + b"_".join(rng.choices(words, k=rng.randint(1, 4))) + b"%d\x00" % rng.randint(0, 10_000)
+    return bytes(out[:SIZE])
+
+
+class TestBenchmarkStringIndex(BaseBenchmarkTest):
+    """Benchmark first and repeat filtered string searches of a synthetic 50MB binary.
+
+    Does not need OpenSearch.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Required."""
+        cls.data = _blob(random.Random(42))
+        cls.tmp = tempfile.TemporaryDirectory()
+        os.environ["metastore_string_index_folder"] = cls.tmp.name
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove built indexes."""
+        cls.tmp.cleanup()
+
+    def _read_binary(self, find_string: str) -> list:
+        strings, _, _ = asyncio.run(
+            data_strings.get_strings(_stream(self.data), 4, 200, 0, find_string, None, 1000, buffer_size=MB)
+        )
+        return strings
+
+    def test_first_and_repeat_query(self):
+        sha256 = "00" * 32
+        start = time.perf_counter()
+        self._read_binary(FILTERS[0])
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        string_index.build(FakeDispatcher(self.data), "source", "label", sha256)
+        built = time.perf_counter() - start
+
+        def repeat():
+            for find_string in FILTERS:
+                found = string_index.search_strings(
+                    FakeDispatcher(self.data),
+                    "user",
+                    "source",
+                    "label",
+                    sha256,
+                    min_length=4,
+                    max_length=200,
+                    start=0,
+                    end=None,
+                    find_string=find_string,
+                    find_regex=None,
+                    max_results=1000,
+                )
+                self.assertIsNotNone(found)
+
+        start = time.perf_counter()
+        self.benchmark.pedantic(repeat, rounds=3)
+        repeated = (time.perf_counter() - start) / 3 / len(FILTERS)
+
+        print(f"first query reading the binary: {first * 1000:.1f}ms")
+        print(f"building the index in the background: {built * 1000:.1f}ms")
+        print(f"repeat query using the index: {repeated * 1000:.1f}ms")
@@ -584,7 +584,7 @@ class TestEntitySearch(etb.DynamicTestCase):
             similar_entropies,
             [
                 bedr_binaries.SimilarEntropyMatchRow(sha256="e6_2", score=100.0),
-                bedr_binaries.SimilarEntropyMatchRow(sha256="e8_2", score=97.9687),
+                bedr_binaries.SimilarEntropyMatchRow(sha256="e8_2", score=97.9688),
             ],
         )
 
@@ -1,3 +1,5 @@
+import json
+
 from azul_bedrock import models_network as azm
 from azul_bedrock import models_restapi
 
@@ -562,3 +564,26 @@ class TestEntityFind(integration_test.DynamicTestCase):
         self.assertFormatted(
             ret[0].highlight, {"features_map.f1": ["v1"], "features_map.f2": ["v2"], "features_map.f3": ["v3"]}
         )
+
+    def test_find_binaries_deferred(self):
+        self.write_binary_events(
+            [gen.binary_event(eid=f"e{x}", authornv=("a1", "1"), fvl=[("f1", "v1")]) for x in range(250)]
+        )
+        expected = binary_find.find_binaries(self.writer, term='features_map.f1:"v1"', max_binaries=250)
+
+        rows = [
+            json.loads(x)
+            for x in binary_find.find_binaries_deferred(
+                self.writer, term='features_map.f1:"v1"', max_binaries=250, count_binaries=True
+            )
+        ]
+        self.assertEqual("binaries", rows[0]["type"])
+        self.assertEqual([x.key for x in expected.items], rows[0]["sha256s"])
+        self.assertEqual(250, rows[0]["items_count"])
+
+        # summaries are returned in batches of 100
+        summaries = rows[1:]
+        self.assertEqual([100, 100, 50], [len(x["items"]) for x in summaries])
+        self.assertTrue(all(x["type"] == "summaries" and not x["removed"] for x in summaries))
+        items = [models_restapi.EntityFindItem(**y) for x in summaries for y in x["items"]]
+        self.assertEqual(expected.items, items)
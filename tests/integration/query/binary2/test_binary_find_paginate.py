@@ -1,3 +1,5 @@
+import json
+
 from azul_metastore.query.binary2 import binary_find_paginate
 from tests.support import gen, integration_test
 
@@ -38,3 +40,24 @@ class TestEntityFind(integration_test.DynamicTestCase):
             all_binaries.extend(resp.items)
         self.assertEqual(100, len(all_binaries))
         self.assertEqual(actual, 100)  # count should be accurate for <1000
+
+    def test_stream_all_binaries(self):
+        self.write_binary_events(
+            [gen.binary_event(eid=f"e{x}", authornv=("a1", "1"), fvl=[("f1", "v1")]) for x in range(100)]
+            + [gen.binary_event(eid=f"e{x}", authornv=("a1", "1"), fvl=[("f1", "v2")]) for x in range(100, 250)]
+        )
+
+        rows = [json.loads(x) for x in binary_find_paginate.stream_all_binaries(self.writer, page_size=30)]
+        self.assertEqual(250, len(rows))
+        self.assertEqual(sorted(f"e{x}" for x in range(250)), [x["sha256"] for x in rows])
+        self.assertEqual({"sha256"}, set(rows[0].keys()))
+
+        rows = [
+            json.loads(x)
+            for x in binary_find_paginate.stream_all_binaries(
+                self.writer, page_size=30, term='features_map.f1:"v1"', include_summary=True
+            )
+        ]
+        self.assertEqual(100, len(rows))
+        self.assertTrue(all(x["exists"] for x in rows))
+        self.assertTrue(all(x["sources"] for x in rows))
@@ -208,6 +208,42 @@ class TestBinaryRead(integration_test.DynamicTestCase):
             result = binary_read.verify_stream_exists(self.writer, "e1", is_check_stream_in_dispatcher=True)
             self.assertEqual((True, "s1", "content"), result)
 
+    async def test_async_verify_streams_exist(self):
+        self.write_binary_events(
+            [
+                gen.binary_event(
+                    eid="e1", authornv=("a1", "1"), authorsec=gen.g1_1, sourceit=("s1", "2000-01-01T00:00:00Z")
+                ),
+                gen.binary_event(
+                    eid="e2", authornv=("a1", "1"), authorsec=gen.g1_1, sourceit=("s2", "2000-01-01T00:00:00Z")
+                ),
+            ]
+        )
+        result = await binary_read.async_verify_streams_exist(
+            self.writer, ["e1", "E2", "e10"], is_check_stream_in_dispatcher=False
+        )
+        self.assertEqual(
+            {
+                "e1": (True, "s1", "content"),
+                "E2": (True, "s2", "content"),
+                "e10": (False, "", azm.DataLabel.TEST),
+            },
+            result,
+        )
+
+        # same results as checking each binary separately
+        def exists_e2(*args, sha256: str, **kwargs):
+            if sha256 != "e2":
+                raise ApiException(status_code=404, internal=ExceptionCodeEnum.MetastoreSourceNoReferences)
+
+        with mock.patch.object(self.writer.dispatcher, "has_binary", wraps=exists_e2) as has_binary_wrapper:
+            result = await binary_read.async_verify_streams_exist(self.writer, ["e1", "e2", "e10"])
+            self.assertEqual(2, has_binary_wrapper.call_count)
+            for sha256 in ("e1", "e2", "e10"):
+                self.assertEqual(binary_read.verify_stream_exists(self.writer, sha256), result[sha256])
+        self.assertEqual((False, "", DataLabel.TEST), result["e1"])
+        self.assertEqual((True, "s2", "content"), result["e2"])
+
     def test_verify_stream_exists_dataless_present(self):
         """Find a stream when there is a dataless event attempting to obscure the datastream.
 
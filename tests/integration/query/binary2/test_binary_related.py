@@ -1,7 +1,9 @@
+from unittest import mock
+
 from azul_bedrock import models_network as azm
 from azul_bedrock import models_restapi
 
-from azul_metastore.query.binary2 import binary_related, binary_summary
+from azul_metastore.query.binary2 import binary_consistency, binary_related, binary_summary
 from tests.support import gen
 from tests.support import integration_test as etb
 
@@ -522,6 +524,93 @@ class TestRelationGroups(etb.DynamicTestCase):
         res = binary_related.read_nearby(self.writer, "e1", True, max_cousin_distance=50)
         self.assertEqual(12, len(res.links))
 
+    def test_read_nearby_cached(self):
+        a = ("p1", "1")
+        self.write_binary_events(
+            [
+                gen.binary_event(eid="e1", spathl=[]),
+                gen.binary_event(eid="e10", spathl=[("e1", a)]),
+                gen.binary_event(eid="e11", spathl=[("e1", a)], sourcesec=gen.g2_1),
+            ]
+        )
+        res = binary_related.read_nearby(self.writer, "e10", include_cousins=True)
+        self.assertEqual({"e1", "e10", "e11"}, {x.child for x in res.links})
+
+        # links are read from the cache when nothing has changed
+        wrapped = binary_related._read_nearby_find_children
+        with mock.patch.object(binary_related, "_read_nearby_find_children", wraps=wrapped) as mm:
+            cached = binary_related.read_nearby(self.writer, "e10", include_cousins=True)
+            self.assertEqual(0, mm.call_count)
+        self.assertEqual(res, cached)
+
+        # cached links are not shared with users with different security
+        res = binary_related.read_nearby(self.es1, "e10", include_cousins=True)
+        self.assertEqual({"e1", "e10"}, {x.child for x in res.links})
+
+        # new links are found
+        self.write_binary_events([gen.binary_event(eid="e100", spathl=[("e1", a), ("e10", a)])])
+        res = binary_related.read_nearby(self.writer, "e10", include_cousins=True)
+        self.assertEqual({"e1", "e10", "e11", "e100"}, {x.child for x in res.links})
+
+    def test_link_index(self):
+        a = ("p1", "1")
+        self.write_binary_events(
+            [
+                gen.binary_event(eid="e1", spathl=[]),
+                gen.binary_event(eid="e10", spathl=[("e1", a)]),
+                gen.binary_event(eid="e100", spathl=[("e1", a), ("e10", a)]),
+            ]
+        )
+        body = {"query": {"bool": {"filter": [{"term": {"parent.sha256": "e1"}}]}}}
+        resp = self.writer.man.link.w.search(self.writer.sd, body=body, routing="e1")
+        self.assertEqual(["e10"], [x["_source"]["sha256"] for x in resp["hits"]["hits"]])
+
+        # links are rebuilt from binary2 docs
+        self.system.es_admin.delete_by_query(
+            index=self.writer.man.link.w.alias, refresh=True, body={"query": {"match_all": {}}}
+        )
+        self.assertEqual(set(), get_eid_children(self.writer, "e1"))
+        self.assertEqual(2, binary_consistency.index_missing_links(self.writer))
+        self.flush()
+        self.assertEqual({"e10"}, get_eid_children(self.writer, "e1"))
+
+        # delete e1 so links from it and its descendants are removed
+        self.system.es_admin.delete_by_query(
+            index=self.writer.man.binary2.w.alias,
+            refresh=True,
+            body={"query": {"bool": {"should": [{"ids": {"values": ["e1"]}}, {"term": {"sha256": "e1"}}]}}},
+        )
+        altered = list(binary_consistency.ensure_valid_links(self.writer, ["e1"]))
+        self.assertEqual(["e10", "e100"], altered)
+        self.flush()
+        self.assertEqual(set(), get_eid_children(self.writer, "e10"))
+        resp = self.writer.man.link.w.search(self.writer.sd, body={"query": {"bool": {"filter": []}}})
+        self.assertEqual([], resp["hits"]["hits"])
+
+    def test_valid_links_without_link_docs(self):
+        a = ("p1", "1")
+        self.write_binary_events(
+            [
+                gen.binary_event(eid="e1", spathl=[]),
+                gen.binary_event(eid="e10", spathl=[("e1", a)]),
+            ]
+        )
+        # older data only has links in binary2
+        self.system.es_admin.delete_by_query(
+            index=self.writer.man.link.w.alias, refresh=True, body={"query": {"match_all": {}}}
+        )
+        self.system.es_admin.delete_by_query(
+            index=self.writer.man.binary2.w.alias,
+            refresh=True,
+            body={"query": {"bool": {"should": [{"ids": {"values": ["e1"]}}, {"term": {"sha256": "e1"}}]}}},
+        )
+        altered = list(binary_consistency.ensure_valid_links(self.writer, ["e1"]))
+        self.assertEqual(["e10"], altered)
+        self.flush()
+        body = {"query": {"bool": {"filter": [{"term": {"parent.sha256": "e1"}}]}}}
+        resp = self.writer.man.binary2.w.search(self.writer.sd, body=body)
+        self.assertEqual([], resp["hits"]["hits"])
+
     def test_read_nearby_file_info(self):
         """ "Test relationship with the following binary relationship structure.
 
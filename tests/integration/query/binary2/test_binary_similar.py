@@ -1,3 +1,5 @@
+from unittest import mock
+
 from azul_metastore.query.binary2 import binary_similar
 from tests.support import gen
 from tests.support import integration_test as etb
@@ -75,6 +77,67 @@ class TestEntitySearch(etb.DynamicTestCase):
         hashScores = binary_similar.read_similar_from_tlsh(ctx=self.writer, tlsh=hash_base, maxCount=1)
         self.assertEqual(hashScores, [{"sha256": "mod_a", "score": 99.92}])
 
+    def test_start_similar_from_features(self):
+        self.write_binary_events(
+            [
+                gen.binary_event(eid="e1", authornv=("a1", "1"), fvl=[("f1", f"v{x}") for x in range(10)]),
+                gen.binary_event(eid="e2", authornv=("a1", "1"), fvl=[("f1", f"v{x}") for x in range(10)]),
+            ]
+        )
+        key = ("e1", self.writer.get_user_security_unique())
+        runner = binary_similar._get_feature_jobs()
+
+        wrapped = binary_similar.read_similar_from_features
+        with mock.patch.object(binary_similar, "read_similar_from_features", wraps=wrapped) as mm:
+            results = binary_similar.start_similar_from_features(self.writer, "E1")
+            self.assertEqual("starting", results["status"])
+            job = runner.get(key)
+            # concurrent requests share the running calculation
+            binary_similar.start_similar_from_features(self.writer, "e1")
+            if job:
+                job.result(30)
+            self.flush()
+
+            results = binary_similar.start_similar_from_features(self.writer, "e1")
+            self.assertEqual("complete", results["status"])
+            self.assertEqual(["e2"], [x["sha256"] for x in results["matches"]])
+            self.assertEqual(1, mm.call_count)
+
+            # user limit prevents more calculations being started
+            with mock.patch.object(runner, "max_per_user", 0):
+                results = binary_similar.start_similar_from_features(self.writer, "e1", recalculate=True)
+            self.assertEqual("waiting for your other calculations to finish", results["status"])
+            self.assertEqual(["e2"], [x["sha256"] for x in results["matches"]])
+            self.assertEqual(1, mm.call_count)
+
+    def test_binary_similar_tlsh_local_index(self):
+        hash_base = "T1AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+        hash_mod_a = "T1BBAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+        hash_mod_b = "T1CCCCAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+        hash_mod_c = "T1AAAAAA55AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+
+        self.write_binary_events(
+            [
+                gen.binary_event(eid="same", tlsh=hash_base),
+                gen.binary_event(eid="mod_a", tlsh=hash_mod_a),
+                gen.binary_event(eid="mod_b", tlsh=hash_mod_b),
+                gen.binary_event(eid="mod_c", tlsh=hash_mod_c, sourcesec=gen.g2_1),
+            ]
+        )
+        index = binary_similar.load_tlsh_index(self.writer)
+        self.assertEqual(4, len(index))
+
+        # mod_b has a large lvalue difference so is over the tlsh distance cutoff
+        hashScores = binary_similar._read_similar_from_tlsh_index(self.writer, index, hash_base, 100)
+        self.assertEqual(hashScores, [{"sha256": "mod_a", "score": 99}, {"sha256": "mod_c", "score": 96}])
+
+        hashScores = binary_similar._read_similar_from_tlsh_index(self.writer, index, hash_base, 1)
+        self.assertEqual(hashScores, [{"sha256": "mod_a", "score": 99}])
+
+        # matches the user can't access are removed
+        hashScores = binary_similar._read_similar_from_tlsh_index(self.es1, index, hash_base, 100)
+        self.assertEqual(hashScores, [{"sha256": "mod_a", "score": 99}])
+
     def test_read_similar_from_features(self):
         self.write_binary_events(
             [
@@ -1,6 +1,7 @@
 from azul_bedrock import models_network as azm
 from azul_bedrock import models_restapi
 import pendulum
+from unittest import mock
 
 from azul_metastore.query.binary2 import binary_summary
 from tests.support import gen, integration_test
@@ -573,3 +574,41 @@ class TestBinaryRead(integration_test.DynamicTestCase):
                 )
             ],
         )
+
+    def test_read_cached(self):
+        self.write_binary_events(
+            [gen.binary_event(eid="e1", authornv=("a1", "1"), fvl=[("f1", "v1")], timestamp="2000-01-01T01:01:01Z")]
+        )
+        with mock.patch.object(binary_summary, "_read_within", wraps=binary_summary._read_within) as rw:
+            ret1 = binary_summary.read(self.writer, "e1")
+            ret2 = binary_summary.read(self.writer, "e1")
+            self.assertEqual(1, rw.call_count)
+            self.assertEqual(ret1, ret2)
+
+            # different security filters are cached separately
+            binary_summary.read(self.es1, "e1")
+            self.assertEqual(2, rw.call_count)
+
+            # a newer document invalidates the cached result
+            self.write_binary_events(
+                [
+                    gen.binary_event(
+                        eid="e1", authornv=("a2", "1"), fvl=[("f2", "v2")], timestamp="2001-01-01T01:01:01Z"
+                    )
+                ]
+            )
+            ret3 = binary_summary.read(self.writer, "e1")
+            self.assertEqual(3, rw.call_count)
+            self.assertIn("f2", [x.name for x in ret3.features])
+
+            # an older document added out of order also invalidates the cached result
+            self.write_binary_events(
+                [
+                    gen.binary_event(
+                        eid="e1", authornv=("a3", "1"), fvl=[("f3", "v3")], timestamp="1999-01-01T01:01:01Z"
+                    )
+                ]
+            )
+            ret4 = binary_summary.read(self.writer, "e1")
+            self.assertEqual(4, rw.call_count)
+            self.assertIn("f3", [x.name for x in ret4.features])
@@ -507,6 +507,8 @@ class TestBinaryFind(integration_test.BaseRestapi):
         self.assertEqual(200, response.status_code)
         resp = response.json()
         self.assertEqual(800, len(resp["data"]["items"]))
+        # every binary should have its tag, not just the first 100
+        self.assertTrue(all([x["tag"] for x in item["tags"]] == ["t2"] for item in resp["data"]["items"]))
 
     def test_remove_binary_tag_and_validate(self):
         self.write_binary_events(
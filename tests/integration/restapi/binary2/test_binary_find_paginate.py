@@ -83,3 +83,25 @@ class TestBinaryFind(integration_test.BaseRestapi):
         self.assertEqual(0, len(parsed["data"]["items"]))
         self.assertNotIn("after", parsed["data"])
         self.assertNotIn("total", parsed["data"])
+
+    def test_binary_stream_all(self):
+        self.write_binary_events([gen.binary_event(eid=f"e{x}", authornv=("a1", "1")) for x in range(210)])
+        response = self.client.post("/v0/binaries/all/stream?page_size=100")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("application/x-ndjson", response.headers["content-type"])
+        self.assertIn("x-azul-security", response.headers)
+        rows = [json.loads(x) for x in response.text.splitlines()]
+        self.assertEqual(210, len(rows))
+        self.assertEqual(sorted(f"e{x}" for x in range(210)), [x["sha256"] for x in rows])
+
+        self.write_binary_events(
+            [gen.binary_event(eid=f"z{x}", authornv=("a1", "1"), magicmime=("", "application/zip")) for x in range(20)]
+        )
+        response = self.client.post(
+            "/v0/binaries/all/stream?include_summary=true", params={"term": '"application/zip"'}
+        )
+        self.assertEqual(200, response.status_code)
+        rows = [json.loads(x) for x in response.text.splitlines()]
+        self.assertEqual(sorted(f"z{x}" for x in range(20)), [x["sha256"] for x in rows])
+        self.assertTrue(all(x["exists"] for x in rows))
+        self.assertEqual("application/zip", rows[0]["mime"])
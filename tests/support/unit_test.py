@@ -100,6 +100,11 @@ class BaseUnitTestCase(basic_test.BasicTest):
         )
 
 
+async def mock_async_verify_streams_exist(ctx, sha256s: list[str], *args, **kwargs):
+    """Fake result of checking that all streams exist."""
+    return {x: (True, "source", "label") for x in sha256s}
+
+
 class FakeDispatcherAPI(dispatcher.DispatcherAPI):
     """Class used to override the internal client of DispatcherAPI to one that is always successful (200 status)."""
 
@@ -136,6 +141,10 @@ class DataMockingUnitTest(BaseUnitTestCase):
                 "azul_metastore.query.binary2.binary_read.verify_stream_exists",
                 lambda *args, **kwargs: (True, "source", "label"),
             ),
+            mock.patch(
+                "azul_metastore.query.binary2.binary_read.async_verify_streams_exist",
+                side_effect=mock_async_verify_streams_exist,
+            ),
             mock.patch("azul_metastore.context.get_writer_context", lambda *args: mock_get_writer_context),
             mock.patch("azul_metastore.query.binary_create.create_binary_events", lambda *args, **kwargs: True),
             mock.patch("azul_metastore.settings.check_source_exists", lambda *args: True),
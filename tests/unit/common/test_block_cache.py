@@ -0,0 +1,132 @@
+import asyncio
+import unittest
+
+import cachetools
+from azul_bedrock.exception_enums import ExceptionCodeEnum
+from azul_bedrock.exceptions_bedrock import DispatcherApiException
+
+from azul_metastore.common import block_cache
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, total: int):
+        self.content = content
+        self.headers = {"Content-Range": f"bytes */{total}"}
+
+
+class FakeDispatcher:
+    """Serves range reads of a binary from memory and counts upstream reads.
+
+    Like dispatcher, reads that start past the end of the binary fail.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.reads = []
+
+    def get_binary(self, source: str, label: str, sha256: str, start_pos: int = 0, end_pos: int | None = None):
+        self.reads.append((start_pos, end_pos))
+        if start_pos >= len(self.data):
+            raise DispatcherApiException(internal=ExceptionCodeEnum.DPGetBinaryOffsetTooLarge)
+        end = len(self.data) if end_pos is None else end_pos + 1
+        return FakeResponse(self.data[start_pos:end], len(self.data))
+
+    async def async_get_binary(self, source: str, label: str, sha256: str, start: int = 0, end: int | None = None):
+        self.reads.append((start, end))
+        stop = len(self.data) if end is None else end + 1
+
+        async def _content():
+            if start >= len(self.data):
+                # dispatcher disconnects without a response
+                raise DispatcherApiException(internal=ExceptionCodeEnum.DPGetBinaryAsyncOffsetTooLarge)
+            yield self.data[start:stop]
+
+        return _content()
+
+
+class TestBlockCache(unittest.TestCase):
+    def setUp(self):
+        self.data = bytes(range(256)) * 10
+        self.dispatcher = FakeDispatcher(self.data)
+        self.cache = block_cache.BlockCache(cachetools.LRUCache(maxsize=8), 100)
+
+    def tearDown(self):
+        self.cache._prefetcher.shutdown(wait=True)
+
+    def _read(self, start: int, end: int) -> tuple[bytes, int]:
+        ret = self.cache.read(self.dispatcher, "source", "label", "abc", start, end)
+        # let the prefetch of the following block finish
+        self.cache._prefetcher.submit(lambda: None).result()
+        return ret
+
+    async def _async_read(self, start: int, end: int) -> bytes:
+        content = self.cache.async_read(self.dispatcher, "source", "label", "abc", start, end)
+        ret = b"".join([chunk async for chunk in content])
+        self.cache._prefetcher.submit(lambda: None).result()
+        return ret
+
+    def test_cacheable(self):
+        self.assertTrue(self.cache.cacheable(0, 99))
+        self.assertFalse(self.cache.cacheable(0, None))
+        self.assertFalse(self.cache.cacheable(10, 5))
+        self.assertFalse(self.cache.cacheable(0, 100 * block_cache.MAX_CACHED_READ_BLOCKS))
+
+    def test_read(self):
+        self.assertEqual((self.data[10:250], len(self.data)), self._read(10, 249))
+        # blocks 0-2 read, block 3 prefetched
+        self.assertEqual(4, len(self.dispatcher.reads))
+        self.assertEqual({"hit": 0, "miss": 3, "prefetch": 1}, self.cache.stats)
+
+        # overlapping read is served from memory
+        self.assertEqual((self.data[50:150], len(self.data)), self._read(50, 149))
+        self.assertEqual(4, len(self.dispatcher.reads))
+
+        # paging forward uses the prefetched block and prefetches the next
+        self.assertEqual((self.data[250:350], len(self.data)), self._read(250, 349))
+        self.assertEqual(5, len(self.dispatcher.reads))
+        self.assertEqual((400, 499), self.dispatcher.reads[-1])
+
+    def test_read_end_of_binary(self):
+        size = len(self.data)
+        self.assertEqual((self.data[2500:], size), self._read(2500, 2650))
+        # last block is short and nothing after it is prefetched
+        self.assertEqual([(2500, 2599)], self.dispatcher.reads)
+
+        # range past the end is passed to dispatcher
+        with self.assertRaises(DispatcherApiException):
+            self._read(3000, 3099)
+        self.assertEqual((3000, 3099), self.dispatcher.reads[-1])
+
+    def test_async_read(self):
+        self.assertEqual(self.data[10:250], asyncio.run(self._async_read(10, 249)))
+        # blocks 0-2 read, block 3 prefetched
+        self.assertEqual(4, len(self.dispatcher.reads))
+        self.assertEqual(self.data[120:180], asyncio.run(self._async_read(120, 179)))
+        self.assertEqual(4, len(self.dispatcher.reads))
+        self.assertEqual({"hit": 1, "miss": 3, "prefetch": 1}, self.cache.stats)
+
+        # sync reads use blocks cached by async reads, but must learn the size of the binary
+        self.assertEqual((self.data[0:50], len(self.data)), self._read(0, 49))
+        self.assertEqual(5, len(self.dispatcher.reads))
+        self.assertEqual((self.data[0:50], len(self.data)), self._read(0, 49))
+        self.assertEqual(5, len(self.dispatcher.reads))
+
+    def test_read_end_of_whole_blocks(self):
+        # binary is an exact multiple of the block size
+        self.dispatcher.data = self.data = self.data[:2000]
+        self.assertEqual((self.data[1950:], 2000), self._read(1950, 2049))
+        # size is known from the last block, so no block past the end is read
+        self.assertEqual([(1900, 1999)], self.dispatcher.reads)
+        with self.assertRaises(DispatcherApiException):
+            self._read(2000, 2099)
+
+    def test_async_read_end_of_whole_blocks(self):
+        self.dispatcher.data = self.data = self.data[:2000]
+        self.assertEqual(self.data[1950:], asyncio.run(self._async_read(1950, 2049)))
+        # block past the end is out of range and cached as the end of the binary
+        self.assertEqual([(1900, 1999), (2000, 2099)], self.dispatcher.reads)
+        self.assertEqual(self.data[1950:], asyncio.run(self._async_read(1950, 2049)))
+        self.assertEqual((self.data[1950:], 2000), self._read(1950, 2049))
+        self.assertEqual(2, len(self.dispatcher.reads))
+        with self.assertRaises(DispatcherApiException):
+            asyncio.run(self._async_read(2000, 2099))
@@ -0,0 +1,113 @@
+import asyncio
+import gc
+import io
+import os
+import threading
+
+from cart import cart
+
+from azul_metastore.common import decode_pool, fileformat
+from tests.support import unit_test
+
+
+async def _stream(data: bytes, chunk_size: int = 1000):
+    for i in range(0, len(data), chunk_size):
+        yield data[i : i + chunk_size]
+
+
+async def _collect(stream) -> bytes:
+    return b"".join([x async for x in stream])
+
+
+def _cart(data: bytes, name: str) -> bytes:
+    out = io.BytesIO()
+    cart.pack_stream(io.BytesIO(data), out, optional_header={"name": name})
+    return out.getvalue()
+
+
+class TestDecodePool(unit_test.BaseUnitTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(300_000) + b"\x00" * 300_000
+        self.pool = decode_pool.DecodePool(workers=1, queue_chunks=2)
+        self.addCleanup(self.pool._executor.shutdown, wait=True)
+
+    async def test_unpack(self):
+        data, meta = await self.pool.stream(cart.async_unpack_iterable, _stream(_cart(self.data, "a.exe")))
+        self.assertEqual({"name": "a.exe"}, meta)
+        self.assertEqual(self.data, await _collect(data))
+        self.assertEqual((0, 0), (self.pool.queued, self.pool.active))
+
+    async def test_pack_and_unpack(self):
+        packed = await fileformat.async_pack_cart(_stream(self.data))
+        data, meta = await fileformat.async_unpack_cart(packed)
+        self.assertEqual({}, meta)
+        self.assertEqual(self.data, await _collect(data))
+
+    async def test_not_cart(self):
+        with self.assertRaises(cart.InvalidCARTException):
+            await self.pool.stream(cart.async_unpack_iterable, _stream(self.data))
+
+    async def test_error_after_output(self):
+        async def _stage(source):
+            async def _data():
+                async for chunk in source:
+                    yield chunk
+                raise cart.InvalidCARTException("bad footer")
+
+            return _data(), {}
+
+        data, _ = await self.pool.stream(_stage, _stream(self.data))
+        with self.assertRaises(cart.InvalidCARTException):
+            await _collect(data)
+        self.assertEqual((0, 0), (self.pool.queued, self.pool.active))
+
+    async def test_queue_depth(self):
+        # a stream that isn't read holds the only worker
+        first, _ = await self.pool.stream(cart.async_unpack_iterable, _stream(_cart(self.data, "a")))
+        second = asyncio.create_task(self.pool.stream(cart.async_unpack_iterable, _stream(_cart(self.data, "b"))))
+        await asyncio.sleep(0.1)
+        self.assertEqual((1, 1), (self.pool.queued, self.pool.active))
+        self.assertFalse(second.done())
+
+        self.assertEqual(self.data, await _collect(first))
+        data, meta = await second
+        self.assertEqual({"name": "b"}, meta)
+        self.assertEqual(self.data, await _collect(data))
+
+    async def test_dropped_output_frees_worker(self):
+        data, _ = await self.pool.stream(cart.async_unpack_iterable, _stream(_cart(self.data, "a")))
+        await anext(data)
+        await data.aclose()
+        # output that is never read
+        await self.pool.stream(cart.async_unpack_iterable, _stream(_cart(self.data, "b")))
+        gc.collect()
+        data, meta = await asyncio.wait_for(
+            self.pool.stream(cart.async_unpack_iterable, _stream(_cart(self.data, "c"))), timeout=10
+        )
+        self.assertEqual({"name": "c"}, meta)
+        self.assertEqual(self.data, await _collect(data))
+
+    async def test_dropped_output_closes_source(self):
+        closed = asyncio.Event()
+
+        async def _source():
+            try:
+                async for chunk in _stream(self.data):
+                    yield chunk
+            finally:
+                closed.set()
+
+        data, _ = await self.pool.stream(fileformat._pack_cart_stage, _source())
+        await anext(data)
+        del data
+        gc.collect()
+        await asyncio.wait_for(closed.wait(), timeout=10)
+
+    async def test_download_pool(self):
+        # downloads hold a worker until they are read, so don't use the decode pool
+        self.assertIsNot(decode_pool.get(), decode_pool.get_download())
+        self.assertIs(decode_pool.get_download(), decode_pool.get_download())
+
+    async def test_run(self):
+        self.assertNotEqual(threading.get_ident(), await self.pool.run(threading.get_ident))
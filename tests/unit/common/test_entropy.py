@@ -0,0 +1,20 @@
+from azul_metastore.common import entropy
+from tests.support import unit_test
+
+
+class TestEntropy(unit_test.BaseUnitTestCase):
+    def test_hamming_distances(self):
+        vector = entropy.convert_entropy_to_opensearch_entropy([8.0] * entropy.ENTROPY_VECTOR_DIMENSION)
+        self.assertEqual(entropy.TOTAL_ENTROPY_BITS // 8, len(vector))
+        # all bits set
+        self.assertTrue(all(x == -1 for x in vector))
+
+        changed = list(vector)
+        changed[0] = 0
+        changed[-1] = 127
+        empty = [0] * len(vector)
+        self.assertEqual(
+            [0, 9, entropy.TOTAL_ENTROPY_BITS],
+            entropy.hamming_distances(vector, [vector, changed, empty]).tolist(),
+        )
+        self.assertEqual([], entropy.hamming_distances(vector, []).tolist())
@@ -0,0 +1,73 @@
+import threading
+
+from azul_metastore.common import jobs
+from tests.support import unit_test
+
+
+class TestJobRunner(unit_test.BaseUnitTestCase):
+    def test_deduplicate(self):
+        runner = jobs.JobRunner("test", max_workers=2, max_per_user=5)
+        release = threading.Event()
+        calls = []
+
+        def _job():
+            calls.append(1)
+            release.wait(5)
+
+        self.assertTrue(runner.submit("k1", "user1", _job))
+        # same key from another user shares the existing job
+        self.assertTrue(runner.submit("k1", "user2", _job))
+        future = runner.get("k1")
+        self.assertIsNotNone(future)
+        self.assertEqual(1, runner.user_jobs("user1"))
+        self.assertEqual(0, runner.user_jobs("user2"))
+
+        release.set()
+        future.result(5)
+        self.assertEqual(1, len(calls))
+        self.assertIsNone(runner.get("k1"))
+        self.assertEqual(0, runner.user_jobs("user1"))
+
+        # key can be run again once finished
+        release.clear()
+        self.assertTrue(runner.submit("k1", "user1", _job))
+        future = runner.get("k1")
+        release.set()
+        future.result(5)
+        self.assertEqual(2, len(calls))
+
+    def test_user_limit(self):
+        runner = jobs.JobRunner("test", max_workers=1, max_per_user=2)
+        release = threading.Event()
+
+        self.assertTrue(runner.submit("k1", "user1", lambda: release.wait(5)))
+        # queued jobs count towards the limit
+        self.assertTrue(runner.submit("k2", "user1", lambda: release.wait(5)))
+        self.assertFalse(runner.submit("k3", "user1", lambda: release.wait(5)))
+        self.assertIsNone(runner.get("k3"))
+        # other users are not limited
+        self.assertTrue(runner.submit("k3", "user2", lambda: release.wait(5)))
+
+        release.set()
+        for key in ("k1", "k2", "k3"):
+            future = runner.get(key)
+            if future:
+                future.result(5)
+        self.assertEqual(0, runner.user_jobs("user1"))
+        self.assertTrue(runner.submit("k4", "user1", lambda: None))
+
+    def test_failed_job(self):
+        runner = jobs.JobRunner("test", max_workers=1, max_per_user=1)
+        release = threading.Event()
+
+        def _job():
+            release.wait(5)
+            raise Exception("bad job")
+
+        with self.assertLogs("azul_metastore.common.jobs", level="ERROR"):
+            self.assertTrue(runner.submit("k1", "user1", _job))
+            future = runner.get("k1")
+            release.set()
+            future.result(5)
+        self.assertIsNone(runner.get("k1"))
+        self.assertEqual(0, runner.user_jobs("user1"))
@@ -1,4 +1,5 @@
 from typing import Literal, Optional
+from unittest import mock
 
 from azul_bedrock.models_restapi import binaries_auto_complete as bedr_bauto
 
@@ -518,3 +519,29 @@ class TestSearchQuery(unit_test.BaseUnitTestCase):
             'badkey:"value" AND badkey2:"value2" OR badkey3:value3', dummy_model_valid_keys
         )
         self.assertCountEqual(invalid_keys, ["badkey", "badkey2", "badkey3"])
+
+    def test_binary_tag_prefilter_cached(self):
+        """Tests that tag searches are only resolved once until the tag changes."""
+        ctx = mock.MagicMock()
+        ctx.sd.unique.return_value = "user"
+        ctx.sd.security_include = []
+        ctx.man.annotation.w.search.return_value = {
+            "hits": {"hits": [{"_source": {"pivot": "e1"}}, {"_source": {"pivot": "e2"}}]}
+        }
+        parsed = search_query_parser.parse('binary.tag:"t1"')
+
+        query, extra_info = search_query.az_query_to_opensearch(ctx, parsed)
+        self.assertEqual({"terms": {"sha256": ["e1", "e2"]}}, query)
+        self.assertTrue(extra_info.is_binary_tag_search)
+        search_query.az_query_to_opensearch(ctx, parsed)
+        self.assertEqual(1, ctx.man.annotation.w.search.call_count)
+
+        # different tags are not invalidated
+        search_query.invalidate_tag_prefilter("entity_tag", ["t2"])
+        search_query.invalidate_tag_prefilter("fv_tag", ["t1"])
+        search_query.az_query_to_opensearch(ctx, parsed)
+        self.assertEqual(1, ctx.man.annotation.w.search.call_count)
+
+        search_query.invalidate_tag_prefilter("entity_tag", ["t1"])
+        search_query.az_query_to_opensearch(ctx, parsed)
+        self.assertEqual(2, ctx.man.annotation.w.search.call_count)
@@ -0,0 +1,50 @@
+import unittest
+from unittest import mock
+
+from azul_metastore.common import ssdeep
+from tests.support import unit_test
+
+HASH_SAME = "192:9p2BHR9woCmKMGRZUCsA7knmxs1yxXMdYKMNbp:j2BHR3DGQ1msyx8M"
+HASH_ADDED = "384:p2BHR3DGQknzQnzm5l4nnmsyxlc4vLhkAvLhaAzLZcGvLZ0GvLZ0GvLZ0GvLZcFM:peWnzQnzm5l4nnCckhkshaWZcCZ0CZ0w"
+HASH_REMOVED = "96:9pETyYBP1U35TR0gggX7DOspzoMRQRAFyy8i3PNtbRmyFDynmxgPnnIKuKkB9/hD:9p2BuG2sA7knmxs1yxXMdYKMNbp"
+HASH_SWAPPED = "192:0R9woCmKMGT1yxYZUCsA7knmxwp2BTMdYKMNbp:0R3DG5yxz1ma2BwM"
+HASH_DIFFERENT = "192:9p2BHGxhLAIGvqMo2csjaIjUh+XsDOspzoAMBO:l2PLR3HGF3vdyd1M"
+CANDIDATES = [HASH_SAME, HASH_ADDED, HASH_REMOVED, HASH_SWAPPED, HASH_DIFFERENT]
+
+
+class TestSsdeep(unit_test.BaseUnitTestCase):
+    def test_compare_python(self):
+        # scores match those calculated by libfuzzy
+        self.assertEqual(100, ssdeep.compare_python(HASH_SAME, HASH_SAME))
+        self.assertEqual(79, ssdeep.compare_python(HASH_SAME, HASH_REMOVED))
+        self.assertEqual(72, ssdeep.compare_python(HASH_SAME, HASH_SWAPPED))
+        self.assertEqual(33, ssdeep.compare_python(HASH_SAME, HASH_ADDED))
+        self.assertEqual(0, ssdeep.compare_python(HASH_SAME, HASH_DIFFERENT))
+        # block sizes too different to compare
+        self.assertEqual(0, ssdeep.compare_python(HASH_ADDED, HASH_REMOVED))
+        # comparison is symmetric
+        self.assertEqual(79, ssdeep.compare_python(HASH_REMOVED, HASH_SAME))
+        # filenames are ignored
+        self.assertEqual(100, ssdeep.compare_python(HASH_SAME + ',"file.exe"', HASH_SAME))
+        self.assertEqual(-1, ssdeep.compare_python("not a hash", HASH_SAME))
+
+    def test_eliminate_sequences(self):
+        self.assertEqual("aaabbbc", ssdeep._eliminate_sequences("aaaaaabbbbc"))
+        self.assertEqual("abc", ssdeep._eliminate_sequences("abc"))
+
+    def test_compare_many_without_libfuzzy(self):
+        with mock.patch.object(ssdeep, "_libfuzzy", None):
+            self.assertEqual([100, 33, 79, 72, 0], ssdeep.compare_many(HASH_SAME, CANDIDATES))
+            self.assertEqual(79, ssdeep.compare(HASH_SAME, HASH_REMOVED))
+
+    @unittest.skipUnless(ssdeep.has_libfuzzy(), "libfuzzy is not installed")
+    def test_compare_many_libfuzzy(self):
+        self.assertEqual([100, 33, 79, 72, 0], ssdeep.compare_many(HASH_SAME, CANDIDATES))
+        # large batches are spread over threads but keep their order
+        candidates = CANDIDATES * ssdeep.MIN_THREADED_CANDIDATES
+        self.assertEqual(
+            [100, 33, 79, 72, 0] * ssdeep.MIN_THREADED_CANDIDATES, ssdeep.compare_many(HASH_SAME, candidates)
+        )
+        # python version matches libfuzzy
+        for candidate in CANDIDATES:
+            self.assertEqual(ssdeep.compare(HASH_SAME, candidate), ssdeep.compare_python(HASH_SAME, candidate))
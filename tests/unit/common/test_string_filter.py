@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from azul_bedrock.exceptions_bedrock import ApiException
+from azul_bedrock.models_restapi import binaries_data as bedr_bdata
+
+from azul_metastore.common import string_filter
+from tests.support import unit_test
+
+
+class StubFilterHandler(BaseHTTPRequestHandler):
+    """Keeps strings containing 'keep', like the AI string filter would for interesting strings."""
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.calls.append((url.path, parse_qs(url.query)["file_format"][0], body))
+        time.sleep(self.server.delay)
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            self.end_headers()
+            return
+        content = json.dumps([x for x in body if "keep" in x["string"]]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _strings(*values: str) -> list[bedr_bdata.SearchResult]:
+    return [
+        bedr_bdata.SearchResult(string=x, offset=i * 100, length=len(x), encoding=bedr_bdata.SearchResultType.ASCII)
+        for i, x in enumerate(values)
+    ]
+
+
+class TestStringFilter(unit_test.BaseUnitTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubFilterHandler)
+        self.server.calls = []
+        self.server.delay = 0
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    async def asyncTearDown(self):
+        await string_filter.get_client(self.url).aclose()
+
+    async def test_filter(self):
+        strings = _strings("keep_a", "drop_b", "keep_c")
+        found = await string_filter.call_string_filter("pe", strings, self.url, timeout=10)
+        self.assertEqual([{"string": "keep_a", "offset": 0}, {"string": "keep_c", "offset": 200}], found)
+        self.assertEqual(
+            [("/v0/strings", "pe", [{"string": x.string, "offset": x.offset} for x in strings])], self.server.calls
+        )
+
+    async def test_concurrent_requests_are_batched(self):
+        found = await asyncio.gather(
+            string_filter.call_string_filter("pe", _strings("keep_a", "drop_b"), self.url, timeout=10),
+            string_filter.call_string_filter("pe", _strings("drop_b", "keep_c", "keep_d"), self.url, timeout=10),
+            string_filter.call_string_filter("elf", _strings("keep_a"), self.url, timeout=10),
+        )
+        self.assertEqual(
+            [
+                [{"string": "keep_a", "offset": 0}],
+                [{"string": "keep_c", "offset": 100}, {"string": "keep_d", "offset": 200}],
+                [{"string": "keep_a", "offset": 0}],
+            ],
+            found,
+        )
+        # one call for each file format, with duplicate strings sent once
+        self.assertEqual(2, len(self.server.calls))
+        self.assertEqual(
+            {"pe": ["keep_a", "drop_b", "keep_c", "keep_d"], "elf": ["keep_a"]},
+            {file_format: [x["string"] for x in body] for _, file_format, body in self.server.calls},
+        )
+
+    async def test_batch_size(self):
+        client = string_filter.get_client(self.url)
+        client._batch_size = 2
+        found = await string_filter.call_string_filter(
+            "pe", _strings("keep_a", "drop_b", "keep_c", "drop_d", "keep_e"), self.url, timeout=10
+        )
+        self.assertEqual(["keep_a", "keep_c", "keep_e"], [x["string"] for x in found])
+        self.assertEqual([2, 2, 1], [len(body) for _, _, body in self.server.calls])
+
+    async def test_verdicts_are_cached(self):
+        await string_filter.call_string_filter("pe", _strings("keep_a", "drop_b"), self.url, timeout=10)
+        found = await string_filter.call_string_filter(
+            "pe", _strings("drop_b", "keep_c", "keep_a"), self.url, timeout=10
+        )
+        self.assertEqual([{"string": "keep_c", "offset": 100}, {"string": "keep_a", "offset": 200}], found)
+        self.assertEqual(["keep_c"], [x["string"] for x in self.server.calls[-1][2]])
+
+        # all strings cached, so the filter is not called
+        found = await string_filter.call_string_filter("pe", _strings("keep_c", "drop_b"), self.url, timeout=10)
+        self.assertEqual([{"string": "keep_c", "offset": 0}], found)
+        self.assertEqual(2, len(self.server.calls))
+
+    async def test_timeout(self):
+        self.server.delay = 1
+        with self.assertRaises(TimeoutError):
+            await string_filter.call_string_filter("pe", _strings("keep_a"), self.url, timeout=0.1)
+        # a request waiting on the same strings gets the result of the call in progress
+        found = await string_filter.call_string_filter("pe", _strings("keep_a"), self.url, timeout=10)
+        self.assertEqual([{"string": "keep_a", "offset": 0}], found)
+        self.assertEqual(1, len(self.server.calls))
+
+    async def test_error(self):
+        self.server.status = 500
+        with self.assertRaises(ApiException):
+            await string_filter.call_string_filter("pe", _strings("keep_a"), self.url, timeout=10)
+        # failures are not cached
+        self.server.status = 200
+        found = await string_filter.call_string_filter("pe", _strings("keep_a"), self.url, timeout=10)
+        self.assertEqual([{"string": "keep_a", "offset": 0}], found)
@@ -0,0 +1,160 @@
+import os
+import re
+import tempfile
+from unittest import mock
+
+from azul_bedrock.exception_enums import ExceptionCodeEnum
+from azul_bedrock.exceptions_bedrock import DispatcherApiException
+
+from azul_metastore.common import data_strings, memcache, string_index
+from tests.support import unit_test
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, total: int):
+        self.content = content
+        self.headers = {"Content-Range": f"bytes */{total}"}
+
+
+class FakeDispatcher:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.reads = 0
+
+    def get_binary(self, source: str, label: str, sha256: str, start_pos: int = 0, end_pos: int | None = None):
+        self.reads += 1
+        if start_pos >= len(self.data):
+            raise DispatcherApiException(internal=ExceptionCodeEnum.DPGetBinaryOffsetTooLarge)
+        end = len(self.data) if end_pos is None else end_pos + 1
+        return FakeResponse(self.data[start_pos:end], len(self.data))
+
+
+async def _stream(data: bytes):
+    for i in range(0, len(data), 1000):
+        yield data[i : i + 1000]
+
+
+def _data() -> bytes:
+    ret = []
+    for i in range(500):
+        ret.append(b"\x00\x01ascii_%d_Needle\x00\xff" % i)
+        ret.append(("utf16_%d" % i).encode("utf-16-le") + b"\x01\x01")
+        ret.append(b"x" * (i % 50) + b"\x02")
+    return b"".join(ret)
+
+
+class TestStringIndex(unit_test.BaseUnitTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = _data()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    async def _index(self) -> string_index.StringIndex:
+        matches = []
+        async for found, _, _ in data_strings.iter_strings(_stream(self.data), 4, 100, 0):
+            matches.extend(found)
+        index = string_index.StringIndex.from_matches(matches, len(self.data), 4, 100)
+        path = os.path.join(self.tmp.name, "a.npz")
+        index.save(path)
+        return string_index.StringIndex.load(path)
+
+    async def test_search_matches_get_strings(self):
+        index = await self._index()
+        for start, end, find_string, find_regex, min_length, max_length in [
+            (0, None, None, None, 4, 100),
+            (0, None, "NEEDLE", None, 4, 100),
+            (1000, 5000, "needle", None, 6, 20),
+            (0, None, None, re.compile(r"_1\d_"), 4, 100),
+            (0, None, "16_4", re.compile(r"9$"), 4, 100),
+            (0, None, "missing", None, 4, 100),
+            (len(self.data), None, None, None, 4, 100),
+        ]:
+            with self.subTest(start=start, end=end, find_string=find_string, find_regex=find_regex):
+                found, _, _ = await data_strings.get_strings(
+                    _stream(self.data), min_length, max_length, 0, find_string, find_regex, 100_000
+                )
+                strings, covered, more = index.search(
+                    min_length=min_length,
+                    max_length=max_length,
+                    start=start,
+                    end=end,
+                    find_string=find_string,
+                    find_regex=find_regex,
+                    max_results=100_000,
+                )
+                # only strings wholly within the covered range are returned
+                stop = len(self.data) if end is None else end
+                self.assertLessEqual(covered, stop - start)
+                expected = [x for x in found if x.offset >= start and x.offset + x.length <= start + covered]
+                self.assertEqual(sorted(expected, key=lambda x: x.offset), strings)
+                self.assertEqual(start + covered < len(self.data), more)
+
+    async def test_search_max_results(self):
+        index = await self._index()
+        strings, _, _ = index.search(
+            min_length=4, max_length=100, start=0, end=None, find_string="needle", find_regex=None, max_results=5
+        )
+        # one more than requested, so callers know there are more
+        self.assertEqual(6, len(strings))
+        self.assertEqual([f"ascii_{i}_Needle" for i in range(6)], [x.string for x in strings])
+
+    async def test_search_paging(self):
+        index = await self._index()
+        expected, _, _ = index.search(
+            min_length=4, max_length=100, start=0, end=None, find_string=None, find_regex=None, max_results=100_000
+        )
+        # page through ranges that cut strings, continuing from the covered length of each
+        strings = []
+        start = 0
+        more = True
+        while more:
+            found, covered, more = index.search(
+                min_length=4,
+                max_length=100,
+                start=start,
+                end=start + 60,
+                find_string=None,
+                find_regex=None,
+                max_results=100_000,
+            )
+            self.assertGreater(covered, 0)
+            strings += found
+            start += covered
+        self.assertEqual(len(self.data), start)
+        self.assertEqual(expected, strings)
+
+    async def test_supports(self):
+        index = await self._index()
+        self.assertTrue(index.supports(4, 100))
+        self.assertTrue(index.supports(10, 50))
+        self.assertFalse(index.supports(3, 100))
+        self.assertFalse(index.supports(4, 101))
+
+    def test_search_strings(self):
+        dispatcher = FakeDispatcher(self.data)
+        kwargs = dict(
+            min_length=4, max_length=100, start=0, end=None, find_string="needle", find_regex=None, max_results=10
+        )
+        with mock.patch.dict(os.environ, {"metastore_string_index_folder": self.tmp.name}):
+            memcache.clear()
+            self.assertIsNone(string_index.search_strings(dispatcher, "user", "source", "label", "ab" * 32, **kwargs))
+            # index is built in the background
+            if (future := string_index._get_build_jobs().get("ab" * 32)) is not None:
+                future.result()
+            reads = dispatcher.reads
+            strings, _, _ = string_index.search_strings(dispatcher, "user", "source", "label", "ab" * 32, **kwargs)
+            self.assertEqual(11, len(strings))
+            self.assertEqual(reads, dispatcher.reads)
+            # lengths outside the index read the binary
+            kwargs["min_length"] = 1
+            self.assertIsNone(string_index.search_strings(dispatcher, "user", "source", "label", "ab" * 32, **kwargs))
+
+    def test_enforce_budget(self):
+        for i, name in enumerate(["old", "mid", "new"]):
+            path = os.path.join(self.tmp.name, name + string_index.INDEX_SUFFIX)
+            with open(path, "wb") as f:
+                f.write(b"0" * 100)
+            os.utime(path, (i, i))
+        string_index._enforce_budget(self.tmp.name, 250)
+        self.assertEqual(["mid.npz", "new.npz"], sorted(os.listdir(self.tmp.name)))
@@ -0,0 +1,78 @@
+from azul_metastore.common import tlsh_index
+from azul_metastore.common.tlsh import encode_tlsh_into_vector
+from tests.support import unit_test
+
+
+def _tlsh(checksum: str = "00", lvalue: str = "00", q_ratio: str = "00", code: str = "00" * 32) -> str:
+    return "T1" + checksum + lvalue + q_ratio + code
+
+
+class TestTLSHIndex(unit_test.BaseUnitTestCase):
+    def test_distance_header(self):
+        self.assertEqual(0, tlsh_index.distance(_tlsh(), _tlsh()))
+        # checksum only adds 1 regardless of difference
+        self.assertEqual(1, tlsh_index.distance(_tlsh(), _tlsh(checksum="FF")))
+        # lvalue differences of 1 are cheap, larger differences are multiplied by 12
+        self.assertEqual(1, tlsh_index.distance(_tlsh(), _tlsh(lvalue="10")))
+        self.assertEqual(24, tlsh_index.distance(_tlsh(), _tlsh(lvalue="20")))
+        # lvalue wraps around
+        self.assertEqual(1, tlsh_index.distance(_tlsh(), _tlsh(lvalue="FF")))
+        # q ratios are 4 bits and also wrap around
+        self.assertEqual(1, tlsh_index.distance(_tlsh(), _tlsh(q_ratio="10")))
+        self.assertEqual(12, tlsh_index.distance(_tlsh(), _tlsh(q_ratio="20")))
+        self.assertEqual(1, tlsh_index.distance(_tlsh(), _tlsh(q_ratio="0F")))
+        self.assertEqual(13, tlsh_index.distance(_tlsh(), _tlsh(q_ratio="F2")))
+
+    def test_distance_code(self):
+        # quartile differences of 1 and 2 are counted as is
+        self.assertEqual(4, tlsh_index.distance(_tlsh(), _tlsh(code="55" + "00" * 31)))
+        self.assertEqual(8, tlsh_index.distance(_tlsh(), _tlsh(code="AA" + "00" * 31)))
+        # quartile difference of 3 is penalised
+        self.assertEqual(24, tlsh_index.distance(_tlsh(), _tlsh(code="FF" + "00" * 31)))
+        self.assertEqual(24 * 32, tlsh_index.distance(_tlsh(), _tlsh(code="FF" * 32)))
+        # symmetric
+        self.assertEqual(
+            tlsh_index.distance(_tlsh(code="1B" * 32), _tlsh(lvalue="01", code="E4" * 32)),
+            tlsh_index.distance(_tlsh(lvalue="01", code="E4" * 32), _tlsh(code="1B" * 32)),
+        )
+
+    def test_query(self):
+        index = tlsh_index.TlshIndex()
+        index.add("same", encode_tlsh_into_vector(_tlsh()))
+        index.add("close", encode_tlsh_into_vector(_tlsh(checksum="11")))
+        index.add("medium", encode_tlsh_into_vector(_tlsh(code="FF" + "00" * 31)))
+        index.add("far", encode_tlsh_into_vector(_tlsh(lvalue="90")))
+        self.assertEqual(4, len(index))
+
+        query = encode_tlsh_into_vector(_tlsh())
+        # identical tlsh and those over the distance are excluded
+        self.assertEqual([("close", 1), ("medium", 24)], index.query(query, max_distance=100, max_count=10))
+        self.assertEqual([("close", 1)], index.query(query, max_distance=10, max_count=10))
+        self.assertEqual([("close", 1)], index.query(query, max_distance=100, max_count=1))
+        self.assertEqual([], index.query(query, max_distance=100, max_count=0))
+
+        # replace existing binary
+        index.add("medium", encode_tlsh_into_vector(_tlsh(code="55" + "00" * 31)))
+        self.assertEqual(4, len(index))
+        self.assertEqual([("close", 1), ("medium", 4)], index.query(query, max_distance=100, max_count=10))
+
+    def test_query_growth(self):
+        index = tlsh_index.TlshIndex()
+        count = tlsh_index.INITIAL_CAPACITY * 3 + 7
+        for i in range(count):
+            # spread lvalues so rows have distances in steps of 12, lvalue is stored with swapped nibbles
+            lvalue = i % 100 + 2
+            tlsh = _tlsh(checksum=f"{i % 256:02X}", lvalue=f"{lvalue & 0xF:X}{lvalue >> 4:X}")
+            index.add(f"e{i}", encode_tlsh_into_vector(tlsh))
+        self.assertEqual(count, len(index))
+
+        results = index.query(encode_tlsh_into_vector(_tlsh()), max_distance=25, max_count=1000)
+        # only lvalue 2 is within distance, with a checksum difference for all but the first
+        self.assertEqual(count // 100 + 1, len(results))
+        self.assertEqual(("e0", 24), results[0])
+        self.assertTrue(all(x[1] == 25 for x in results[1:]))
+
+    def test_bad_vector(self):
+        index = tlsh_index.TlshIndex()
+        with self.assertRaises(ValueError):
+            index.add("bad", [0] * 10)
@@ -283,6 +283,39 @@ class TestWrapper(unit_test.BaseUnitTestCase):
             query,
         )
 
+    @mock.patch("azul_metastore.common.wrapper.TimeAndLogCommand")
+    def test_msearch(self, _cmd):
+        es = _cmd.return_value.__enter__.return_value
+        w = wrapper.Wrapper("", "encoded", {}, [], {}, 1)
+        sd = search_data.SearchData(
+            credentials=Credentials(unique="a", format=CredentialFormat.none),
+            security_exclude=["HIGH"],
+            security_include=[],
+        )
+        searches = [{"index": "a"}, {"query": {"bool": {"filter": [{"term": {"sha256": "x"}}]}}}]
+        must_not = [
+            {"terms": {"encoded_security.inclusive": ["s-high"]}},
+            {"terms": {"encoded_security.exclusive": ["s-high"]}},
+            {"terms": {"encoded_security.markings": ["s-high"]}},
+        ]
+
+        # existing callers are sent their searches unchanged, one at a time
+        w.msearch(sd, searches)
+        es.msearch.assert_called_once_with(index=w.alias, body=searches, max_concurrent_searches=1)
+
+        es.msearch.reset_mock()
+        w.msearch_limited(sd, searches, max_concurrent_searches=4)
+        es.msearch.assert_called_once_with(
+            index=w.alias,
+            body=[
+                {"index": "a"},
+                {"query": {"bool": {"filter": [{"term": {"sha256": "x"}}], "must_not": must_not, "must": []}}},
+            ],
+            max_concurrent_searches=4,
+        )
+        # searches supplied are not modified
+        self.assertEqual([{"index": "a"}, {"query": {"bool": {"filter": [{"term": {"sha256": "x"}}]}}}], searches)
+
     def test_prep_docs(self):
         # test open security processing
         open_security = ["LOW", "MED", "ATTIC"]
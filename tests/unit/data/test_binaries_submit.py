@@ -1,8 +1,10 @@
 from azul_bedrock.exception_enums import ExceptionCodeEnum
+import asyncio
 import copy
 import hashlib
 import io
 import json
+import time
 from unittest import mock
 
 import cart
@@ -10,11 +12,13 @@ import malpz
 import pyzipper
 from azul_bedrock import models_api
 from azul_bedrock import models_network as azm
+from azul_bedrock.dispatcher import DispatcherAPI
+from azul_bedrock.exceptions_bedrock import ApiException
 
 from azul_metastore.context import Context
 from azul_metastore.query.binary2 import binary_submit
 from azul_metastore.settings import get as get_metastore_settings
-from tests.support import gen, unit_test
+from tests.support import basic_test, gen, unit_test
 import pendulum
 
 from . import helpers
@@ -719,3 +723,110 @@ class TestSubmitChildDataless(unit_test.DataMockingUnitTest):
         j = json.loads(response.text)
         print(j["detail"]["internal"])
         self.assertEqual(j["detail"]["internal"], ExceptionCodeEnum.MetastoreReadOnlyMode.value)
+
+
+# ----------------------------------------------------------------------------------------- Submit Archive
+class SlowDispatcher:
+    """Responds to submissions after a delay, tracking how many uploads run at the same time."""
+
+    DELAY = 0.05
+
+    def __init__(self, fail: set[bytes] = frozenset()):
+        self.fail = fail
+        self.active = 0
+        self.max_active = 0
+        self.event_posts: list[list[azm.BaseEvent]] = []
+
+    async def async_submit_binary(self, source, label, content, timeout=None):
+        data = b"".join([x async for x in DispatcherAPI.async_convert_to_async_iterable(content)])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.DELAY)
+        finally:
+            self.active -= 1
+        if data in self.fail:
+            raise ApiException(
+                status_code=500,
+                ref="upload failed",
+                internal=ExceptionCodeEnum.MetastoreBinarySubmitDispatcherRejectedEvent,
+            )
+        return gen.gen_binary_data(data, label=label)
+
+    def submit_events(self, events, **kwargs):
+        time.sleep(self.DELAY)
+        self.event_posts.append(events)
+        return basic_test.resp_submit_events(events, **kwargs)
+
+
+@mock.patch("azul_bedrock.dispatcher.DispatcherAPI", unit_test.FakeDispatcherAPI)
+@mock.patch.object(Context, "get_user_access", helpers.mock_get_user_access)
+class TestSubmitArchive(unit_test.DataMockingUnitTest):
+    def _post(self, route: str, dispatcher: SlowDispatcher, count: int, data: list):
+        ostream = io.BytesIO()
+        with pyzipper.ZipFile(ostream, "w") as zf:
+            for i in range(count):
+                zf.writestr(f"file_{i}.txt", b"hello %d" % i)
+        with (
+            mock.patch(
+                "azul_bedrock.dispatcher.DispatcherAPI.async_submit_binary", side_effect=dispatcher.async_submit_binary
+            ),
+            mock.patch("azul_bedrock.dispatcher.DispatcherAPI.submit_events", side_effect=dispatcher.submit_events),
+        ):
+            return self.client.post(
+                route, files=data + [("binary", ("file.zip", ostream.getvalue()))], params={"extract": True}
+            )
+
+    def test_source_parallel(self):
+        dispatcher = SlowDispatcher()
+        data = [("source_id", (None, "user")), ("references", (None, json.dumps({"apple": "banana"})))]
+        start = time.perf_counter()
+        response = self._post("/v0/binaries/source", dispatcher, 40, data + [("security", (None, "low"))])
+        taken = time.perf_counter() - start
+        self.assertEqual(200, response.status_code)
+        j = json.loads(response.text)
+        # results are in archive order
+        self.assertEqual([f"file_{i}.txt" for i in range(40)], [x["filename"] for x in j])
+        self.assertEqual([hashlib.sha256(b"hello %d" % i).hexdigest() for i in range(40)], [x["sha256"] for x in j])
+
+        concurrency = get_metastore_settings().submit_concurrency
+        self.assertEqual(concurrency, dispatcher.max_active)
+        # uploads overlap rather than taking 40 round trips
+        self.assertLess(taken, 40 * SlowDispatcher.DELAY)
+        # events for every file are sent together
+        self.assertEqual(1, len(dispatcher.event_posts))
+        self.assertEqual(40, len(dispatcher.event_posts[0]))
+
+    def test_child_parallel(self):
+        dispatcher = SlowDispatcher()
+        data = [("parent_sha256", (None, hashlib.sha256(b"hello").hexdigest())), ("security", (None, "low"))]
+        response = self._post("/v0/binaries/child", dispatcher, 20, data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(20, len(json.loads(response.text)))
+        self.assertLess(1, dispatcher.max_active)
+        # insert events for every file are sent together
+        self.assertEqual(1, len(dispatcher.event_posts))
+        self.assertEqual(20, len(dispatcher.event_posts[0]))
+        self.assertTrue(all(isinstance(x, azm.InsertEvent) for x in dispatcher.event_posts[0]))
+
+    def test_partial_failure(self):
+        dispatcher = SlowDispatcher(fail={b"hello 3", b"hello 7"})
+        data = [("source_id", (None, "user")), ("security", (None, "low"))]
+        response = self._post("/v0/binaries/source", dispatcher, 10, data)
+        self.assertEqual(500, response.status_code)
+        self.assertEqual("Unable to submit 2 of 10 files", json.loads(response.text)["detail"]["ref"])
+        # files that were uploaded are still submitted
+        self.assertEqual(1, len(dispatcher.event_posts))
+        self.assertEqual(
+            [f"file_{i}.txt" for i in range(10) if i not in (3, 7)],
+            [x.source.path[0].filename for x in dispatcher.event_posts[0]],
+        )
+
+    def test_all_failed(self):
+        dispatcher = SlowDispatcher(fail={b"hello 0", b"hello 1"})
+        data = [("source_id", (None, "user")), ("security", (None, "low"))]
+        response = self._post("/v0/binaries/source", dispatcher, 2, data)
+        # reported as if there was a single file
+        self.assertEqual(500, response.status_code)
+        self.assertEqual("upload failed", json.loads(response.text)["detail"]["ref"])
+        self.assertEqual([], dispatcher.event_posts)
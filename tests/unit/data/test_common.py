@@ -2,7 +2,11 @@ import datetime
 import io
 import json
 import re
+import subprocess
+import sys
 from unittest import mock
+
+import pytest
 from azul_bedrock import exceptions_bedrock
 from azul_bedrock import exceptions_metastore
 from azul_bedrock.dispatcher import DispatcherAPI
@@ -23,6 +27,29 @@ import pendulum
 from . import helpers
 
 
+# searches a 1GB stream for strings, printing the results and the increase in peak memory in KB
+BOUNDED_MEMORY_SCRIPT = """
+import asyncio
+import resource
+
+from azul_metastore.common import data_strings
+
+chunk = (b"\\x00" * 1000 + b"needle") * 1000
+
+
+async def stream():
+    for _ in range(1024**3 // len(chunk)):
+        yield chunk
+
+
+start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+strings, file_length, more_data = asyncio.run(
+    data_strings.get_strings(stream(), 4, 200, 0, find_string="missing")
+)
+print(len(strings), file_length, more_data, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss)
+"""
+
+
 @mock.patch.object(Context, "get_user_access", helpers.mock_get_user_access)
 class CommonTestCases(unit_test.DataMockingUnitTest):
     maxDiff = None
@@ -610,7 +637,7 @@ class CommonTestCases(unit_test.DataMockingUnitTest):
         strings, file_length, more_data = await data_strings.get_strings(
             self.make_string_iterable(data), 1, 4, 0, strings_to_read_before_stopping=1, buffer_size=4
         )
-        self.assertEqual(file_length, 5)  # Read one chunk
+        self.assertEqual(file_length, 8)  # Read two chunks, as the first ends part way through a string
         self.assertGreater(len(data), file_length)  # Verify we didn't read all the contents
         self.assertEqual(more_data, True)
         self.assertEqual(1, len(strings))
@@ -633,3 +660,56 @@ class CommonTestCases(unit_test.DataMockingUnitTest):
         )
         self.assertEqual(file_length, len(data))
         self.assertEqual(1, len(strings))
+
+    async def test_read_fixed_chunks(self):
+        async def read(data: bytes, chunk_size: int) -> list[tuple[bytes, bool]]:
+            return [x async for x in data_common.read_fixed_chunks(self.make_string_iterable(data), chunk_size)]
+
+        self.assertEqual([(b"hell", False), (b"owor", False), (b"ld", True)], await read(b"helloworld", 4))
+        self.assertEqual([(b"hello", False), (b"world", True)], await read(b"helloworld", 5))
+        self.assertEqual([(b"helloworld", True)], await read(b"helloworld", 100))
+        self.assertEqual([(b"", True)], await read(b"", 4))
+
+    async def test_get_strings_chunk_offsets(self):
+        """Strings crossing chunks are found once, with the same offsets as reading the data in one chunk."""
+        data = b"".join(b"%d\x00\x01" % i + ("utf16_%d" % i).encode("utf-16-le") for i in range(200))
+        expected, _, _ = await data_strings.get_strings(self.make_string_iterable(data), 2, 20, 10, buffer_size=10**6)
+        expected = [(x.offset, x.string) for x in expected]
+        self.assertEqual(390, len(expected))
+        for buffer_size in [1, 7, 33, 100]:
+            strings, file_length, more_data = await data_strings.get_strings(
+                self.make_string_iterable(data), 2, 20, 10, buffer_size=buffer_size
+            )
+            self.assertEqual(file_length, len(data))
+            self.assertEqual(more_data, False)
+            self.assertCountEqual(expected, [(x.offset, x.string) for x in strings])
+
+    @pytest.mark.slow
+    def test_get_strings_bounded_memory(self):
+        """Reading a 1GB stream only holds one chunk at a time."""
+        # peak memory is a high water mark for the whole process, so measure in a fresh one
+        rsp = subprocess.run(  # noqa: S603
+            [sys.executable, "-c", BOUNDED_MEMORY_SCRIPT], capture_output=True, text=True, check=True, timeout=600
+        )
+        strings, file_length, more_data, peak_rss_kb = rsp.stdout.split()
+        self.assertEqual("0", strings)
+        self.assertGreater(int(file_length), 1000**3)
+        self.assertEqual("False", more_data)
+        self.assertLess(int(peak_rss_kb), 64 * 1024)
+
+    async def test_get_common_strings(self):
+        data_a = b"alpha\x00beta\x00gamma\x00delta\x00only_a"
+        data_b = b"delta\x00only_b\x00beta\x00alpha"
+        common, content_read, complete = await data_strings.get_common_strings(
+            (self.make_string_iterable(data_a), self.make_string_iterable(data_b)), 4, 200, 100
+        )
+        self.assertEqual({"alpha", "beta", "delta"}, common)
+        self.assertEqual((len(data_a), len(data_b)), content_read)
+        self.assertTrue(complete)
+
+        # strings repeated within one binary are not common
+        common, content_read, complete = await data_strings.get_common_strings(
+            (self.make_string_iterable(b"repeat\x00repeat"), self.make_string_iterable(b"other")), 4, 200, 100
+        )
+        self.assertEqual(set(), common)
+        self.assertTrue(complete)
@@ -0,0 +1,116 @@
+from azul_metastore.common import data_hex
+from tests.support import unit_test
+
+
+def _longform(chunk: bytes) -> list[str]:
+    """Previous per byte formatting of longform rows."""
+    ret = [format(x, "0>2x").upper() for x in chunk]
+    return ret + ["" for _ in range(len(ret), 16)]
+
+
+def _shortform(chunk: bytes) -> str:
+    """Previous per byte formatting of shortform rows."""
+    ret = [format(x, "0>2x").lower() for x in chunk]
+    tmp = ["".join(ret[i : (i + 2)]) for i in range(0, 16, 2)]
+    return " ".join(x for x in tmp if x)
+
+
+class TestHexView(unit_test.BaseUnitTestCase):
+    def test_header(self):
+        self.assertEqual("0001 0203 0405 0607 0809 0a0b 0c0d 0e0f", data_hex.hex_view_header(True))
+        self.assertEqual([f"{x:02X}" for x in range(16)], data_hex.hex_view_header(False))
+
+    def test_rows(self):
+        rows = data_hex.hex_view_rows(b"hello\x00\\world!\xff\x10\x7f" * 2 + b"abc", 32, True)
+        self.assertEqual([32, 48, 64], [x.address for x in rows])
+        self.assertEqual(
+            ["6865 6c6c 6f00 5c77 6f72 6c64 21ff 107f", "6865 6c6c 6f00 5c77 6f72 6c64 21ff 107f", "6162 63"],
+            [x.hex for x in rows],
+        )
+        self.assertEqual(["hello.\\world!...", "hello.\\world!...", "abc"], [x.ascii for x in rows])
+
+        rows = data_hex.hex_view_rows(b"abc", 0, False)
+        self.assertEqual(["61", "62", "63"] + [""] * 13, rows[0].hex)
+
+        self.assertEqual([], data_hex.hex_view_rows(b"", 0, True))
+
+    def test_matches_per_byte_formatting(self):
+        data = bytes(range(256)) * 3 + b"tail"
+        for length in [1, 2, 15, 16, 17, 31, 33, len(data)]:
+            chunk = data[:length]
+            for shortform, formatter in [(True, _shortform), (False, _longform)]:
+                with self.subTest(length=length, shortform=shortform):
+                    rows = data_hex.hex_view_rows(chunk, 100, shortform)
+                    expected = [
+                        (100 + i, formatter(chunk[i : i + 16]), data_hex.ascii_group_formatter(chunk[i : i + 16]))
+                        for i in range(0, length, 16)
+                    ]
+                    self.assertEqual(expected, [(x.address, x.hex, x.ascii) for x in rows])
+
+
+async def _chunked(data: bytes, chunk_size: int):
+    for i in range(0, len(data), chunk_size):
+        yield data[i : i + chunk_size]
+
+
+class TestMultiHexHits(unit_test.BaseUnitTestCase):
+    async def test_hits(self):
+        data = b"\x00\xde\xad\xbe\xef\x00\xde\xad\x00\xbe\xef\xde\xad\xbe\xef"
+        patterns = [b"\xde\xad\xbe\xef", b"\xde\xad", b"\xbe\xef", b"\xff"]
+        expected = {b"\xde\xad\xbe\xef": [101, 111], b"\xde\xad": [101, 106, 111], b"\xbe\xef": [103, 109, 113]}
+        expected[b"\xff"] = []
+        # hits spanning chunks are found once, whatever the chunk size
+        for chunk_size in [1, 2, 3, 5, 100]:
+            with self.subTest(chunk_size=chunk_size):
+                hits, read, more = await data_hex.get_multi_hex_hits(
+                    _chunked(data, chunk_size), 100, 1000, patterns, buffer_size=chunk_size
+                )
+                self.assertEqual(expected, hits)
+                self.assertEqual(len(data), read)
+                self.assertFalse(more)
+
+    async def test_max_results(self):
+        data = b"ab" * 10
+        hits, read, more = await data_hex.get_multi_hex_hits(_chunked(data, 4), 0, 3, [b"ab", b"ba"], buffer_size=4)
+        # lowest offsets are kept across all patterns
+        self.assertEqual({b"ab": [0, 2], b"ba": [1]}, hits)
+        # next search starts at the first hit not returned
+        self.assertEqual(3, read)
+        self.assertTrue(more)
+
+    async def test_max_results_longer_pattern_first(self):
+        # the long pattern starts first but ends in the next chunk
+        data = b"xxlongpatternshort" + b"x" * 10
+        patterns = [b"longpattern", b"pattern", b"short"]
+        for chunk_size in [1, 4, 8, 100]:
+            with self.subTest(chunk_size=chunk_size):
+                hits, read, more = await data_hex.get_multi_hex_hits(
+                    _chunked(data, chunk_size), 0, 1, patterns, buffer_size=chunk_size
+                )
+                self.assertEqual({b"longpattern": [2], b"pattern": [], b"short": []}, hits)
+                # next search starts after the hit, at or before the first hit not returned
+                self.assertTrue(2 < read <= 6)
+                self.assertTrue(more)
+
+    async def test_paging(self):
+        data = bytes(range(256)) * 4 + b"abcabcabc"
+        patterns = [bytes(range(10, 20)), bytes([15, 16]), b"abc", b"ca"]
+        expected, _, _ = await data_hex.get_multi_hex_hits(_chunked(data, 7), 0, 1000, patterns, buffer_size=7)
+        found = {x: [] for x in expected}
+        offset = 0
+        more = True
+        while more:
+            hits, read, more = await data_hex.get_multi_hex_hits(
+                _chunked(data[offset:], 7), offset, 3, patterns, buffer_size=7
+            )
+            for pattern, offsets in hits.items():
+                found[pattern] += offsets
+            offset += read
+        self.assertEqual(expected, found)
+
+    async def test_matches_single_pattern(self):
+        data = bytes(range(256)) * 20
+        pattern = bytes([250, 251, 252, 253, 254, 255, 0, 1])
+        single, _, _ = await data_hex.get_hex_hits(_chunked(data, 100), 0, 1000, pattern, buffer_size=100)
+        hits, _, _ = await data_hex.get_multi_hex_hits(_chunked(data, 100), 0, 1000, [pattern], buffer_size=100)
+        self.assertEqual([x.offset for x in single], hits[pattern])
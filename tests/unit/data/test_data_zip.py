@@ -0,0 +1,89 @@
+import asyncio
+import io
+
+import pyzipper
+
+from azul_metastore.common import data_zip
+from tests.support import unit_test
+
+
+class TestZipStream(unit_test.BaseUnitTestCase):
+    def setUp(self):
+        super().setUp()
+        self.open = 0
+        self.max_open = 0
+        self.chunks_read = 0
+
+    def _entry(self, name: str, chunks: list[bytes], fail: bool = False) -> data_zip.ZipEntry:
+        async def _iter():
+            self.open += 1
+            self.max_open = max(self.open, self.max_open)
+            try:
+                for chunk in chunks:
+                    await asyncio.sleep(0)
+                    self.chunks_read += 1
+                    yield chunk
+            finally:
+                self.open -= 1
+
+        async def _get():
+            if fail:
+                raise Exception("missing")
+            return _iter()
+
+        return name, _get
+
+    async def _read(self, zs: data_zip.ZipStream) -> pyzipper.ZipFile:
+        out = b""
+        async for chunk in zs.stream():
+            out += chunk
+        return pyzipper.ZipFile(io.BytesIO(out), "r")
+
+    async def test_stream(self):
+        zs = data_zip.ZipStream(
+            [
+                self._entry("a", [b"a" * 1000] * 10),
+                self._entry("b", [b"b"], fail=True),
+                self._entry("c", [b"hello", b"world"]),
+                self._entry("d", []),
+            ],
+            concurrency=2,
+        )
+        self.assertTrue(await zs.first_entry())
+        zf = await self._read(zs)
+        # archive order is kept and failed files are skipped
+        self.assertEqual(["a", "c", "d"], zf.namelist())
+        self.assertEqual(b"a" * 10000, zf.read("a"))
+        self.assertEqual(b"helloworld", zf.read("c"))
+        self.assertEqual(b"", zf.read("d"))
+        self.assertEqual(pyzipper.ZIP_DEFLATED, zf.getinfo("a").compress_type)
+
+    async def test_no_entries(self):
+        zs = data_zip.ZipStream([self._entry("a", [b"a"], fail=True), self._entry("b", [b"b"], fail=True)])
+        self.assertFalse(await zs.first_entry())
+
+    async def test_bounded(self):
+        entries = [self._entry(f"f{i}", [b"x" * 100] * 100) for i in range(10)]
+        zs = data_zip.ZipStream(entries, concurrency=3, buffered_chunks=4)
+        self.assertTrue(await zs.first_entry())
+        # only files in the window are read, and only until their queue is full
+        await asyncio.sleep(0.1)
+        self.assertLessEqual(self.chunks_read, 3 * 6)
+
+        zf = await self._read(zs)
+        self.assertEqual([f"f{i}" for i in range(10)], zf.namelist())
+        self.assertEqual(3, self.max_open)
+        self.assertEqual(0, self.open)
+
+    async def test_failed_midway(self):
+        async def _iter():
+            yield b"start"
+            raise Exception("connection lost")
+
+        async def _get():
+            return _iter()
+
+        zs = data_zip.ZipStream([("a", _get)])
+        self.assertTrue(await zs.first_entry())
+        with self.assertRaises(Exception):
+            await self._read(zs)
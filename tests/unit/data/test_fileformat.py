@@ -1,5 +1,10 @@
+import gzip
+import hashlib
 import io
+import os
+import tarfile
 from typing import AsyncIterable
+from unittest import mock
 
 from azul_bedrock.test_utils import file_manager
 from fastapi import UploadFile
@@ -10,6 +15,17 @@ from tests.support import unit_test
 from . import helpers
 
 
+class _CountingBytesIO(io.BytesIO):
+    """Counts the bytes read from the stream."""
+
+    bytes_read = 0
+
+    def read(self, size: int | None = -1) -> bytes:
+        ret = super().read(size)
+        self.bytes_read += len(ret)
+        return ret
+
+
 class FileformatTestCases(unit_test.BaseUnitTestCase):
     maxDiff = None
 
@@ -79,6 +95,89 @@ class FileformatTestCases(unit_test.BaseUnitTestCase):
             with self.assertRaisesRegex(exceptions_metastore.ExtractException, r"too many files"):
                 list(fileformat.extract_archive(indata))
 
+    def _tar(self, files: dict[str, bytes], mode: str = "w") -> io.BytesIO:
+        out = io.BytesIO()
+        with tarfile.open(fileobj=out, mode=mode) as tf:
+            for name, data in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+        out.seek(0)
+        return out
+
+    def test_iter_archive(self):
+        files = {f"dir/file_{i}.bin": b"%d" % i * (i * 1000) for i in range(50)}
+
+        for mode in ["w", "w:gz", "w:bz2", "w:xz"]:
+            with self.subTest(mode=mode):
+                out = list(fileformat.iter_archive(self._tar(files, mode)))
+                # empty file is skipped
+                self.assertEqual(list(files)[1:], [x.name for x in out])
+                for member in out:
+                    data = member.stream.read()
+                    self.assertEqual(files[member.name], data)
+                    self.assertEqual(hashlib.sha256(data).hexdigest(), member.sha256)
+
+        # the tar is only read once
+        random_files = {f"file_{i}.bin": os.urandom(50_000) for i in range(20)}
+        indata = _CountingBytesIO(self._tar(random_files, "w:gz").getvalue())
+        list(fileformat.iter_archive(indata))
+        self.assertLess(indata.bytes_read, len(indata.getvalue()) * 1.5)
+
+        # zip members are hashed
+        with helpers.get_file("fake_infected.zip") as indata:
+            out = list(fileformat.iter_archive(indata, "infected"))
+            self.assertEqual(["fake.txt", "fake_meta.txt"], [x.name for x in out])
+            self.assertEqual(hashlib.sha256(out[0].stream.read()).hexdigest(), out[0].sha256)
+
+        # gzip of a single file uses the name in its header
+        indata = io.BytesIO()
+        with gzip.GzipFile(filename="inner.bin", mode="wb", fileobj=indata, mtime=0) as f:
+            f.write(b"hello world")
+        out = list(fileformat.iter_archive(indata))
+        self.assertEqual([("inner.bin", hashlib.sha256(b"hello world").hexdigest())], [x[:2] for x in out])
+        self.assertEqual(b"hello world", out[0].stream.read())
+
+        # gzip without a name
+        out = list(fileformat.iter_archive(io.BytesIO(gzip.compress(b"hello world"))))
+        self.assertEqual([None], [x.name for x in out])
+
+    def test_iter_archive_limits(self):
+        # tar, too many files
+        files = {f"file_{i}": b"a" for i in range(fileformat.MAX_BUNDLED_FILES + 1)}
+        with self.assertRaisesRegex(exceptions_metastore.ExtractException, r"too many files"):
+            list(fileformat.iter_archive(self._tar(files, "w:gz")))
+
+        # tar, path elevation
+        with self.assertRaisesRegex(exceptions_metastore.ExtractException, r"bad character sequence"):
+            list(fileformat.iter_archive(self._tar({"a/../../etc/passwd": b"a"})))
+
+        # tar, only empty files
+        with self.assertRaisesRegex(exceptions_metastore.ExtractException, r"no files were extracted"):
+            list(fileformat.iter_archive(self._tar({"a": b""})))
+
+        # gzip, more bytes than allowed after decompression
+        indata = io.BytesIO(gzip.compress(b"a" * (fileformat.MAX_BUNDLED_POST_EXTRACT_SIZE + 1)))
+        with self.assertRaisesRegex(exceptions_metastore.ExtractException, r"too many bytes in extracted submission"):
+            list(fileformat.iter_archive(indata))
+
+        # tar, limits are checked before the rest of the archive is read
+        files = {f"file_{i}": os.urandom(10_000) for i in range(100)}
+        for name, patches in [
+            ("too many files", {"MAX_BUNDLED_FILES": 5}),
+            ("too many bytes in extracted submission", {"MAX_BUNDLED_POST_EXTRACT_SIZE": 50_000}),
+        ]:
+            with self.subTest(limit=name), mock.patch.multiple(fileformat, **patches):
+                indata = self._tar(files, "w:gz")
+                with self.assertRaisesRegex(exceptions_metastore.ExtractException, name):
+                    list(fileformat.iter_archive(indata))
+                self.assertLess(indata.tell(), len(indata.getvalue()) // 2)
+
+        # truncated tar.gz
+        data = self._tar({"a": b"a" * 100_000}, "w:gz").getvalue()
+        with self.assertRaises(exceptions_metastore.ExtractException):
+            list(fileformat.iter_archive(io.BytesIO(data[: len(data) // 2])))
+
     async def test_handle_malpz(self):
         with helpers.get_file("fake.txt.malpz") as indata:
             d, meta = await fileformat.async_handle_malpz(UploadFile(indata))
@@ -141,6 +240,14 @@ class FileformatTestCases(unit_test.BaseUnitTestCase):
             self.assertEqual(121, len(await self._convert_to_bytes(d)))
             self.assertEqual("fake.txt", fname)
 
+        # tar.gz with extraction
+        with helpers.get_file("fake.tar.gz") as indata:
+            out = await self._convert_to_list(fileformat.unpack_content(UploadFile(indata), extract=True))
+            self.assertEqual(1, len(out))
+            d, fname = out[0]
+            self.assertEqual(121, len(await self._convert_to_bytes(d)))
+            self.assertEqual("fake.txt", fname)
+
         # zip with extraction of cart
         with helpers.get_file("zipped.cart.zip") as indata:
             out = await self._convert_to_list(fileformat.unpack_content(UploadFile(indata), extract=True))
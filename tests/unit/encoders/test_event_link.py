@@ -0,0 +1,45 @@
+import json
+import os
+
+from azul_metastore.encoders import binary2
+from azul_metastore.encoders import link as lk
+from tests.support import gen, unit_test
+
+
+class TestLinkEncode(unit_test.BaseUnitTestCase):
+    @classmethod
+    def alter_environment(cls):
+        super().alter_environment()
+        os.environ["metastore_sources"] = json.dumps({"generic_source": {}})
+
+    def test_mapping(self):
+        # test that the mapping is serialisable
+        json.dumps(lk.Link.mapping)
+
+    def test_encode(self):
+        data = binary2.Binary2.encode(gen.binary_event(model=False, eid="e10", spathl=[("e1", None)]))
+        self.assertTrue(lk.Link.has_link(data))
+        encoded = lk.Link.encode(data)
+
+        # shares id with the binary2 doc, but is routed by the parent
+        self.assertEqual(data["_id"], encoded["_id"])
+        self.assertEqual("e1", encoded["_routing"])
+        self.assertEqual("e10", encoded["sha256"])
+        self.assertEqual("e1", encoded["parent"]["sha256"])
+        self.assertEqual(data["track_link"], encoded["track_link"])
+        self.assertEqual(data["parent_relationship"], encoded["parent_relationship"])
+        self.assertEqual(data["encoded_security"], encoded["encoded_security"])
+        self.assertEqual({"name": "generic_source", "timestamp": data["source"]["timestamp"]}, encoded["source"])
+        # partitioned the same as the binary2 doc
+        self.assertEqual(data["_index_extension"], encoded["_index_extension"])
+        # only properties in the mapping are kept
+        self.assertFalse(
+            set(encoded).difference(lk.Link.mapping["properties"]).difference({"_id", "_routing", "_index_extension"}),
+        )
+        # binary2 doc is not altered
+        encoded["parent"]["sha256"] = "other"
+        self.assertEqual("e1", data["parent"]["sha256"])
+
+    def test_no_link(self):
+        data = binary2.Binary2.encode(gen.binary_event(model=False, eid="e1", action="sourced", spathl=[]))
+        self.assertFalse(lk.Link.has_link(data))
@@ -1,5 +1,6 @@
 from unittest import mock
 
+from azul_metastore.common import memcache
 from azul_metastore.common.query_info import IngestError
 from azul_metastore.query import binary_create
 from tests.support import gen, unit_test
@@ -44,3 +45,43 @@ class TestBinaryCreateEvents(unit_test.BaseUnitTestCase):
         print(doc_success)
         self.assertEqual(len(doc_success.keys()), 3)
         self.assertEqual(list(doc_success.values()), [1, -1, 1])
+
+    def _mock_link_writes(self):
+        self.ctx.man = mock.MagicMock()
+        self.ctx.man.binary2.w.wrap_docs.side_effect = lambda docs: [{"_id": x.pop("_id"), "_source": x} for x in docs]
+        self.ctx.man.binary2.w.index_docs.return_value = []
+        self.ctx.man.link.w.wrap_and_index_docs.side_effect = lambda sd, docs, **kwargs: [
+            IngestError(doc=x, error_type="link_error", error_reason="no reason") for x in docs
+        ]
+
+    @mock.patch("azul_metastore.query.binary_create._already_aged_off", lambda x: False)
+    def test_binary_create_link_errors(self):
+        """Test that links that fail to index are logged without failing the binary2 doc."""
+        self._mock_link_writes()
+        with self.assertLogs("azul_metastore.query.binary_create", level="ERROR") as logs:
+            failures, _, authors = binary_create._create_binary_events(
+                self.ctx, [gen.binary_event(eid="e10", spathl=[("e1", ("a1", "1"))])]
+            )
+        self.assertEqual([], failures)
+        # author counts are the same as when every link is saved
+        self.ctx.man.link.w.wrap_and_index_docs.side_effect = lambda sd, docs, **kwargs: []
+        memcache.clear()
+        _, _, expected = binary_create._create_binary_events(
+            self.ctx, [gen.binary_event(eid="e10", spathl=[("e1", ("a1", "1"))])]
+        )
+        self.assertEqual(expected, authors)
+        self.assertIn("failed to index link link_error", logs.output[0])
+
+    @mock.patch("azul_metastore.query.binary_create._already_aged_off", lambda x: False)
+    def test_binary_create_link_not_copied(self):
+        """Test that links are not copied to the link index when the binary2 doc failed to index."""
+        self._mock_link_writes()
+        self.ctx.man.binary2.w.index_docs.side_effect = lambda sd, rows, **kwargs: [
+            IngestError(doc=x["_source"], error_type="binary_error", error_reason="no reason", doc_id=x["_id"])
+            for x in rows
+        ]
+        failures, _, _ = binary_create._create_binary_events(
+            self.ctx, [gen.binary_event(eid="e10", spathl=[("e1", ("a1", "1"))])]
+        )
+        self.assertEqual({"binary_error"}, {x.error_type for x in failures})
+        self.assertEqual([], self.ctx.man.link.w.wrap_and_index_docs.call_args.args[1])
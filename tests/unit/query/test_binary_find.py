@@ -0,0 +1,52 @@
+from unittest import mock
+
+from azul_bedrock.exceptions_bedrock import ApiException
+
+from azul_metastore.query.binary2 import binary_find
+from tests.support import unit_test
+
+FAILED = {"error": {"type": "search_phase_execution_exception", "reason": "all shards failed"}, "status": 503}
+
+
+class TestBinaryFind(unit_test.BaseUnitTestCase):
+    def test_summarise_hashes_process_failed_search(self):
+        binaries = {"a" * 64: {}}
+        with self.assertRaises(ApiException) as e:
+            binary_find._summarise_hashes_process(None, FAILED, binaries, list(binaries.keys()))
+        self.assertEqual(503, e.exception.status_code)
+        self.assertEqual("all shards failed", e.exception.detail["parameters"]["inner_exception"])
+
+    def test_enrich_binaries_failed_search(self):
+        ctx = mock.MagicMock()
+        ctx.sd.security_exclude = []
+        ctx.sd.security_include = []
+        binaries = {"a" * 64: {}}
+        # the tags search fails
+        ctx.man.binary2.w.msearch_limited.return_value = {"responses": [FAILED, {}]}
+        with self.assertRaises(ApiException):
+            binary_find._enrich_binaries(ctx, binaries)
+        # the summary search fails
+        ctx.man.binary2.w.msearch_limited.return_value = {
+            "responses": [{"aggregations": {"SHA256": {"buckets": []}}}, FAILED]
+        }
+        with self.assertRaises(ApiException):
+            binary_find._enrich_binaries(ctx, binaries)
+
+    def test_summarise_hashes_chunked_cached(self):
+        ctx = mock.MagicMock()
+        binaries = {f"{i:064x}": {} for i in range(7)}
+        keys = list(binaries.keys())
+        # every other binary has a cached summary
+        uncached = keys[1::2]
+        ctx.man.binary2.w.msearch_limited.side_effect = lambda sd, searches, **kwargs: {
+            "responses": [{} for _ in searches[::2]]
+        }
+        with (
+            mock.patch.object(binary_find, "_summarise_hashes_from_cache", return_value=uncached),
+            mock.patch.object(binary_find, "_summarise_hashes_process") as process,
+        ):
+            chunks = list(binary_find._summarise_hashes_chunked(ctx, binaries, chunk_size=2, chunks_per_msearch=2))
+        # cached binaries are batched too, in the same order
+        self.assertEqual([keys[0:2], keys[2:4], keys[4:6], keys[6:7]], chunks)
+        self.assertEqual([[keys[1]], [keys[3]], [keys[5]]], [x.args[3] for x in process.call_args_list])
+        self.assertEqual(2, ctx.man.binary2.w.msearch_limited.call_count)
@@ -0,0 +1,55 @@
+import os
+import threading
+from unittest import mock
+
+import numpy as np
+
+from azul_metastore.common import memcache
+from azul_metastore.common.tlsh_index import TlshIndex
+from azul_metastore.query.binary2 import binary_similar
+from tests.support import unit_test
+
+
+def _hit(*fvals: tuple[str, str]) -> dict:
+    return {"_source": {"features": [{"name": x, "value": y} for x, y in fvals]}}
+
+
+class TestBinarySimilar(unit_test.BaseUnitTestCase):
+    def test_count_collisions(self):
+        fval_ids = {("f1", "a"): 0, ("f1", "b"): 1, ("f2", "a"): 2, ("f2", "b"): 3}
+        hits = [
+            _hit(("f1", "a"), ("f1", "b"), ("f2", "a")),
+            # repeated and unknown feature values
+            _hit(("f1", "a"), ("f1", "a"), ("f3", "a"), ("f2", "b")),
+            _hit(),
+            _hit(("f2", "a"), ("f2", "b")),
+        ]
+        target = np.array([0, 1, 3], dtype=np.int64)
+        self.assertEqual([2, 2, 0, 1], binary_similar._count_collisions(hits, fval_ids, target).tolist())
+        self.assertEqual([], binary_similar._count_collisions([], fval_ids, target).tolist())
+
+    @mock.patch("azul_metastore.query.binary2.binary_similar._tlsh_index", None)
+    @mock.patch("azul_metastore.query.binary2.binary_similar._tlsh_index_started", None)
+    def test_get_tlsh_index(self):
+        self.assertIsNone(binary_similar.get_tlsh_index())
+
+        loading = threading.Event()
+        index = TlshIndex()
+
+        def _load(ctx):
+            loading.wait(10)
+            return index
+
+        with (
+            mock.patch.dict(os.environ, {"metastore_tlsh_local_index": "true"}),
+            mock.patch("azul_metastore.context.get_writer_context"),
+            mock.patch.object(binary_similar, "load_tlsh_index", side_effect=_load) as load,
+        ):
+            memcache.clear()
+            # requests don't wait for the index to load
+            self.assertIsNone(binary_similar.get_tlsh_index())
+            self.assertIsNone(binary_similar.get_tlsh_index())
+            loading.set()
+            binary_similar._tlsh_index_jobs.get("tlsh_index").result(10)
+            self.assertIs(index, binary_similar.get_tlsh_index())
+            self.assertEqual(1, load.call_count)
@@ -0,0 +1,34 @@
+from azul_bedrock import models_api
+
+from azul_metastore.query.binary2 import binary_submit_manual
+from tests.support import unit_test
+
+
+def _ev(sha256: str, i: int) -> dict:
+    return {"entity": {"sha256": sha256}, "i": i}
+
+
+def _key(ev: dict) -> str:
+    return ev["entity"]["sha256"]
+
+
+class TestBinarySubmitManual(unit_test.BaseUnitTestCase):
+    def test_split_ok_events(self):
+        events = [[object(), object()], [object()], [object(), object()]]
+        keys = ["a", "b", "a"]
+        ok = [_ev("a", 0), _ev("a", 1), _ev("b", 2), _ev("a", 3), _ev("a", 4)]
+
+        # every event accepted
+        resp = models_api.ResponsePostEvent(total_ok=5, total_failures=0, failures=[], ok=ok)
+        self.assertEqual(
+            [[ok[0], ok[1]], [ok[2]], [ok[3], ok[4]]],
+            binary_submit_manual._split_ok_events(resp, events, keys, _key),
+        )
+
+        # some events rejected, duplicate children don't each get every event for their key
+        failures = [models_api.ResponsePostEventFailure(event="", error="bad")]
+        resp = models_api.ResponsePostEvent(total_ok=4, total_failures=1, failures=failures, ok=ok[1:])
+        self.assertEqual(
+            [[ok[1], ok[3]], [ok[2]], [ok[4]]],
+            binary_submit_manual._split_ok_events(resp, events, keys, _key),
+        )
@@ -0,0 +1,131 @@
+import ast
+import glob
+import os
+
+import azul_metastore
+from tests.support import unit_test
+
+PACKAGE = os.path.dirname(os.path.abspath(azul_metastore.__file__))
+
+# modules with async functions that are awaited by restapi routes
+CHECKED_MODULES = [
+    *glob.glob(os.path.join(PACKAGE, "restapi", "*.py")),
+    os.path.join(PACKAGE, "query", "binary2", "binary_submit.py"),
+]
+
+
+def _sync_functions(path: str) -> set[str]:
+    """Return the names of the sync functions defined at the top level of a module."""
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    return {x.name for x in tree.body if isinstance(x, ast.FunctionDef)}
+
+
+# sync functions of each query module, which query opensearch or dispatcher
+QUERY_SYNC_FUNCTIONS = {
+    os.path.splitext(os.path.basename(x))[0]: _sync_functions(x)
+    for x in glob.glob(os.path.join(PACKAGE, "query", "**", "*.py"), recursive=True)
+}
+
+# other functions that perform blocking network requests
+BLOCKING_CALLS = {
+    "_submit_binary_events",
+    "time.sleep",
+    "requests.get",
+    "requests.post",
+    "requests.head",
+    "httpx.get",
+    "httpx.post",
+    "httpx.head",
+}
+
+
+def _dotted(node: ast.expr) -> str:
+    """Return the dotted name for a call target, e.g. ctx.dispatcher.get_binary."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return f"{_dotted(node.value)}.{node.attr}"
+    return ""
+
+
+def _is_blocking(name: str) -> bool:
+    parts = name.split(".")
+    # dispatcher has async_ variants of its network calls
+    if len(parts) >= 2 and parts[-2] == "dispatcher" and not parts[-1].startswith("async_"):
+        return True
+    # opensearch is only queried synchronously, ctx.man.s is the settings
+    if "man" in parts[:-1] and parts[parts.index("man") + 1] != "s":
+        return True
+    if len(parts) >= 2 and parts[-1] in QUERY_SYNC_FUNCTIONS.get(parts[-2], ()):
+        return True
+    return any(name == x or name.endswith("." + x) for x in BLOCKING_CALLS)
+
+
+class _AsyncBlockingVisitor(ast.NodeVisitor):
+    """Find blocking calls made directly in the body of async functions."""
+
+    def __init__(self):
+        self.found: list[str] = []
+        self._in_async: list[bool] = []
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef):
+        self._in_async.append(True)
+        self.generic_visit(node)
+        self._in_async.pop()
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        # sync functions are run in a threadpool by fastapi or passed to asyncio.to_thread
+        self._in_async.append(False)
+        self.generic_visit(node)
+        self._in_async.pop()
+
+    def visit_Lambda(self, node: ast.Lambda):
+        self._in_async.append(False)
+        self.generic_visit(node)
+        self._in_async.pop()
+
+    def visit_Call(self, node: ast.Call):
+        name = _dotted(node.func)
+        if self._in_async and self._in_async[-1] and _is_blocking(name):
+            self.found.append(f"line {node.lineno}: {name}")
+        self.generic_visit(node)
+
+
+class TestBlockingIO(unit_test.BaseUnitTestCase):
+    def test_visitor(self):
+        tree = ast.parse(
+            "async def route(ctx):\n"
+            "    ctx.dispatcher.get_binary(1)\n"
+            "    await ctx.dispatcher.async_get_binary(1)\n"
+            "    await asyncio.to_thread(ctx.dispatcher.has_binary, 1)\n"
+            "    binary_read.verify_stream_exists(ctx, 1)\n"
+            "    ctx.man.binary2.w.search(ctx.sd, body={})\n"
+            "    ctx.man.s.log_to_loki(1)\n"
+            "    def inner():\n"
+            "        ctx.dispatcher.copy_binary(1)\n"
+            "def sync_route(ctx):\n"
+            "    ctx.dispatcher.get_binary(1)\n"
+        )
+        visitor = _AsyncBlockingVisitor()
+        visitor.visit(tree)
+        self.assertEqual(
+            [
+                "line 2: ctx.dispatcher.get_binary",
+                "line 5: binary_read.verify_stream_exists",
+                "line 6: ctx.man.binary2.w.search",
+            ],
+            visitor.found,
+        )
+
+    def test_no_blocking_calls_in_async_functions(self):
+        self.assertTrue(CHECKED_MODULES)
+        for path in CHECKED_MODULES:
+            with open(path) as f:
+                tree = ast.parse(f.read(), filename=path)
+            visitor = _AsyncBlockingVisitor()
+            visitor.visit(tree)
+            with self.subTest(module=os.path.relpath(path, PACKAGE)):
+                self.assertEqual(
+                    [], visitor.found, "blocking calls must be awaited via async_* or run with asyncio.to_thread"
+                )